@@ -0,0 +1,175 @@
+import asyncio
+import time
+from datetime import datetime
+from typing import Any, List, Optional, Union
+
+from scrapybara.anthropic import ToolResult
+
+from conversation import Conversation, ImageBlock
+from prefetch import Prefetcher
+from profiler import phase
+from progress_log import log_event
+from routing import Router
+from scheduler import get_scheduler
+from screenshots import get_archive
+
+MODEL = "claude-3-5-sonnet-20241022"
+BETAS = ["computer-use-2024-10-22"]
+
+
+class ToolCollection:
+    """A collection of anthropic-defined tools."""
+    def __init__(self, *tools):
+        self.tools = tools
+        self.tool_map = {tool.to_params()["name"]: tool for tool in tools}
+        # Held while a tool runs, so background work on the VM (sizing samples) waits for it
+        self.lock = asyncio.Lock()
+
+    def to_params(self) -> list:
+        return [tool.to_params() for tool in self.tools]
+
+    async def run(self, *, name: str, tool_input: dict[str, Any]) -> ToolResult:
+        tool = self.tool_map.get(name)
+        if not tool:
+            return None
+        async with self.lock:
+            try:
+                return await tool(**tool_input)
+            except Exception as e:
+                print(f"Error running tool {name}: {e}")
+                return None
+
+async def _warm(prefetcher: Prefetcher, tools: ToolCollection):
+    """Run the prefetcher's bash call under the tools lock, so it never interleaves with a tool's"""
+    async with tools.lock:
+        work = asyncio.ensure_future(asyncio.to_thread(prefetcher.warm))
+        try:
+            await asyncio.shield(work)
+        except asyncio.CancelledError:
+            # The bash call can't be interrupted; keep the VM's shell until it returns
+            await work
+            raise
+
+def current_date() -> str:
+    """Today's date as it appears in the system prompts, e.g. 'Monday, March 3, 2025'"""
+    today = datetime.today()
+    return f"{today:%A, %B} {today.day}, {today.year}"
+
+async def sampling_loop(
+    client,
+    *,
+    system_prompt: str,
+    tools: ToolCollection,
+    messages: Union[List[dict], Conversation],
+    screenshot_on_empty_bash: bool = False,
+    prefetcher: Optional[Prefetcher] = None,
+    router: Optional[Router] = None,
+) -> Conversation:
+    """Run the Claude <-> tools loop until the model stops calling tools"""
+    scheduler = get_scheduler()
+    conversation = messages if isinstance(messages, Conversation) else Conversation.from_messages(messages)
+    archive = get_archive()
+    router = router or Router.from_env(MODEL)
+    # Filled in per session rather than at import so long-lived processes stay current
+    system_prompt = system_prompt.format(current_date=current_date())
+    turn = 0
+
+    while True:
+        turn += 1
+
+        # Warm likely-next pages in the VM while the model is thinking
+        warming = asyncio.create_task(_warm(prefetcher, tools)) if prefetcher else None
+
+        with phase("build_payload", turn=turn):
+            payload = conversation.to_api()
+
+        # Get Claude's response
+        started = time.monotonic()
+        response = await router.create_message(
+            scheduler,
+            client,
+            turn=turn,
+            mid_run=len(conversation) > 1,
+            messages=payload,
+            system=[{"type": "text", "text": system_prompt}],
+            tools=tools.to_params(),
+            betas=BETAS,
+        )
+        duration = time.monotonic() - started
+        # The tool calls don't wait for warming that hasn't started; one already in the VM holds the lock until it returns
+        if warming and not warming.done():
+            warming.cancel()
+        usage = getattr(response, "usage", None)
+        log_event(
+            "model_call",
+            turn=turn,
+            duration=round(duration, 3),
+            input_tokens=getattr(usage, "input_tokens", None),
+            output_tokens=getattr(usage, "output_tokens", None),
+            images=len(conversation.blobs.blobs),
+            image_bytes=conversation.blobs.nbytes(),
+        )
+
+        # Process tool usage
+        tool_results = []
+        for content in response.content:
+            if content.type == "text":
+                print(f"\nAssistant: {content.text}")
+            elif content.type == "tool_use":
+                print(f"\nTool Use: {content.name}")
+                started = time.monotonic()
+                result = await tools.run(
+                    name=content.name,
+                    tool_input=content.input
+                )
+
+                # Handle empty bash results by taking a screenshot
+                if screenshot_on_empty_bash and content.name == "bash" and not result:
+                    result = await tools.run(
+                        name="computer",
+                        tool_input={"action": "screenshot"}
+                    )
+
+                duration = time.monotonic() - started
+                log_event(
+                    "tool",
+                    turn=turn,
+                    tool=content.name,
+                    action=content.input.get("action") if isinstance(content.input, dict) else None,
+                    duration=round(duration, 3),
+                    error=bool(result and result.error) or result is None,
+                )
+                router.observe_tool(content.name, content.input, result)
+                if prefetcher:
+                    prefetcher.observe(content.name, content.input, duration)
+
+                if result:
+                    with phase("tool_result", turn=turn, tool=content.name):
+                        tool_result = conversation.tool_result(result, content.id)
+                    tool_results.append(tool_result)
+
+                    if archive:
+                        for block in tool_result.content:
+                            if isinstance(block, ImageBlock):
+                                with phase("screenshot_archive", turn=turn):
+                                    path = await asyncio.to_thread(archive.save, conversation.blobs.get(block.blob_id))
+                                log_event("screenshot", turn=turn, tool=content.name, path=path)
+
+                    if result.output:
+                        print(f"Tool Output: {result.output}")
+                    if result.error:
+                        print(f"Tool Error: {result.error}")
+
+        # Add assistant's response and tool results to the conversation
+        conversation.add_assistant(response.content)
+
+        if tool_results:
+            conversation.add_tool_results(tool_results)
+        else:
+            # No more tools used - task complete
+            break
+
+    log_event("route_summary", **router.summary())
+    if prefetcher:
+        log_event("prefetch_summary", **prefetcher.summary())
+    return conversation
@@ -0,0 +1,337 @@
+import argparse
+import csv
+import importlib
+import json
+import math
+import os
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+from entities import Entity, resolve
+
+
+class Job(NamedTuple):
+    """How to turn one target dict into a call of a session function."""
+    module: str
+    function: str
+    key_field: str
+    required: tuple
+    build: Callable[[dict], dict]
+
+
+def _as_list(value) -> Optional[List[str]]:
+    # CSV cells hold lists as "a;b;c"
+    if isinstance(value, str):
+        return [v.strip() for v in value.split(";") if v.strip()]
+    return value or None
+
+
+JOBS: Dict[str, Job] = {
+    "sales": Job(
+        "sales_research", "analyze_competitor", "name", ("name",),
+        lambda t: {"competitor_name": t["name"], "industry": t.get("industry"), "notes": t.get("notes")},
+    ),
+    "compete": Job(
+        "competitive_intel", "analyze_competitor", "name", ("name", "website"),
+        lambda t: {
+            "competitor_name": t["name"],
+            "website": t["website"],
+            "focus_areas": _as_list(t.get("focus_areas")),
+            "previous_analysis_date": t.get("last_analysis") or None,
+        },
+    ),
+    "github": Job(
+        "github_analysis", "analyze_github_profile", "username", ("username", "context_id"),
+        lambda t: {"github_username": t["username"], "context_id": t["context_id"], "description": t.get("description")},
+    ),
+    "research": Job(
+        "market_research", "research_company", "name", ("name",),
+        lambda t: {"company_name": t["name"], "industry": t.get("industry"), "notes": t.get("notes")},
+    ),
+    "code": Job(
+        "code_execution", "coding_session", "task", ("task",),
+        lambda t: {"task": t["task"], "description": t.get("description")},
+    ),
+}
+
+
+def load_targets(path: str) -> List[dict]:
+    """Read targets from a .jsonl, .json or .csv file"""
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.endswith(".csv"):
+            return [dict(row) for row in csv.DictReader(f)]
+        if path.endswith(".json"):
+            return json.load(f)
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def validate_targets(job: str, targets: List[dict]) -> List[str]:
+    """Return a list of human-readable problems with the targets (empty if valid)"""
+    if job not in JOBS:
+        return [f"Unknown job '{job}', expected one of: {', '.join(JOBS)}"]
+    errors = []
+    seen = set()
+    for i, target in enumerate(targets):
+        if not isinstance(target, dict):
+            errors.append(f"Target {i}: expected an object, got {type(target).__name__}")
+            continue
+        missing = [field for field in JOBS[job].required if not target.get(field)]
+        if missing:
+            errors.append(f"Target {i}: missing {', '.join(missing)}")
+            continue
+        key = target_key(job, target)
+        if key in seen:
+            errors.append(f"Target {i}: duplicate '{key}'")
+        seen.add(key)
+    if all("duplicate" in e for e in errors):
+        # Near-duplicates only make sense to look for once every target has its key field
+        for entity in resolve_targets(job, targets):
+            for member in entity.members[1:]:
+                key = target_key(job, member)
+                if key != entity.key:
+                    errors.append(f"Target '{key}': duplicate of '{entity.key}', researched once ({'; '.join(entity.reasons)})")
+    return errors
+
+
+def target_key(job: str, target: dict) -> str:
+    return str(target[JOBS[job].key_field]).strip().lower()
+
+
+def resolve_targets(job: str, targets: List[dict], handles: Optional[Dict[str, str]] = None) -> List[Entity]:
+    """Group targets naming the same entity; coding tasks only by identical text"""
+    return resolve(targets, JOBS[job].key_field, handles=handles, normalize=job != "code")
+
+
+def _jsonable(value: Any) -> Any:
+    try:
+        json.dumps(value)
+        return value
+    except (TypeError, ValueError):
+        return repr(value)
+
+
+def worker_count(workers: int) -> int:
+    """Workers to start: at most SCRAPYBARA_MAX_INSTANCES, since each worker's scheduler needs a slot of its own"""
+    return max(1, min(workers, int(os.getenv("SCRAPYBARA_MAX_INSTANCES", 5))))
+
+
+async def _run_shard(job: str, shard_id: int, targets: List[dict], concurrency: int, retries: int, results):
+    import asyncio
+
+    from scheduler import get_scheduler
+
+    scheduler = get_scheduler()
+    spec = JOBS[job]
+    session = getattr(importlib.import_module(spec.module), spec.function)
+    limit = asyncio.Semaphore(concurrency)
+
+    async def run_target(target: dict):
+        async with limit:
+            record = {"key": target_key(job, target), "job": job, "target": target}
+            started = time.monotonic()
+            for attempt in range(1, retries + 2):
+                record["attempts"] = attempt
+                try:
+                    record["result"] = _jsonable(await session(**spec.build(target)))
+                    record["status"] = "ok"
+                    record.pop("error", None)
+                    break
+                except Exception as e:
+                    record["status"] = "error"
+                    record["error"] = f"{type(e).__name__}: {e}"
+                    if attempt <= retries:
+                        # Back off like throttled model calls, instead of hitting the same failure right away
+                        await scheduler.sleep(scheduler.backoff(attempt - 1, e))
+            record["duration"] = round(time.monotonic() - started, 3)
+            results.put(("record", shard_id, record))
+
+    from browser_pool import close_context_pool
+
+    try:
+        await asyncio.gather(*(run_target(t) for t in targets))
+    finally:
+        await close_context_pool()
+
+
+def _worker(job: str, shard_id: int, targets: List[dict], concurrency: int, retries: int, share: float, results):
+    """Process entry point: one event loop per shard, with its share of the rate limits and instance slots"""
+    import asyncio
+
+    from progress_log import forward_to, get_writer
+    from scheduler import RateLimitScheduler, set_scheduler
+
+    # The coordinator writes (and rotates) the progress log for every worker
+    forward_to(lambda records: results.put(("log", shard_id, records)))
+    set_scheduler(RateLimitScheduler.from_env(share=share))
+    asyncio.run(_run_shard(job, shard_id, targets, concurrency, retries, results))
+    # Flush queued events before reporting, so none arrive after the coordinator stops reading
+    get_writer().close()
+    results.put(("finished", shard_id, None))
+
+
+def run_batch(
+    job: str,
+    targets: List[dict],
+    workers: int = 4,
+    concurrency: int = 2,
+    shard_size: Optional[int] = None,
+    retries: int = 1,
+    max_shard_attempts: int = 3,
+    output: Optional[str] = None,
+    handles: Optional[Dict[str, str]] = None,
+) -> List[dict]:
+    """Shard targets across worker processes and merge their results.
+
+    Targets naming the same entity (see entities.py) run once; every alias
+    gets a copy of the result with `resolved_to` set to the key that ran.
+    A worker that dies before finishing its shard has the unfinished targets
+    reassigned to a new shard, up to `max_shard_attempts` times. There are at
+    most as many workers as instance slots, so their shares of the limit add
+    up to no more than it, and a failed target is retried after the
+    scheduler's backoff.
+    """
+    # Only the coordinator needs these; keep `validate` and `jobs` imports cheap
+    import multiprocessing as mp
+    import queue
+    from collections import deque
+
+    from progress_log import get_writer
+
+    entities = resolve_targets(job, targets, handles)
+    targets = [entity.target for entity in entities]
+    if not targets:
+        return []
+    if worker_count(workers) < workers:
+        print(f"Using {worker_count(workers)} workers instead of {workers}: each needs one of the "
+              f"SCRAPYBARA_MAX_INSTANCES={os.getenv('SCRAPYBARA_MAX_INSTANCES', 5)} instance slots")
+        workers = worker_count(workers)
+
+    shard_size = shard_size or max(1, math.ceil(len(targets) / (workers * 4)))
+    pending = deque(
+        {"id": n, "targets": targets[i:i + shard_size], "attempt": 1}
+        for n, i in enumerate(range(0, len(targets), shard_size))
+    )
+    next_id = len(pending)
+
+    ctx = mp.get_context("spawn")
+    results = ctx.Queue()
+    running = {}
+    records = {}
+    started = time.monotonic()
+
+    def handle(message):
+        kind, shard_id, record = message
+        if kind == "log":
+            writer = get_writer()
+            for event in record:
+                writer.put(event)
+        elif kind == "record":
+            if shard_id not in running:
+                return
+            records[record["key"]] = record
+            running[shard_id]["done"].add(record["key"])
+            elapsed = time.monotonic() - started
+            print(f"[{len(records)}/{len(targets)}] {record['status']:5} {record['key']} ({record['duration']}s, {elapsed:.0f}s elapsed)")
+        elif kind == "finished" and shard_id in running:
+            running[shard_id]["finished"] = True
+
+    while pending or running:
+        while pending and len(running) < workers:
+            shard = pending.popleft()
+            process = ctx.Process(
+                target=_worker,
+                args=(job, shard["id"], shard["targets"], concurrency, retries, 1 / workers, results),
+                daemon=True,
+            )
+            process.start()
+            running[shard["id"]] = {"process": process, "shard": shard, "done": set(), "finished": False}
+
+        try:
+            handle(results.get(timeout=0.5))
+        except queue.Empty:
+            pass
+
+        for shard_id, state in list(running.items()):
+            if state["finished"]:
+                state["process"].join()
+                del running[shard_id]
+            elif not state["process"].is_alive():
+                # Drain whatever the worker managed to send before dying
+                while True:
+                    try:
+                        handle(results.get_nowait())
+                    except queue.Empty:
+                        break
+                if state["finished"]:
+                    continue
+                del running[shard_id]
+                shard = state["shard"]
+                remaining = [t for t in shard["targets"] if target_key(job, t) not in state["done"]]
+                if not remaining:
+                    continue
+                exitcode = state["process"].exitcode
+                if shard["attempt"] >= max_shard_attempts:
+                    print(f"Shard {shard_id} crashed (exit code {exitcode}) {shard['attempt']} times, giving up on {len(remaining)} targets")
+                    for target in remaining:
+                        key = target_key(job, target)
+                        records[key] = {"key": key, "job": job, "target": target, "status": "crashed",
+                                        "attempts": shard["attempt"], "error": f"worker exit code {exitcode}"}
+                    continue
+                print(f"Shard {shard_id} crashed (exit code {exitcode}), reassigning {len(remaining)} targets as shard {next_id}")
+                pending.append({"id": next_id, "targets": remaining, "attempt": shard["attempt"] + 1})
+                next_id += 1
+
+    for entity in entities:
+        record = records.get(entity.key)
+        for member in entity.members[1:] if record else []:
+            key = target_key(job, member)
+            records.setdefault(key, dict(record, key=key, target=member, resolved_to=entity.key))
+    merged = [records[key] for key in sorted(records)]
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            for record in merged:
+                f.write(json.dumps(record) + "\n")
+    ok = sum(1 for r in merged if r["status"] == "ok")
+    aliases = f" ({len(merged) - len(targets)} of them aliases)" if len(merged) > len(targets) else ""
+    print(f"\nBatch complete: {ok}/{len(merged)} succeeded{aliases} in {time.monotonic() - started:.0f}s")
+    return merged
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a research job over a target file in parallel worker processes")
+    parser.add_argument("job", choices=sorted(JOBS))
+    parser.add_argument("targets", help="Target file (.jsonl, .json or .csv)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4)
+    parser.add_argument("--concurrency", type=int, default=2, help="Concurrent sessions per worker")
+    parser.add_argument("--shard-size", type=int)
+    parser.add_argument("--retries", type=int, default=1)
+    parser.add_argument("--output", default="batch_results.jsonl")
+    parser.add_argument("--handles", help="JSON object mapping company names to GitHub handles, for merging targets")
+    args = parser.parse_args(argv)
+
+    targets = load_targets(args.targets)
+    handles = None
+    if args.handles:
+        with open(args.handles, encoding="utf-8") as f:
+            handles = json.load(f)
+    errors = validate_targets(args.job, targets)
+    for error in errors:
+        print(error)
+    if any("duplicate" not in e for e in errors):
+        return 1
+
+    run_batch(
+        args.job,
+        targets,
+        workers=args.workers,
+        concurrency=args.concurrency,
+        shard_size=args.shard_size,
+        retries=args.retries,
+        output=args.output,
+        handles=handles,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,343 @@
+"""Authenticated browser contexts kept alive across sessions.
+
+`analyze_github_profile` used to start an instance and a browser and call
+`browser.authenticate(context_id=...)` for every profile, throwing away the
+GitHub cookies and cache each time. `ContextPool` keeps one started,
+authenticated instance per `context_id` instead. Sessions that share a
+context run back to back on it (one at a time, since they share the screen)
+without re-authenticating.
+
+What gets authenticated is the Chromium the agent drives, the one
+`macros.chromium()` talks to over its DevTools port, not the separate browser
+behind `instance.browser.start()`. The pool runs that Chromium with a profile
+directory of its own per context. Scrapybara's browser is only started long
+enough to authenticate; its cookies are then copied into the agent's Chromium
+over DevTools, and it is stopped again. Before every lease the instance is
+reset: the agent's Chromium is left with one blank tab (restarted on the
+context's profile if another one is running), and LibreOffice windows from
+the previous session are closed.
+
+A context is refreshed (re-authenticated) when it is older than `max_age`,
+when the previous session on it failed, or when a quick health check of the
+instance fails; in the last case the instance is replaced. Contexts idle for
+longer than `idle_timeout` are stopped by a background reaper on each event
+loop that uses the pool, and so is the least recently used idle context when
+a new one needs an instance and every instance slot is taken. An entry made
+on an event loop that is no longer the current one (the daemon runs each
+command on its own loop) is stopped when it is replaced, or, if a session on
+the old loop is still using it, as soon as that session ends. `close()` stops
+everything and must run before the process exits. The CLI, the batch runner
+and the daemon do this.
+"""
+import asyncio
+import json
+import os
+import re
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+from macros import CHROMIUM_DEBUG_PORT, chromium_command
+from progress_log import log_event
+from scheduler import get_scheduler
+
+MAX_AGE = float(os.getenv("SCRAPYBARA_CONTEXT_MAX_AGE", 30 * 60))
+IDLE_TIMEOUT = float(os.getenv("SCRAPYBARA_CONTEXT_IDLE_TIMEOUT", 10 * 60))
+
+# Run in the VM after wait_for.DEVTOOLS_CLIENT and `PORT = ...`, `PROFILE = ...`, `START = ...` lines.
+# Leaves the agent's Chromium running on the context's profile with a single blank tab.
+RESET_SCRIPT = r'''
+import signal, subprocess, time
+
+def processes(*names):
+    """pid -> argv of the processes whose program is one of `names` (never this script's own shell)"""
+    found = {}
+    for pid in filter(str.isdigit, os.listdir("/proc")):
+        try:
+            with open(f"/proc/{pid}/cmdline", "rb") as f:
+                argv = [arg.decode(errors="replace") for arg in f.read().split(b"\0") if arg]
+        except OSError:
+            continue
+        if argv and os.path.basename(argv[0]) in names:
+            found[int(pid)] = argv
+    return found
+
+def kill(pids):
+    for pid in pids:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except OSError:
+            pass
+
+kill(processes("soffice", "soffice.bin"))
+browsers = processes("chromium", "chromium-browser", "chrome")
+restarted = not any(f"--user-data-dir={PROFILE}" in argv for argv in browsers.values())
+if restarted:
+    # Another session's or another context's browser; its profile must not leak into this one
+    kill(browsers)
+    time.sleep(1)
+    subprocess.Popen(START, shell=True)
+deadline = time.monotonic() + 20
+while True:
+    try:
+        pages = devtools_pages(PORT)
+        break
+    except OSError:
+        if time.monotonic() > deadline:
+            raise
+        time.sleep(0.25)
+request = urllib.request.Request(f"http://127.0.0.1:{PORT}/json/new?about:blank", method="PUT")
+urllib.request.urlopen(request, timeout=5).close()
+for page in pages:
+    urllib.request.urlopen(f"http://127.0.0.1:{PORT}/json/close/{page['id']}", timeout=5).close()
+print(json.dumps({"restarted": restarted, "closed": len(pages)}))
+'''
+
+# Run in the VM after wait_for.DEVTOOLS_CLIENT and `PORT = ...`, `SOURCE = ...` lines: copies the cookies of
+# Scrapybara's authenticated browser (DevTools at SOURCE) into the agent's Chromium
+COOKIES_SCRIPT = r'''
+FIELDS = {"name", "value", "domain", "path", "secure", "httpOnly", "sameSite", "expires", "priority"}
+cookies = (devtools(SOURCE, "Storage.getCookies") or {}).get("cookies", [])
+cookies = [{k: v for k, v in c.items() if k in FIELDS and not (k == "expires" and v < 0)} for c in cookies]
+with urllib.request.urlopen(f"http://127.0.0.1:{PORT}/json/version", timeout=5) as response:
+    target = json.load(response)["webSocketDebuggerUrl"]
+if devtools(target, "Storage.setCookies", {"cookies": cookies}) is None:
+    raise RuntimeError("the agent's Chromium refused the cookies")
+print(json.dumps({"cookies": len(cookies)}))
+'''
+
+
+def profile_dir(context_id: str) -> str:
+    """The agent's Chromium profile for `context_id` on a pooled instance"""
+    return f"/root/.config/chromium-contexts/{re.sub(r'[^A-Za-z0-9_.-]+', '-', context_id)}"
+
+
+async def _run_script(instance, marker: str, script: str, **values) -> dict:
+    """Run one of the scripts above in the VM; its JSON result"""
+    from wait_for import DEVTOOLS_CLIENT
+
+    header = "".join(f"{name} = {value!r}\n" for name, value in values.items())
+    command = f"timeout 60 python3 - <<'{marker}'\n{DEVTOOLS_CLIENT}\n{header}{script}\n{marker}"
+    response = await asyncio.to_thread(instance.bash, command=command)
+    output = (response.get("output") if isinstance(response, dict) else getattr(response, "output", None)) or ""
+    lines = output.strip().splitlines()
+    try:
+        return json.loads(lines[-1])
+    except (IndexError, ValueError):
+        raise RuntimeError(" ".join(lines)[-200:] or "no output") from None
+
+
+class PooledContext:
+    def __init__(self, context_id: str, instance_type: str):
+        self.context_id = context_id
+        self.instance_type = instance_type
+        self.instance = None
+        self.profile = profile_dir(context_id)
+        self.authenticated_at = 0.0
+        self.last_used = 0.0
+        self.uses = 0
+        self.stale = False
+        # Replaced by an entry for another event loop; stop the instance once the session on it ends
+        self.replaced = False
+        self.lock = asyncio.Lock()
+        self.loop = asyncio.get_running_loop()
+
+
+class ContextPool:
+    def __init__(self, max_age: float = MAX_AGE, idle_timeout: float = IDLE_TIMEOUT):
+        self.max_age = max_age
+        self.idle_timeout = idle_timeout
+        self.contexts: Dict[str, PooledContext] = {}
+        self.stats = {"reused": 0, "authenticated": 0, "started": 0, "replaced": 0, "evicted": 0, "reset": 0}
+        # Contexts waiting in `start_instance` for a free slot
+        self.waiting = 0
+        self.reap_interval = min(60.0, idle_timeout / 2)
+        # One reaper task per event loop that has used the pool
+        self.reapers: Dict[asyncio.AbstractEventLoop, asyncio.Task] = {}
+
+    async def _healthy(self, entry: PooledContext) -> bool:
+        try:
+            await asyncio.to_thread(entry.instance.bash, command="true")
+            return True
+        except Exception as e:
+            print(f"Pooled instance {entry.instance.id} for {entry.context_id} failed its health check: {e}")
+            return False
+
+    async def _make_room(self, keep: Optional[str] = None):
+        """Stop the least recently used idle context if every instance slot is taken"""
+        if not get_scheduler().at_capacity():
+            return
+        idle = [entry for context_id, entry in self.contexts.items()
+                if context_id != keep and entry.instance and not entry.lock.locked()]
+        if idle:
+            entry = min(idle, key=lambda e: e.last_used)
+            print(f"Stopping idle context {entry.context_id} to free an instance slot")
+            del self.contexts[entry.context_id]
+            self.stats["evicted"] += 1
+            await self._stop(entry)
+
+    async def _start(self, client, entry: PooledContext):
+        self.waiting += 1
+        try:
+            # Idle pooled instances hold slots too; without this, new contexts would wait on them forever
+            await self._make_room(keep=entry.context_id)
+            instance = await get_scheduler().start_instance(client, instance_type=entry.instance_type)
+        finally:
+            self.waiting -= 1
+        entry.instance = instance
+        entry.authenticated_at = 0.0
+        self.stats["started"] += 1
+        print(f"Started pooled instance {instance.id} for context {entry.context_id}")
+
+    async def _reset(self, entry: PooledContext):
+        """Give the lease a clean screen: the context's Chromium with one blank tab, nothing else open"""
+        result = await _run_script(entry.instance, "CONTEXT_RESET_EOF", RESET_SCRIPT, PORT=CHROMIUM_DEBUG_PORT,
+                                   PROFILE=entry.profile, START=chromium_command(profile=entry.profile))
+        self.stats["reset"] += 1
+        if result.get("restarted"):
+            # A fresh browser process on this profile; cookies copied into the old one are not guaranteed
+            entry.authenticated_at = 0.0
+
+    async def _authenticate(self, entry: PooledContext) -> int:
+        """Authenticate the context in Scrapybara's browser and copy its cookies into the agent's Chromium"""
+        instance = entry.instance
+        started = await asyncio.to_thread(instance.browser.start)
+        try:
+            await asyncio.to_thread(instance.browser.authenticate, context_id=entry.context_id)
+            result = await _run_script(instance, "CONTEXT_COOKIES_EOF", COOKIES_SCRIPT, PORT=CHROMIUM_DEBUG_PORT,
+                                       SOURCE=getattr(started, "cdp_url", started))
+        finally:
+            # Only the agent's Chromium stays on the screen
+            await asyncio.to_thread(instance.browser.stop)
+        return result["cookies"]
+
+    async def _stop(self, entry: PooledContext):
+        instance, entry.instance = entry.instance, None
+        if instance is not None:
+            try:
+                await get_scheduler().stop_instance(instance)
+            except Exception as e:
+                print(f"Could not stop pooled instance {instance.id}: {e}")
+
+    async def _reap_idle(self, keep: Optional[str] = None):
+        now = time.monotonic()
+        loop = asyncio.get_running_loop()
+        for context_id, entry in list(self.contexts.items()):
+            # Entries of other loops are left to those loops' reapers
+            if (context_id != keep and entry.loop is loop and entry.instance and not entry.lock.locked()
+                    and now - entry.last_used > self.idle_timeout):
+                print(f"Stopping idle context {context_id}")
+                del self.contexts[context_id]
+                await self._stop(entry)
+
+    async def _reaper(self):
+        """Stop idle contexts even when no new session comes along to notice them"""
+        while True:
+            await asyncio.sleep(self.reap_interval)
+            try:
+                await self._reap_idle()
+            except Exception as e:
+                print(f"Context reaper failed: {e}")
+
+    def _ensure_reaper(self):
+        loop = asyncio.get_running_loop()
+        for other in [other for other, task in self.reapers.items() if task.done() or other.is_closed()]:
+            del self.reapers[other]
+        if loop not in self.reapers:
+            self.reapers[loop] = loop.create_task(self._reaper())
+
+    async def _replace(self, entry: PooledContext):
+        """Drop an entry created on another event loop, stopping its instance unless it's in use"""
+        entry.replaced = True
+        if not entry.lock.locked():
+            await self._stop(entry)
+
+    @asynccontextmanager
+    async def context(self, client, context_id: str, instance_type: str = "medium"):
+        """Yield an instance whose agent Chromium is reset and authenticated for `context_id`"""
+        self._ensure_reaper()
+        await self._reap_idle(keep=context_id)
+        entry = self.contexts.get(context_id)
+        if entry is not None and entry.loop is not asyncio.get_running_loop():
+            # Its lock belongs to the old loop, but its instance still holds a slot
+            await self._replace(entry)
+            entry = None
+        if entry is None:
+            entry = self.contexts[context_id] = PooledContext(context_id, instance_type)
+
+        try:
+            async with entry.lock:
+                started = time.monotonic()
+                reused = entry.instance is not None
+                if reused and not await self._healthy(entry):
+                    await self._stop(entry)
+                    self.stats["replaced"] += 1
+                    reused = False
+                if entry.instance is None:
+                    await self._start(client, entry)
+
+                age = time.monotonic() - entry.authenticated_at
+                cookies = None
+                try:
+                    await self._reset(entry)
+                    if not entry.authenticated_at or entry.stale or age > self.max_age:
+                        reason = "new" if not entry.authenticated_at else ("after failure" if entry.stale else "expired")
+                        cookies = await self._authenticate(entry)
+                        entry.authenticated_at = time.monotonic()
+                        entry.stale = False
+                        self.stats["authenticated"] += 1
+                        print(f"Authenticated context {context_id} ({reason}, {cookies} cookies)")
+                except BaseException:
+                    entry.stale = True
+                    raise
+                if cookies is None:
+                    self.stats["reused"] += 1
+                    print(f"Reusing authenticated context {context_id} on {entry.instance.id}")
+                log_event("browser_context", context=context_id, instance=entry.instance.id, reused=reused,
+                          cookies=cookies, duration=round(time.monotonic() - started, 3))
+
+                entry.uses += 1
+                try:
+                    yield entry.instance
+                except BaseException:
+                    # Don't trust the browser state a failed session left behind
+                    entry.stale = True
+                    raise
+                finally:
+                    entry.last_used = time.monotonic()
+        finally:
+            if entry.replaced:
+                await self._stop(entry)
+            # A context that just went idle may be holding the slot another one is waiting for
+            if self.waiting:
+                await self._make_room()
+
+    def invalidate(self, context_id: str):
+        """Force re-authentication the next time `context_id` is used"""
+        if context_id in self.contexts:
+            self.contexts[context_id].stale = True
+
+    async def close(self):
+        for loop, task in list(self.reapers.items()):
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(task.cancel)
+        self.reapers.clear()
+        for entry in list(self.contexts.values()):
+            await self._stop(entry)
+        self.contexts.clear()
+
+
+_pool: Optional[ContextPool] = None
+
+
+def get_context_pool() -> ContextPool:
+    global _pool
+    if _pool is None:
+        _pool = ContextPool()
+    return _pool
+
+
+async def close_context_pool():
+    """Stop every pooled instance (call before the event loop ends)"""
+    if _pool is not None:
+        await _pool.close()
@@ -0,0 +1,307 @@
+"""Memoized code_execution cells, cached on local disk.
+
+In coding sessions the model often re-runs cells it has already run: the
+same benchmark after an edit to an unrelated file, or the setup cells after a
+kernel restart. Each re-run is a full `instance.code.execute` round trip.
+With SCRAPYBARA_CELL_CACHE=1 the code_execution tool lets the model mark a
+cell (the `cache` input, or a `# pure` / `# deterministic` first line):
+
+- pure: its output depends only on the code, its input files and the kernel
+  state, and it changes no state that later cells use
+- deterministic: same output for the same code, inputs and kernel state, but
+  it may define state (imports, loading data)
+
+A marked cell is keyed by a hash of the code, the contents of its input files
+(the `inputs` the model lists, plus quoted file paths found in the code) and
+the kernel lineage. The lineage is a hash chain of the state-changing cells
+the kernel has run since it started. A hit returns the stored output without
+executing anything. A deterministic hit still moves the lineage forward, and
+the skipped cell is replayed silently before the next cell that really runs,
+so the kernel has the state the model expects. Unmarked cells always run and
+move the lineage forward; pure cells never move it.
+
+A kernel restart starts a new lineage and drops pending replays. A restart is
+an error from the VM saying the kernel died or restarted, or a cell that
+exits or resets the kernel. A failure that leaves the kernel state unknown
+starts a lineage nothing is cached under. The local sandbox runs every cell
+in a fresh namespace, so its lineage never moves.
+
+Entries are JSON files under SCRAPYBARA_CELL_CACHE_DIR (default .cell_cache).
+The least recently used are evicted beyond SCRAPYBARA_CELL_CACHE_MAX entries
+or SCRAPYBARA_CELL_CACHE_MB megabytes.
+
+    python cell_cache.py stats|clear
+    python cell_cache.py bench    # a slow pure cell run repeatedly in the local sandbox, with and without the cache
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import re
+import shlex
+import sys
+import tempfile
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from progress_log import log_event
+
+ENABLED = os.getenv("SCRAPYBARA_CELL_CACHE", "0").lower() in ("1", "true", "yes", "on")
+ROOT = os.getenv("SCRAPYBARA_CELL_CACHE_DIR", ".cell_cache")
+MAX_ENTRIES = int(os.getenv("SCRAPYBARA_CELL_CACHE_MAX", 1000))
+MAX_MB = float(os.getenv("SCRAPYBARA_CELL_CACHE_MB", 200))
+
+MARKS = ("pure", "deterministic")
+MARKER_RE = re.compile(r"^\s*#\s*(pure|deterministic)\b", re.IGNORECASE)
+FILE_RE = re.compile(
+    r"""(['"])([^'"\n]{1,200}\.(?:csv|tsv|json|jsonl|txt|xlsx|xls|parquet|feather|pkl|pickle|npy|npz|h5|hdf5|"""
+    r"""sqlite|db|py|yaml|yml|xml|html|md))\1""",
+    re.IGNORECASE,
+)
+RESTART_CODE_RE = re.compile(r"os\._exit\(|sys\.exit\(|%reset\b|do_shutdown\(|restart_kernel\(")
+RESTART_ERROR_RE = re.compile(r"kernel (died|restart|is dead|was restarted)|restarting kernel|DeadKernelError", re.IGNORECASE)
+
+
+def cell_mark(code: str, declared: Optional[str] = None) -> Optional[str]:
+    """"pure", "deterministic" or None, from the tool input or a marker comment on the first line"""
+    if declared in MARKS:
+        return declared
+    match = MARKER_RE.match(code)
+    return match.group(1).lower() if match else None
+
+
+def referenced_files(code: str) -> List[str]:
+    """Quoted paths with a data or source file extension, e.g. pd.read_csv("data/sales.csv")"""
+    return list(dict.fromkeys(match.group(2) for match in FILE_RE.finditer(code)))
+
+
+def cell_key(code: str, digests: Dict[str, str], lineage: str) -> str:
+    payload = json.dumps({"code": code, "inputs": sorted(digests.items()), "lineage": lineage})
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def extend_lineage(lineage: str, code: str) -> str:
+    return hashlib.sha256(f"{lineage}\n{code}".encode()).hexdigest()
+
+
+def local_digests(paths: List[str], cwd: str = ".") -> Dict[str, str]:
+    """sha256 of each file's contents, "missing" for files that don't exist"""
+    digests = {}
+    for path in paths:
+        digest = hashlib.sha256()
+        try:
+            with open(os.path.join(cwd, os.path.expanduser(path)), "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(block)
+            digests[path] = digest.hexdigest()
+        except OSError:
+            digests[path] = "missing"
+    return digests
+
+
+def vm_digests(instance, paths: List[str]) -> Dict[str, str]:
+    """The same, computed in the VM with one bash call"""
+    command = "cd ~ && sha256sum -- " + " ".join(shlex.quote(p) for p in paths) + " 2>/dev/null"
+    response = instance.bash(command=command)
+    output = response.get("output") if isinstance(response, dict) else getattr(response, "output", None)
+    found = {}
+    for line in (output or "").splitlines():
+        digest, _, path = line.partition("  ")
+        found[path.strip()] = digest
+    return {path: found.get(path, "missing") for path in paths}
+
+
+class CellCache:
+    """Bounded LRU of cell results: one JSON file per key, recency kept in the file's mtime"""
+
+    def __init__(self, directory: str = ROOT, max_entries: int = MAX_ENTRIES, max_mb: float = MAX_MB):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "evicted": 0}
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key: str) -> Optional[dict]:
+        path = self._path(key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                entry = json.load(f)
+            os.utime(path)
+        except (OSError, ValueError):
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        return entry
+
+    def put(self, key: str, entry: dict):
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(entry, f)
+        os.replace(tmp, self._path(key))
+        self.stats["stores"] += 1
+        self._evict()
+
+    def entries(self) -> List[os.DirEntry]:
+        return [e for e in os.scandir(self.directory) if e.name.endswith(".json")]
+
+    def _evict(self):
+        entries = sorted(self.entries(), key=lambda e: e.stat().st_mtime)
+        total = sum(e.stat().st_size for e in entries)
+        while entries and (len(entries) > self.max_entries or total > self.max_bytes):
+            oldest = entries.pop(0)
+            total -= oldest.stat().st_size
+            try:
+                os.remove(oldest.path)
+                self.stats["evicted"] += 1
+            except OSError:
+                pass
+
+    def clear(self) -> int:
+        removed = 0
+        for entry in self.entries():
+            os.remove(entry.path)
+            removed += 1
+        return removed
+
+
+_cache: Optional[CellCache] = None
+
+
+def get_cell_cache() -> Optional[CellCache]:
+    """The shared cache, or None unless SCRAPYBARA_CELL_CACHE is set"""
+    global _cache
+    if ENABLED and _cache is None:
+        _cache = CellCache()
+    return _cache if ENABLED else None
+
+
+# (output, error) of one real execution
+Execute = Callable[[str, int], Awaitable[Tuple[str, Optional[str]]]]
+
+
+class MemoizedCells:
+    """One session's view of the cache: the kernel lineage and the cells waiting to be replayed"""
+
+    def __init__(self, cache: CellCache, kernel: str, stateful: bool,
+                 digests: Callable[[List[str]], Dict[str, str]]):
+        self.cache = cache
+        self.stateful = stateful
+        self.digests = digests
+        self.root = hashlib.sha256(kernel.encode()).hexdigest()
+        self.lineage = self.root
+        self.pending: List[str] = []
+
+    def restart(self, known_fresh: bool = True):
+        """The kernel restarted (or is in an unknown state): start over and forget pending replays"""
+        self.lineage = self.root if known_fresh else uuid.uuid4().hex
+        self.pending = []
+        log_event("cell_cache", action="restart", fresh=known_fresh)
+
+    async def _replay(self, execute: Execute, timeout: int) -> Optional[str]:
+        if not self.pending:
+            return None
+        cells, self.pending = self.pending, []
+        try:
+            _, error = await execute("\n\n".join(cells), timeout * len(cells))
+        except Exception as e:
+            error = str(e)
+        if error:
+            self.restart(known_fresh=False)
+            return f"Re-running {len(cells)} earlier cached cell(s) to restore kernel state failed: {error}"
+        return None
+
+    async def run(self, code: str, timeout: int, execute: Execute, mark: Optional[str] = None,
+                  inputs: Optional[List[str]] = None) -> Tuple[str, Optional[str]]:
+        mark = cell_mark(code, mark)
+        key = None
+        if mark:
+            paths = list(dict.fromkeys(list(inputs or []) + referenced_files(code)))
+            digests = await asyncio.to_thread(self.digests, paths) if paths else {}
+            key = cell_key(code, digests, self.lineage)
+            entry = await asyncio.to_thread(self.cache.get, key)
+            if entry is not None:
+                if mark == "deterministic" and self.stateful:
+                    self.pending.append(code)
+                    self.lineage = extend_lineage(self.lineage, code)
+                log_event("cell_cache", action="hit", mark=mark, saved=entry.get("duration"))
+                return f"(cached output of an identical earlier run)\n{entry['output']}", None
+
+        replay_error = await self._replay(execute, timeout)
+        if replay_error:
+            return "", replay_error
+        started = time.monotonic()
+        try:
+            output, error = await execute(code, timeout)
+        except Exception:
+            self.restart(known_fresh=False)
+            raise
+        duration = round(time.monotonic() - started, 3)
+
+        if RESTART_CODE_RE.search(code) or (error and RESTART_ERROR_RE.search(error)):
+            self.restart()
+            return output, error
+        if self.stateful and mark != "pure":
+            self.lineage = extend_lineage(self.lineage, code)
+        if key and not error:
+            # Stored under the lineage the cell started from, which is what a later lookup sees
+            await asyncio.to_thread(self.cache.put, key, {"output": output, "duration": duration, "mark": mark})
+            log_event("cell_cache", action="store", mark=mark, duration=duration)
+        return output, error
+
+
+def _bench(runs: int = 10):
+    from sandbox import LocalSession, get_sandbox, session_dir
+
+    code = "# pure\ntotal = sum(i * i for i in range(3_000_000))\nprint(total)"
+    workdir = session_dir("cell-cache-bench")
+    backend = LocalSession(get_sandbox(), workdir)
+
+    async def execute(cell: str, timeout: int):
+        response = await backend.execute(cell, timeout)
+        return "".join(o.get("text", "") for o in response["outputs"]), response["error"]
+
+    async def session(memo: Optional[MemoizedCells]) -> float:
+        started = time.perf_counter()
+        for _ in range(runs):
+            if memo:
+                await memo.run(code, 30, execute)
+            else:
+                await execute(code, 30)
+        return time.perf_counter() - started
+
+    plain = asyncio.run(session(None))
+    print(f"without cache: {runs} runs in {plain:.2f}s ({plain / runs * 1000:.0f} ms/run)")
+    with tempfile.TemporaryDirectory() as directory:
+        cache = CellCache(directory)
+        memo = MemoizedCells(cache, "local", False, lambda paths: local_digests(paths, workdir))
+        cached = asyncio.run(session(memo))
+        print(f"with cache:    {runs} runs in {cached:.2f}s ({cached / runs * 1000:.0f} ms/run), {cache.stats}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Inspect or clear the code cell cache")
+    parser.add_argument("command", choices=["stats", "clear", "bench"])
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    if args.command == "bench":
+        _bench(args.runs)
+        return 0
+    cache = CellCache()
+    if args.command == "clear":
+        print(f"Removed {cache.clear()} cached cells from {cache.directory}")
+        return 0
+    entries = cache.entries()
+    size = sum(e.stat().st_size for e in entries)
+    print(f"{len(entries)} cached cells, {size / 1024 / 1024:.1f} MB in {cache.directory} "
+          f"(limit {cache.max_entries} cells, {cache.max_bytes / 1024 / 1024:.0f} MB); enabled: {ENABLED}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,270 @@
+"""Single entry point for the research scripts.
+
+Only argparse is imported up front. The Anthropic and Scrapybara SDKs are
+pulled in by the script module a subcommand runs, so cheap subcommands like
+`jobs` and `validate` never pay for them. The same parser backs the daemon in
+daemon.py, which runs these subcommands in-process with warm clients.
+"""
+import argparse
+import sys
+
+
+async def _run_session(job: str, target: dict) -> int:
+    import importlib
+
+    from batch_runner import JOBS
+
+    spec = JOBS[job]
+    session = getattr(importlib.import_module(spec.module), spec.function)
+    await session(**spec.build(target))
+    return 0
+
+
+def cmd_research(args) -> int:
+    return _run_session("research", {"name": args.name, "industry": args.industry, "notes": args.notes})
+
+
+def cmd_sales(args) -> int:
+    return _run_session("sales", {"name": args.name, "industry": args.industry, "notes": args.notes})
+
+
+def cmd_compete(args) -> int:
+    return _run_session("compete", {
+        "name": args.name,
+        "website": args.website,
+        "focus_areas": args.focus,
+        "last_analysis": args.last_analysis,
+    })
+
+
+def cmd_github(args) -> int:
+    return _run_session("github", {
+        "username": args.username,
+        "context_id": args.context_id or f"{args.username}-analysis",
+        "description": args.description,
+    })
+
+
+def cmd_code(args) -> int:
+    return _run_session("code", {"task": args.task, "description": args.description})
+
+
+def cmd_scrape(args) -> int:
+    if args.output and not args.paginate:
+        print("--output needs --paginate (only the paginated scrape streams companies to a file)")
+        return 1
+    import scrapy
+
+    scrapy.main(batch=args.batch, limit=args.contacts, paginate=args.paginate, output=args.output,
+                contacts_output=args.contacts_output)
+    return 0
+
+
+def cmd_batch(args) -> int:
+    import batch_runner
+
+    argv = [args.job, args.targets, "--concurrency", str(args.concurrency), "--retries", str(args.retries), "--output", args.output]
+    if args.workers:
+        argv += ["--workers", str(args.workers)]
+    return batch_runner.main(argv)
+
+
+def cmd_validate(args) -> int:
+    from batch_runner import load_targets, validate_targets
+
+    try:
+        targets = load_targets(args.targets)
+    except (OSError, ValueError) as e:
+        print(f"Could not read {args.targets}: {e}")
+        return 1
+    errors = validate_targets(args.job, targets)
+    for error in errors:
+        print(error)
+    print(f"{len(targets)} targets, {len(errors)} problems")
+    return 1 if errors else 0
+
+
+def cmd_shell(args) -> int:
+    import daemon
+
+    return daemon.repl(warm=args.warm)
+
+
+def cmd_logs(args) -> int:
+    import progress_log
+
+    try:
+        progress_log.tail(args.path or progress_log.LOG_PATH, follow=args.follow)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def cmd_profile(args) -> int:
+    import profiler
+
+    argv = ["--top", str(args.top)]
+    for flag in ("path", "session", "job", "target", "trace"):
+        if getattr(args, flag):
+            argv += [f"--{flag}", getattr(args, flag)]
+    return profiler.main(argv)
+
+
+def cmd_reports(args) -> int:
+    import reports
+
+    argv = ["render"]
+    for flag in ("root", "job"):
+        if getattr(args, flag):
+            argv += [f"--{flag}", getattr(args, flag)]
+    return reports.main(argv)
+
+
+def cmd_sizing(args) -> int:
+    import sizing
+
+    return sizing.main(["report"] + (["--path", args.path] if args.path else []))
+
+
+def cmd_cells(args) -> int:
+    import cell_cache
+
+    return cell_cache.main([args.action])
+
+
+def cmd_summarize(args) -> int:
+    import postprocess
+
+    return postprocess.main(args.rest)
+
+
+def cmd_jobs(args) -> int:
+    from batch_runner import JOBS
+
+    for name, spec in sorted(JOBS.items()):
+        print(f"{name:10} {spec.module}.{spec.function}  (requires: {', '.join(spec.required)})")
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="scrapybara-cli", description="Scrapybara research agents")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("research", help="Market research on a company")
+    p.add_argument("name")
+    p.add_argument("--industry")
+    p.add_argument("--notes")
+    p.set_defaults(func=cmd_research)
+
+    p = sub.add_parser("sales", help="Sales research on a company")
+    p.add_argument("name")
+    p.add_argument("--industry")
+    p.add_argument("--notes")
+    p.set_defaults(func=cmd_sales)
+
+    p = sub.add_parser("compete", help="Competitive analysis of a competitor")
+    p.add_argument("name")
+    p.add_argument("website")
+    p.add_argument("--focus", action="append", help="Focus area (repeatable)")
+    p.add_argument("--last-analysis", help="Date of the previous analysis (YYYY-MM-DD)")
+    p.set_defaults(func=cmd_compete)
+
+    p = sub.add_parser("github", help="Analyze a GitHub profile")
+    p.add_argument("username")
+    p.add_argument("--context-id", help="Browser auth context (default: <username>-analysis)")
+    p.add_argument("--description")
+    p.set_defaults(func=cmd_github)
+
+    p = sub.add_parser("code", help="Coding assistance session")
+    p.add_argument("task")
+    p.add_argument("--description")
+    p.set_defaults(func=cmd_code)
+
+    p = sub.add_parser("scrape", help="Scrape YC companies and their contact info")
+    p.add_argument("--batch", default="W25")
+    p.add_argument("--contacts", type=int, default=3, help="How many companies to find contacts for")
+    p.add_argument("--paginate", action="store_true",
+                   help="Scrape one industry filter and name range at a time, validating each chunk")
+    p.add_argument("--output", help="With --paginate: stream validated companies to this JSONL file (resumable)")
+    p.add_argument("--contacts-output", help="Write companies with their contact info to this JSONL file")
+    p.set_defaults(func=cmd_scrape)
+
+    p = sub.add_parser("batch", help="Run a job over a target file in worker processes")
+    p.add_argument("job")
+    p.add_argument("targets")
+    p.add_argument("--workers", type=int)
+    p.add_argument("--concurrency", type=int, default=2)
+    p.add_argument("--retries", type=int, default=1)
+    p.add_argument("--output", default="batch_results.jsonl")
+    p.set_defaults(func=cmd_batch)
+
+    p = sub.add_parser("validate", help="Check a target file without running anything")
+    p.add_argument("job")
+    p.add_argument("targets")
+    p.set_defaults(func=cmd_validate)
+
+    p = sub.add_parser("shell", help="Interactive shell backed by the warm-client daemon")
+    p.add_argument("--warm", metavar="INSTANCE_TYPE", help="Keep one instance of this type started")
+    p.set_defaults(func=cmd_shell)
+
+    p = sub.add_parser("logs", help="Sessions from scrapybara_progress.log, grouped")
+    p.add_argument("-f", "--follow", action="store_true")
+    p.add_argument("--path")
+    p.set_defaults(func=cmd_logs)
+
+    p = sub.add_parser("profile", help="Where recorded sessions spent their time and tokens")
+    p.add_argument("--path")
+    p.add_argument("--session")
+    p.add_argument("--job")
+    p.add_argument("--target")
+    p.add_argument("--top", type=int, default=10)
+    p.add_argument("--trace", help="Write a Chrome trace / speedscope JSON file")
+    p.set_defaults(func=cmd_profile)
+
+    p = sub.add_parser("reports", help="Re-render submitted findings as .docx/.xlsx/.md and index them")
+    p.add_argument("--root")
+    p.add_argument("--job")
+    p.set_defaults(func=cmd_reports)
+
+    p = sub.add_parser("sizing", help="Measured instance usage and cost per job and size")
+    p.add_argument("--path")
+    p.set_defaults(func=cmd_sizing)
+
+    p = sub.add_parser("cells", help="Show or clear the cache of code_execution cells (SCRAPYBARA_CELL_CACHE)")
+    p.add_argument("action", nargs="?", choices=["stats", "clear"], default="stats")
+    p.set_defaults(func=cmd_cells)
+
+    p = sub.add_parser("summarize", help="Cross-target landscape or ranking from finished sessions, in batched requests")
+    p.add_argument("rest", nargs=argparse.REMAINDER, help="landscape|rank ... (see postprocess.py --help)")
+    p.set_defaults(func=cmd_summarize)
+
+    p = sub.add_parser("jobs", help="List job types")
+    p.set_defaults(func=cmd_jobs)
+
+    parser.commands = sorted(sub.choices)
+    return parser
+
+
+async def _finish(session):
+    """Await a session, then stop any instances it left pooled"""
+    from browser_pool import close_context_pool
+
+    try:
+        return await session
+    finally:
+        await close_context_pool()
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    result = args.func(args)
+    # Session subcommands return coroutines so the daemon can await them in its own loop
+    if hasattr(result, "__await__"):
+        import asyncio
+
+        result = asyncio.run(_finish(result))
+    return result
+
+
+if __name__ == "__main__":
+    sys.exit(main())
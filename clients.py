@@ -0,0 +1,239 @@
+"""Process-wide Anthropic and Scrapybara clients.
+
+Sessions share one client per API key instead of constructing their own, and
+every client sends through one tuned `httpx.Client`. Connections are kept
+alive and reused across sessions (and between commands when running inside
+the daemon) instead of each session paying fresh TCP/TLS handshakes. HTTP/2
+is used when the `h2` package is installed. `pool_stats()` reports pool
+utilization and how many requests reused a connection.
+
+    python clients.py bench   # fresh clients vs the shared pool, against a local HTTP stub
+
+With SCRAPYBARA_FAKE set, both return the local stand-ins from
+fake_scrapybara.py instead (for load tests; no network, no cost).
+"""
+import os
+import sys
+import threading
+from typing import Dict, Optional
+
+FAKE = os.getenv("SCRAPYBARA_FAKE")
+
+MAX_CONNECTIONS = int(os.getenv("SCRAPYBARA_HTTP_MAX_CONNECTIONS", 100))
+MAX_KEEPALIVE = int(os.getenv("SCRAPYBARA_HTTP_MAX_KEEPALIVE", 20))
+KEEPALIVE_EXPIRY = float(os.getenv("SCRAPYBARA_HTTP_KEEPALIVE_EXPIRY", 60))
+# "auto" uses HTTP/2 when h2 is installed; "0" forces HTTP/1.1
+HTTP2 = os.getenv("SCRAPYBARA_HTTP2", "auto")
+
+_lock = threading.Lock()
+_anthropic: Dict[str, object] = {}
+_scrapybara: Dict[str, object] = {}
+_http = None
+
+
+def _http2_available() -> bool:
+    if HTTP2 == "0":
+        return False
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _metered_transport(**kwargs):
+    """An HTTPTransport that counts requests, new connections and TLS handshakes"""
+    import httpx
+
+    class MeteredTransport(httpx.HTTPTransport):
+        def __init__(self, **kwargs):
+            super().__init__(**kwargs)
+            self.metrics = {"requests": 0, "new_connections": 0, "tls_handshakes": 0, "in_flight": 0, "peak_in_flight": 0}
+            self.metrics_lock = threading.Lock()
+
+        def _trace(self, outer):
+            def trace(event: str, info: dict):
+                if event == "connection.connect_tcp.complete":
+                    with self.metrics_lock:
+                        self.metrics["new_connections"] += 1
+                elif event == "connection.start_tls.complete":
+                    with self.metrics_lock:
+                        self.metrics["tls_handshakes"] += 1
+                if outer is not None:
+                    outer(event, info)
+            return trace
+
+        def handle_request(self, request):
+            request.extensions["trace"] = self._trace(request.extensions.get("trace"))
+            with self.metrics_lock:
+                self.metrics["requests"] += 1
+                self.metrics["in_flight"] += 1
+                self.metrics["peak_in_flight"] = max(self.metrics["peak_in_flight"], self.metrics["in_flight"])
+            try:
+                return super().handle_request(request)
+            finally:
+                with self.metrics_lock:
+                    self.metrics["in_flight"] -= 1
+
+        def connections(self) -> list:
+            # httpcore's pool behind the transport; only read for stats
+            return list(self._pool.connections)
+
+    return MeteredTransport(**kwargs)
+
+
+def _http_client():
+    """The shared httpx client (call with _lock held)"""
+    global _http
+    if _http is None:
+        import httpx
+
+        limits = httpx.Limits(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_KEEPALIVE,
+            keepalive_expiry=KEEPALIVE_EXPIRY,
+        )
+        http2 = _http2_available()
+        _http = httpx.Client(
+            transport=_metered_transport(limits=limits, http2=http2),
+            timeout=httpx.Timeout(600.0, connect=10.0),
+            follow_redirects=True,
+        )
+        _http.http2 = http2
+    return _http
+
+
+def get_http_client():
+    """The process-wide pooled httpx client every SDK client sends through"""
+    with _lock:
+        return _http_client()
+
+
+def get_anthropic(api_key: Optional[str] = None):
+    api_key = api_key or os.getenv("ANTHROPIC_API_KEY")
+    with _lock:
+        if api_key not in _anthropic and FAKE is not None:
+            from fake_scrapybara import FakeAnthropic, get_simulator
+
+            _anthropic[api_key] = FakeAnthropic(get_simulator(FAKE))
+        elif api_key not in _anthropic:
+            from anthropic import Anthropic
+
+            _anthropic[api_key] = Anthropic(api_key=api_key, http_client=_http_client())
+        return _anthropic[api_key]
+
+
+def get_scrapybara(api_key: Optional[str] = None):
+    api_key = api_key or os.getenv("SCRAPYBARA_API_KEY")
+    with _lock:
+        if api_key not in _scrapybara and FAKE is not None:
+            from fake_scrapybara import FakeScrapybara, get_simulator
+
+            _scrapybara[api_key] = FakeScrapybara(get_simulator(FAKE))
+        elif api_key not in _scrapybara:
+            from scrapybara import Scrapybara
+
+            try:
+                _scrapybara[api_key] = Scrapybara(api_key=api_key, httpx_client=_http_client())
+            except TypeError:
+                # SDK versions without an httpx_client argument keep their own pool
+                _scrapybara[api_key] = Scrapybara(api_key=api_key)
+        return _scrapybara[api_key]
+
+
+def pool_stats() -> dict:
+    """Connection reuse and pool utilization of the shared HTTP client"""
+    with _lock:
+        if _http is None:
+            return {}
+        transport = _http._transport
+        with transport.metrics_lock:
+            stats = dict(transport.metrics)
+        connections = transport.connections()
+    idle = sum(1 for c in connections if c.is_idle())
+    stats.update(
+        http2=_http.http2,
+        open_connections=len(connections),
+        idle_connections=idle,
+        active_connections=len(connections) - idle,
+        max_connections=MAX_CONNECTIONS,
+        utilization=round((len(connections) - idle) / MAX_CONNECTIONS, 3),
+        reuse_ratio=round(1 - stats["new_connections"] / stats["requests"], 3) if stats["requests"] else None,
+    )
+    return stats
+
+
+def reset():
+    """Drop cached clients (e.g. after rotating API keys)"""
+    global _http
+    with _lock:
+        _anthropic.clear()
+        _scrapybara.clear()
+        if _http is not None:
+            _http.close()
+            _http = None
+
+
+def _bench(sessions: int = 50, requests_per_session: int = 20, threads: int = 10):
+    import http.server
+    import socket
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+
+    import httpx
+
+    connections = []
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def setup(self):
+            super().setup()
+            # Without this, delayed ACKs dominate localhost timings
+            self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            connections.append(self.client_address)
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            body = b'{"ok": true}'
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/v1/messages"
+
+    def fresh_session(_):
+        # Old behaviour: every session builds its own client
+        with httpx.Client() as client:
+            for _ in range(requests_per_session):
+                client.post(url, json={"turn": 1})
+
+    def pooled_session(_):
+        client = get_http_client()
+        for _ in range(requests_per_session):
+            client.post(url, json={"turn": 1})
+
+    for label, run in (("fresh clients", fresh_session), ("shared pool", pooled_session)):
+        connections.clear()
+        started = time.perf_counter()
+        with ThreadPoolExecutor(threads) as pool:
+            list(pool.map(run, range(sessions)))
+        elapsed = time.perf_counter() - started
+        total = sessions * requests_per_session
+        print(f"{label:14}: {total} requests in {elapsed:.2f}s ({total / elapsed:.0f}/s), {len(connections)} TCP connections")
+    print(f"pool stats: {pool_stats()}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["bench"]:
+        _bench()
+    else:
+        print(__doc__)
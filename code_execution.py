@@ -1,27 +1,35 @@
 import asyncio
 import os
-from typing import Any, Dict
-from datetime import datetime
+import re
+from typing import Any, Dict, Optional
 from dotenv import load_dotenv
 
 load_dotenv(dotenv_path="C:\\Users\\Ivenaccip\\Documents\\scrapybara\\.env", override=True)
 
-from anthropic import Anthropic
-from anthropic.types.beta import BetaToolResultBlockParam, BetaMessageParam
-
-from scrapybara import Scrapybara
 from scrapybara.anthropic import BashTool, ComputerTool, EditTool, ToolResult
 
+from agent import ToolCollection, sampling_loop
+from cell_cache import MemoizedCells, get_cell_cache, vm_digests
+from clients import get_anthropic, get_scrapybara
+from file_ops import FileOpsTool
+from macros import documents_dir, run_setup
+from progress_log import log_event, logged_session
+from sandbox import LocalSession, get_sandbox, session_dir
+from scheduler import get_scheduler
+from sizing import UsageSampler, choose_instance_type
+from wait_for import WaitForTool
+
 ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY")
 SCRAPYBARA_API_KEY = os.getenv("SCRAPYBARA_API_KEY")
 
-SYSTEM_PROMPT = f"""<SYSTEM_CAPABILITY>
+SYSTEM_PROMPT = """<SYSTEM_CAPABILITY>
 * You are utilising an Ubuntu virtual machine with Python and common data science libraries installed.
 * You can execute Python code directly in the environment using the code_execution tool.
 * Available packages include numpy, pandas, matplotlib, scikit-learn, and other common data science libraries.
 * You can also use bash commands and control the virtual desktop if needed.
-* To open chromium, use: "(DISPLAY=:1 chromium --no-sandbox &)" in the terminal
-* The current date is {datetime.today().strftime('%A, %B %#d, %Y')}.
+* To wait for an app window or an output file, use the wait_for tool instead of repeated screenshots.
+* To open chromium, use: "(DISPLAY=:1 chromium --no-sandbox --remote-debugging-port=9222 &)" in the terminal
+* The current date is {current_date}.
 </SYSTEM_CAPABILITY>
 
 You are a Python coding assistant. Your task is to:
@@ -38,25 +46,93 @@ Guidelines:
 - Use visualizations when helpful
 - Explain your code and results clearly
 - Save important code in Documents/code_examples
+- Use file_ops to create, write or read several files in a single call
 """
 
-class CodeExecutionTool:
-    """Tool for executing Python code in a Scrapybara instance."""
-    
+LOCAL_SYSTEM_PROMPT = """<SYSTEM_CAPABILITY>
+* You are running Python code in a local sandbox through the code_execution tool; there is no desktop, browser or shell tool.
+* Available packages include numpy, pandas and matplotlib (Agg backend: save figures with plt.savefig instead of plt.show).
+* The sandbox has no network access. Each call runs in a fresh namespace, so re-import and redefine what you need.
+* The working directory is kept for the whole session: write files with open() and pathlib.
+* The current date is {current_date}.
+</SYSTEM_CAPABILITY>
+
+You are a Python coding assistant. Your task is to:
+1. Help users write and test Python code
+2. Demonstrate coding concepts with examples
+3. Debug and optimize code
+4. Create data visualizations
+5. Perform data analysis tasks
+6. Save code and results in organized files
+
+Guidelines:
+- Break down complex problems into smaller steps
+- Include error handling in your code
+- Use visualizations when helpful
+- Explain your code and results clearly
+- Save important code in Documents/code_examples
+"""
+
+# "auto" picks the local sandbox unless the task mentions something that needs the desktop
+BACKEND = os.getenv("SCRAPYBARA_CODE_BACKEND", "auto")
+GUI_HINTS = re.compile(
+    r"\b(browser|chromium|chrome|website|web ?page|url|http|scrap\w*|download|internet|api|gui|desktop|"
+    r"screenshot|click|libreoffice|spreadsheet app|selenium|playwright|pip install|apt)\b",
+    re.IGNORECASE,
+)
+
+
+def needs_vm(task: str, description: Optional[str] = None) -> bool:
+    """Whether a coding task needs the VM (desktop, browser, network) rather than the local sandbox"""
+    if BACKEND in ("vm", "local"):
+        return BACKEND == "vm"
+    return bool(GUI_HINTS.search(f"{task} {description or ''}"))
+
+
+class VMCodeBackend:
+    """Runs cells in the instance's Jupyter kernel"""
+
+    kernel = "vm:python3"
+    stateful = True
+
     def __init__(self, instance):
         self.instance = instance
 
+    async def execute(self, code: str, timeout: int = 30):
+        return await self.instance.code.execute(code=code, timeout=timeout, kernel_name="python3")
+
+    def file_digests(self, paths):
+        return vm_digests(self.instance, paths)
+
+
+class CodeExecutionTool:
+    """Tool for executing Python code in a Scrapybara instance or the local sandbox."""
+    
+    def __init__(self, instance=None, backend=None):
+        self.backend = backend or VMCodeBackend(instance)
+        cache = get_cell_cache()
+        self.cells = cache and MemoizedCells(cache, self.backend.kernel, self.backend.stateful,
+                                             self.backend.file_digests)
+
     def to_params(self) -> Dict[str, Any]:
-        return {
+        if self.backend.stateful:
+            environment = """Execute Python code in the virtual environment.
+            Cells run in one Jupyter kernel, so variables, imports and definitions persist between calls.
+            Available packages include numpy, pandas, matplotlib, and other common libraries."""
+        else:
+            environment = """Execute Python code in a local sandbox.
+            Each call runs in a fresh namespace: nothing defined by an earlier call is available, so repeat
+            the imports and definitions you need, or save intermediate results to files in the working
+            directory, which persist for the session.
+            numpy and pandas are available; there is no network access."""
+        params = {
             "name": "code_execution",
-            "description": """Execute Python code in the virtual environment. 
-            The code will be executed in a fresh Python kernel each time.
-            Available packages include numpy, pandas, matplotlib, and other common libraries.
+            "description": environment + """
             
             Input should be a dictionary with:
             - code: The Python code to execute (required)
             - timeout: Maximum execution time in seconds (optional, default 30)""",
-            "parameters": {
+            "input_schema": {
                 "type": "object",
                 "properties": {
                     "code": {
@@ -72,168 +148,133 @@ class CodeExecutionTool:
                 "required": ["code"]
             }
         }
+        if self.cells:
+            params["description"] += """
+            - cache: "pure" if the output depends only on the code, its input files and earlier cells, and it
+              defines nothing later cells use; "deterministic" if it gives the same output every time but may
+              define variables or imports. A marked cell identical to an earlier run returns the earlier output.
+              Leave it out for anything random, time-dependent, networked or writing files.
+            - inputs: files the cell reads, so a changed file isn't served from the cache"""
+            params["input_schema"]["properties"].update(
+                cache={"type": "string", "enum": ["pure", "deterministic"]},
+                inputs={"type": "array", "items": {"type": "string"}},
+            )
+        return params
 
-    async def __call__(self, code: str, timeout: int = 30) -> ToolResult:
+    async def _execute(self, code: str, timeout: int):
+        response = await self.backend.execute(code=code, timeout=timeout)
+
+        # Extract output from the response format
+        output = ""
+        if isinstance(response, dict):  # Handle both dict and direct output formats
+            for output_item in response.get("outputs", []):
+                if output_item.get("type") == "stream" and output_item.get("name") == "stdout":
+                    output += output_item.get("text", "")
+        else:
+            output = str(response)
+        return output, response.get("error") if isinstance(response, dict) else None
+
+    async def __call__(self, code: str, timeout: int = 30, cache: str = None, inputs: list = None) -> ToolResult:
         try:
-            response = await self.instance.code.execute(
-                code=code,
-                timeout=timeout,
-                kernel_name="python3"
-            )
-            
-            # Extract output from the response format
-            output = ""
-            if isinstance(response, dict):  # Handle both dict and direct output formats
-                for output_item in response.get("outputs", []):
-                    if output_item.get("type") == "stream" and output_item.get("name") == "stdout":
-                        output += output_item.get("text", "")
+            if self.cells:
+                output, error = await self.cells.run(code, timeout, self._execute, mark=cache, inputs=inputs)
             else:
-                output = str(response)
-            
-            return ToolResult(
-                output=output,
-                error=response.get("error") if isinstance(response, dict) else None,
-                base64_image=None
-            )
+                output, error = await self._execute(code, timeout)
+            return ToolResult(output=output, error=error, base64_image=None)
         except Exception as e:
             return ToolResult(error=str(e))
 
-class ToolCollection:
-    def __init__(self, *tools):
-        self.tools = tools
-        self.tool_map = {tool.to_params()["name"]: tool for tool in tools}
-
-    def to_params(self) -> list:
-        return [tool.to_params() for tool in self.tools]
+def _coding_command(task: str, description: Optional[str]) -> str:
+    return f"""Please help me with the following coding task: {task}
+        
+        {f'Additional context: {description}' if description else ''}
+        
+        Please:
+        1. Break down the problem into steps
+        2. Write and test the code
+        3. Include error handling
+        4. Add helpful comments
+        5. Save the final code in Documents/code_examples/
+        
+        Focus on writing clean, efficient, and well-documented code.
+        """
 
-    async def run(self, *, name: str, tool_input: dict) -> ToolResult:
-        tool = self.tool_map.get(name)
-        if not tool:
-            return None
-        try:
-            return await tool(**tool_input)
-        except Exception as e:
-            print(f"Error running tool {name}: {e}")
-            return None
+async def _local_session(task: str, description: Optional[str]):
+    """Run the session against the local sandbox, without booting a VM"""
+    workdir = session_dir(task)
+    os.makedirs(os.path.join(workdir, "Documents", "code_examples"), exist_ok=True)
+    print(f"Using the local sandbox in {workdir} (no VM needed)")
+    log_event("code_backend", backend="local", workdir=workdir)
 
-def make_tool_result(result: ToolResult, tool_use_id: str) -> BetaToolResultBlockParam:
-    tool_result_content = []
-    is_error = False
-    
-    if result.error:
-        is_error = True
-        tool_result_content = result.error
-    else:
-        if result.output:
-            tool_result_content.append({
-                "type": "text",
-                "text": result.output,
-            })
-        if result.base64_image:
-            tool_result_content.append({
-                "type": "image",
-                "source": {
-                    "type": "base64",
-                    "media_type": "image/png",
-                    "data": result.base64_image,
-                },
-            })
-    
-    return {
-        "type": "tool_result",
-        "content": tool_result_content,
-        "tool_use_id": tool_use_id,
-        "is_error": is_error,
-    }
+    tools = ToolCollection(CodeExecutionTool(backend=LocalSession(get_sandbox(), workdir)))
+    client = get_anthropic(ANTHROPIC_API_KEY)
+    messages = [{"role": "user", "content": [{"type": "text", "text": _coding_command(task, description)}]}]
+    await sampling_loop(
+        client,
+        system_prompt=LOCAL_SYSTEM_PROMPT,
+        tools=tools,
+        messages=messages,
+    )
+    print(f"\nCoding session complete! Code saved in {os.path.join(workdir, 'Documents', 'code_examples')}")
 
+@logged_session("code", target_arg="task")
 async def coding_session(task: str, description: str = None, save_output: bool = True):
     """Start a coding assistance session for a specific task"""
     
+    if not needs_vm(task, description):
+        # Without namespaces for the workers, cells would run unconfined on this machine
+        refusal = await asyncio.to_thread(get_sandbox().unavailable)
+        if refusal is None:
+            await _local_session(task, description)
+            return
+        print(f"Local sandbox unavailable ({refusal}); using a VM instead")
+        log_event("code_backend", backend="vm", fallback=refusal)
+
     # Initialize Scrapybara VM
-    s = Scrapybara(api_key=SCRAPYBARA_API_KEY)
-    instance = s.start(instance_type="medium")
+    scheduler = get_scheduler()
+    s = get_scrapybara(SCRAPYBARA_API_KEY)
+    instance_type = choose_instance_type("code")
+    instance = await scheduler.start_instance(s, instance_type=instance_type)
     print(f"Started Scrapybara instance: {instance.id}")
+    log_event("code_backend", backend="vm", instance=instance.id)
 
-    # Initialize tools
-    tools = ToolCollection(
-        CodeExecutionTool(instance),
-        BashTool(instance),
-        ComputerTool(instance),
-        EditTool(instance)
-    )
+    try:
+        # Initialize tools
+        tools = ToolCollection(
+            CodeExecutionTool(instance),
+            BashTool(instance),
+            ComputerTool(instance),
+            EditTool(instance),
+            FileOpsTool(instance),
+            WaitForTool(instance)
+        )
 
-    # Initialize chat with Claude
-    client = Anthropic(api_key=ANTHROPIC_API_KEY)
-    messages = []
+        # Initialize chat with Claude
+        client = get_anthropic(ANTHROPIC_API_KEY)
+        messages = []
 
-    # Initial coding task
-    coding_command = f"""Please help me with the following coding task: {task}
-    
-    {f'Additional context: {description}' if description else ''}
-    
-    Please:
-    1. Break down the problem into steps
-    2. Write and test the code
-    3. Include error handling
-    4. Add helpful comments
-    5. Save the final code in Documents/code_examples/
-    
-    Focus on writing clean, efficient, and well-documented code.
-    """
-
-    messages.append({
-        "role": "user",
-        "content": [{"type": "text", "text": coding_command}],
-    })
-
-    while True:
-        # Get Claude's response
-        response = client.beta.messages.create(
-            model="claude-3-5-sonnet-20241022",
-            max_tokens=4096,
-            messages=messages,
-            system=[{"type": "text", "text": SYSTEM_PROMPT}],
-            tools=tools.to_params(),
-            betas=["computer-use-2024-10-22"]
-        )
+        # Initial coding task
+        coding_command = _coding_command(task, description)
+
+        # Known setup steps run directly instead of through model turns
+        setup = await run_setup(tools, [documents_dir("code_examples")])
 
-        # Process tool usage
-        tool_results = []
-        for content in response.content:
-            if content.type == "text":
-                print(f"\nAssistant: {content.text}")
-            elif content.type == "tool_use":
-                print(f"\nExecuting: {content.name}")
-                result = await tools.run(
-                    name=content.name,
-                    tool_input=content.input
-                )
-                
-                if result:
-                    tool_result = make_tool_result(result, content.id)
-                    tool_results.append(tool_result)
-                    
-                    if result.output:
-                        print(f"Output: {result.output}")
-                    if result.error:
-                        print(f"Error: {result.error}")
-
-        # Add assistant's response and tool results to messages
         messages.append({
-            "role": "assistant",
-            "content": [c.model_dump() for c in response.content]
+            "role": "user",
+            "content": [{"type": "text", "text": coding_command}] + setup,
         })
 
-        if tool_results:
-            messages.append({
-                "role": "user",
-                "content": tool_results
-            })
-        else:
-            break
+        async with UsageSampler(instance, "code", instance_type, tools=tools):
+            await sampling_loop(
+                client,
+                system_prompt=SYSTEM_PROMPT,
+                tools=tools,
+                messages=messages,
+            )
 
-    instance.stop()
-    print(f"\nCoding session complete! Code saved in Documents/code_examples/")
+    finally:
+        await scheduler.stop_instance(instance)
+        print(f"\nCoding session complete! Code saved in Documents/code_examples/")
 
 async def run_example_tasks():
     """Run a series of example coding tasks"""
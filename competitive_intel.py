@@ -6,24 +6,33 @@ from dotenv import load_dotenv
 
 load_dotenv(dotenv_path="C:\\Users\\Ivenaccip\\Documents\\scrapybara\\.env", override=True)
 
-from anthropic import Anthropic
-from anthropic.types.beta import BetaToolResultBlockParam, BetaMessageParam
-
-from scrapybara import Scrapybara
-from scrapybara.anthropic import BashTool, ComputerTool, EditTool, ToolResult
+from scrapybara.anthropic import BashTool, ComputerTool, EditTool
+
+from agent import ToolCollection, sampling_loop
+from clients import get_anthropic, get_scrapybara
+from entities import fan_out, resolve
+from file_ops import FileOpsTool
+from macros import chromium, run_setup
+from prefetch import make_prefetcher
+from progress_log import logged_session
+from reports import FindingsTool, report_dir
+from scheduler import get_scheduler
+from sizing import UsageSampler, choose_instance_type
+from wait_for import WaitForTool
 
 ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY")
 SCRAPYBARA_API_KEY = os.getenv("SCRAPYBARA_API_KEY")
 
-SYSTEM_PROMPT = f"""<SYSTEM_CAPABILITY>
+SYSTEM_PROMPT = """<SYSTEM_CAPABILITY>
 * You are utilising an Ubuntu virtual machine using linux architecture with internet access.
 * You can feel free to install Ubuntu applications with your bash tool. Use curl instead of wget.
-* To open chromium, please just click on the web browser icon or use the "(DISPLAY=:1 chromium --no-sandbox &)" command in the terminal. Note chromium is what is installed on your system.
-* Using bash tool you can start GUI applications, but you need to set export DISPLAY=:1 and use a subshell. For example "(DISPLAY=:1 xterm &)". GUI apps run with bash tool will appear within your desktop environment, but they may take some time to appear. Take a screenshot to confirm it did.
+* To open chromium, please just click on the web browser icon or use the "(DISPLAY=:1 chromium --no-sandbox --remote-debugging-port=9222 &)" command in the terminal. Note chromium is what is installed on your system.
+* Using bash tool you can start GUI applications, but you need to set export DISPLAY=:1 and use a subshell. For example "(DISPLAY=:1 xterm &)". GUI apps run with bash tool will appear within your desktop environment, but they may take some time to appear. Use the wait_for tool (condition "window") to wait for it instead of taking repeated screenshots.
 * When using your bash tool with commands that are expected to output very large quantities of text, redirect into a tmp file and use str_replace_editor or `grep -n -B <lines before> -A <lines after> <query> <filename>` to confirm output.
+* After navigating, use wait_for with condition "url" to wait for the page to finish loading instead of taking screenshots until it has.
 * When viewing a page it can be helpful to zoom out so that you can see everything on the page.  Either that, or make sure you scroll down to see everything before deciding something isn't available.
 * When using your computer function calls, they take a while to run and send back to you.  Where possible/feasible, try to chain multiple of these calls all into one function calls request.
-* The current date is {datetime.today().strftime('%A, %B %#d, %Y')}.
+* The current date is {current_date}.
 </SYSTEM_CAPABILITY>
 
 <IMPORTANT>
@@ -40,68 +49,20 @@ You are a competitive intelligence analyst using a Linux virtual desktop. Your t
    - Marketing messaging
    - Target markets
    - Recent announcements
-3. Maintain structured data in LibreOffice Calc
-4. Create detailed analysis in LibreOffice Writer
-5. Generate visual comparisons and trends
-6. Highlight key changes and developments
+3. Submit structured data (tables) and detailed analysis (sections) with the submit_findings tool
+4. Generate visual comparisons and trends
+5. Highlight key changes and developments
 
 Guidelines:
 - Launch GUI apps using bash with DISPLAY=:1 
 - Take screenshots to verify your actions
-- Save files in Documents/competitive_intel
+- Don't open LibreOffice: submit_findings writes the report and spreadsheet for you
 - Focus on actionable insights
 - Note significant changes from previous analysis
 - Look for strategic shifts and new directions
 """
 
-class ToolCollection:
-    def __init__(self, *tools):
-        self.tools = tools
-        self.tool_map = {tool.to_params()["name"]: tool for tool in tools}
-
-    def to_params(self) -> list:
-        return [tool.to_params() for tool in self.tools]
-
-    async def run(self, *, name: str, tool_input: dict) -> ToolResult:
-        tool = self.tool_map.get(name)
-        if not tool:
-            return None
-        try:
-            return await tool(**tool_input)
-        except Exception as e:
-            print(f"Error running tool {name}: {e}")
-            return None
-
-def make_tool_result(result: ToolResult, tool_use_id: str) -> BetaToolResultBlockParam:
-    tool_result_content = []
-    is_error = False
-    
-    if result.error:
-        is_error = True
-        tool_result_content = result.error
-    else:
-        if result.output:
-            tool_result_content.append({
-                "type": "text",
-                "text": result.output,
-            })
-        if result.base64_image:
-            tool_result_content.append({
-                "type": "image",
-                "source": {
-                    "type": "base64",
-                    "media_type": "image/png",
-                    "data": result.base64_image,
-                },
-            })
-    
-    return {
-        "type": "tool_result",
-        "content": tool_result_content,
-        "tool_use_id": tool_use_id,
-        "is_error": is_error,
-    }
-
+@logged_session("compete", target_arg="competitor_name")
 async def analyze_competitor(
     competitor_name: str,
     website: str,
@@ -111,8 +72,10 @@ async def analyze_competitor(
     """Perform competitive analysis on a single competitor"""
     
     # Initialize Scrapybara VM with explicit instance type
-    s = Scrapybara(api_key=SCRAPYBARA_API_KEY)
-    instance = s.start(instance_type="medium")
+    scheduler = get_scheduler()
+    s = get_scrapybara(SCRAPYBARA_API_KEY)
+    instance_type = choose_instance_type("compete")
+    instance = await scheduler.start_instance(s, instance_type=instance_type)
     print(f"Started Scrapybara instance: {instance.id}")
 
     try:
@@ -121,14 +84,18 @@ async def analyze_competitor(
         print(f"Browser started with CDP URL: {cdp_url}")
 
         # Initialize tools
+        findings = FindingsTool("compete", competitor_name)
         tools = ToolCollection(
             ComputerTool(instance),
             BashTool(instance),
-            EditTool(instance)
+            EditTool(instance),
+            FileOpsTool(instance),
+            WaitForTool(instance),
+            findings
         )
 
         # Initialize chat with Claude
-        client = Anthropic(api_key=ANTHROPIC_API_KEY)
+        client = get_anthropic(ANTHROPIC_API_KEY)
         messages = []
 
         # Initial analysis command
@@ -144,86 +111,54 @@ async def analyze_competitor(
            - Pricing (if public)
            - Marketing messages
            - Target markets
-        3. Create comparison spreadsheets
-        4. Generate analysis document
-        5. Save everything in Documents/competitive_intel/{competitor_name}
+        3. Put comparison data in tables and your analysis in sections
+        4. Submit everything with submit_findings
 
         Focus on identifying significant changes and strategic implications.
         """
 
+        # Known setup steps run directly instead of through model turns
+        setup = await run_setup(tools, [
+            chromium(website),
+        ])
+
         messages.append({
             "role": "user",
-            "content": [{"type": "text", "text": analysis_command}],
+            "content": [{"type": "text", "text": analysis_command}] + setup,
         })
 
-        while True:
-            # Get Claude's response
-            response = client.beta.messages.create(
-                model="claude-3-5-sonnet-20241022",
-                max_tokens=4096,
+        async with UsageSampler(instance, "compete", instance_type, tools=tools):
+            await sampling_loop(
+                client,
+                system_prompt=SYSTEM_PROMPT,
+                tools=tools,
                 messages=messages,
-                system=[{"type": "text", "text": SYSTEM_PROMPT}],
-                tools=tools.to_params(),
-                betas=["computer-use-2024-10-22"]
+                screenshot_on_empty_bash=True,
+                prefetcher=make_prefetcher(instance, seeds=[website], company=competitor_name),
             )
 
-            # Process tool usage
-            tool_results = []
-            for content in response.content:
-                if content.type == "text":
-                    print(f"\nAssistant: {content.text}")
-                elif content.type == "tool_use":
-                    print(f"\nTool Use: {content.name}")
-                    result = await tools.run(
-                        name=content.name,
-                        tool_input=content.input
-                    )
-                    
-                    if content.name == "bash" and not result:
-                        result = await tools.run(
-                            name="computer",
-                            tool_input={"action": "screenshot"}
-                        )
-                    
-                    if result:
-                        tool_result = make_tool_result(result, content.id)
-                        tool_results.append(tool_result)
-                        
-                        if result.output:
-                            print(f"Tool Output: {result.output}")
-                        if result.error:
-                            print(f"Tool Error: {result.error}")
-
-            # Add assistant's response and tool results to messages
-            messages.append({
-                "role": "assistant",
-                "content": [c.model_dump() for c in response.content]
-            })
-
-            if tool_results:
-                messages.append({
-                    "role": "user",
-                    "content": tool_results
-                })
-            else:
-                break
-
     finally:
-        instance.stop()
-        print(f"\nAnalysis complete for {competitor_name}! Documents saved in Documents/competitive_intel/{competitor_name}")
+        await scheduler.stop_instance(instance)
+        print(f"\nAnalysis complete for {competitor_name}! Report saved in {report_dir('compete', competitor_name)}")
+    return findings.result()
 
-async def analyze_market(competitors: List[dict]):
-    """Analyze multiple competitors in sequence"""
+async def analyze_market(competitors: List[dict]) -> dict:
+    """Analyze multiple competitors in sequence, once per company however many names it's listed under"""
     today = datetime.today().strftime('%Y-%m-%d')
     
-    for competitor in competitors:
-        print(f"\nStarting analysis for {competitor['name']}...")
-        await analyze_competitor(
+    entities = resolve(competitors)
+    results = {}
+    for entity in entities:
+        competitor = entity.target
+        aliases = f" (also listed as {', '.join(entity.aliases)})" if entity.aliases else ""
+        print(f"\nStarting analysis for {competitor['name']}{aliases}...")
+        results[entity.key] = await analyze_competitor(
             competitor_name=competitor["name"],
             website=competitor["website"],
             focus_areas=competitor.get("focus_areas"),
             previous_analysis_date=competitor.get("last_analysis")
         )
+    return fan_out(entities, results, key=lambda c: c["name"])
 
 if __name__ == "__main__":
     # Example usage
@@ -0,0 +1,245 @@
+"""Compact in-memory conversation for the agent loop.
+
+The loop used to keep `model_dump()` dicts of every response and the full
+tool-result dicts, so each screenshot's base64 string lived in the history
+for the whole session. Here every block is a small `__slots__` record, tool
+names and roles are interned, and screenshots sit once in a content-addressed
+blob table (as `ScreenshotBuffer`s) and are referenced by id. The API-format
+dicts are only built at send time by `Conversation.to_api()`.
+
+Only the `max_images` most recent screenshots are sent and kept. Older ones
+are replaced by a short text note and their blobs are dropped, so memory per
+session stays bounded no matter how many screenshots the agent takes.
+"""
+import os
+import sys
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from screenshots import ScreenshotBuffer
+
+MAX_IMAGES = int(os.getenv("SCRAPYBARA_MAX_IMAGES", 10))
+OMITTED_IMAGE = "[older screenshot omitted]"
+
+
+class TextBlock:
+    __slots__ = ("text",)
+
+    def __init__(self, text: str):
+        self.text = text
+
+    def to_api(self, blobs) -> dict:
+        return {"type": "text", "text": self.text}
+
+
+class ImageBlock:
+    __slots__ = ("blob_id", "media_type", "dropped")
+
+    def __init__(self, blob_id: str, media_type: str = "image/png"):
+        self.blob_id = blob_id
+        self.media_type = sys.intern(media_type)
+        self.dropped = False
+
+    def to_api(self, blobs) -> dict:
+        buffer = None if self.dropped else blobs.get(self.blob_id)
+        if buffer is None:
+            return {"type": "text", "text": OMITTED_IMAGE}
+        return {"type": "image", "source": {"type": "base64", "media_type": self.media_type, "data": buffer.base64()}}
+
+
+class ToolUseBlock:
+    __slots__ = ("id", "name", "input")
+
+    def __init__(self, id: str, name: str, input: dict):
+        self.id = id
+        self.name = sys.intern(name)
+        self.input = input
+
+    def to_api(self, blobs) -> dict:
+        return {"type": "tool_use", "id": self.id, "name": self.name, "input": self.input}
+
+
+class ToolResultBlock:
+    __slots__ = ("tool_use_id", "content", "error")
+
+    def __init__(self, tool_use_id: str, content: Tuple = (), error: Optional[str] = None):
+        self.tool_use_id = tool_use_id
+        self.content = content
+        self.error = error
+
+    def to_api(self, blobs) -> dict:
+        content = [block.to_api(blobs) for block in self.content]
+        if self.error is not None:
+            content = [{"type": "text", "text": self.error}, *content] if content else self.error
+        return {
+            "type": "tool_result",
+            "content": content,
+            "tool_use_id": self.tool_use_id,
+            "is_error": self.error is not None,
+        }
+
+
+class RawBlock:
+    """Any block type the store doesn't model, kept as its API dict"""
+    __slots__ = ("data",)
+
+    def __init__(self, data: dict):
+        self.data = data
+
+    def to_api(self, blobs) -> dict:
+        return self.data
+
+
+class Message:
+    __slots__ = ("role", "content")
+
+    def __init__(self, role: str, content: Tuple):
+        self.role = sys.intern(role)
+        self.content = content
+
+
+class BlobStore:
+    """Content-addressed table of screenshot buffers with reference counts"""
+
+    def __init__(self):
+        self.blobs: Dict[str, ScreenshotBuffer] = {}
+        self.refs: Dict[str, int] = {}
+
+    def put(self, buffer: ScreenshotBuffer) -> str:
+        blob_id = buffer.key
+        # Hash collisions are astronomically rare, but never serve the wrong image
+        while blob_id in self.blobs and not self.blobs[blob_id].same_as(buffer):
+            blob_id += "'"
+        if blob_id not in self.blobs:
+            self.blobs[blob_id] = buffer
+        self.refs[blob_id] = self.refs.get(blob_id, 0) + 1
+        return blob_id
+
+    def get(self, blob_id: str) -> Optional[ScreenshotBuffer]:
+        return self.blobs.get(blob_id)
+
+    def release(self, blob_id: str):
+        count = self.refs.get(blob_id, 0) - 1
+        if count <= 0:
+            self.refs.pop(blob_id, None)
+            self.blobs.pop(blob_id, None)
+        else:
+            self.refs[blob_id] = count
+
+    def nbytes(self) -> int:
+        return sum(buffer.nbytes for buffer in self.blobs.values())
+
+
+class Conversation:
+    def __init__(self, max_images: Optional[int] = MAX_IMAGES):
+        self.messages: List[Message] = []
+        self.blobs = BlobStore()
+        self.max_images = max_images
+        # Image blocks in the order they were added, oldest first
+        self._images: List[ImageBlock] = []
+
+    @classmethod
+    def from_messages(cls, messages: Iterable[dict], **kwargs) -> "Conversation":
+        """Import API-format messages (e.g. the initial user prompt)"""
+        conversation = cls(**kwargs)
+        for message in messages:
+            content = message["content"]
+            if isinstance(content, str):
+                content = [{"type": "text", "text": content}]
+            conversation.messages.append(Message(message["role"], tuple(conversation._block(b) for b in content)))
+        conversation._trim_images()
+        return conversation
+
+    def _block(self, block: dict):
+        kind = block.get("type")
+        if kind == "text":
+            return TextBlock(block["text"])
+        if kind == "image" and block.get("source", {}).get("type") == "base64":
+            return self._image(block["source"]["data"], block["source"].get("media_type", "image/png"))
+        if kind == "tool_use":
+            return ToolUseBlock(block["id"], block["name"], block.get("input") or {})
+        if kind == "tool_result":
+            content = block.get("content")
+            if block.get("is_error") and isinstance(content, str):
+                return ToolResultBlock(block["tool_use_id"], error=content)
+            if block.get("is_error") and content and content[0].get("type") == "text":
+                return ToolResultBlock(block["tool_use_id"], tuple(self._block(b) for b in content[1:]),
+                                       error=content[0]["text"])
+            if isinstance(content, str):
+                content = [{"type": "text", "text": content}]
+            return ToolResultBlock(block["tool_use_id"], tuple(self._block(b) for b in content or ()))
+        return RawBlock(block)
+
+    def _image(self, data: str, media_type: str = "image/png") -> ImageBlock:
+        image = ImageBlock(self.blobs.put(ScreenshotBuffer.from_base64(data, media_type)), media_type)
+        self._images.append(image)
+        return image
+
+    def _trim_images(self):
+        if self.max_images is None:
+            return
+        while len(self._images) > self.max_images:
+            image = self._images.pop(0)
+            image.dropped = True
+            self.blobs.release(image.blob_id)
+
+    def add_user_text(self, text: str):
+        self.messages.append(Message("user", (TextBlock(text),)))
+
+    def add_assistant(self, content: Iterable):
+        """Add a response's content blocks (SDK objects or dicts)"""
+        blocks = []
+        for block in content:
+            kind = getattr(block, "type", None) or block.get("type")
+            if kind == "text":
+                blocks.append(TextBlock(block.text if hasattr(block, "text") else block["text"]))
+            elif kind == "tool_use" and hasattr(block, "id"):
+                blocks.append(ToolUseBlock(block.id, block.name, block.input))
+            else:
+                blocks.append(self._block(block.model_dump() if hasattr(block, "model_dump") else block))
+        self.messages.append(Message("assistant", tuple(blocks)))
+
+    def tool_result(self, result, tool_use_id: str) -> ToolResultBlock:
+        """Build a tool result record from a scrapybara ToolResult"""
+        content = []
+        if result.output:
+            content.append(TextBlock(result.output))
+        # Errors keep their screenshot: it shows the state that made the call fail
+        if result.base64_image:
+            content.append(self._image(result.base64_image))
+        return ToolResultBlock(tool_use_id, tuple(content), error=result.error or None)
+
+    def add_tool_results(self, results: List[ToolResultBlock]):
+        self.messages.append(Message("user", tuple(results)))
+        self._trim_images()
+
+    def to_api(self) -> List[dict]:
+        """Serialize to the API message format; called right before each request"""
+        return [
+            {"role": message.role, "content": [block.to_api(self.blobs) for block in message.content]}
+            for message in self.messages
+        ]
+
+    def __len__(self) -> int:
+        return len(self.messages)
+
+    def memory_usage(self) -> dict:
+        """Approximate bytes held by records and by image blobs"""
+        records = 0
+        stack = list(self.messages)
+        while stack:
+            item = stack.pop()
+            records += sys.getsizeof(item)
+            if isinstance(item, Message):
+                stack.extend(item.content)
+            elif isinstance(item, ToolResultBlock):
+                stack.extend(item.content)
+                if item.error:
+                    records += sys.getsizeof(item.error)
+            elif isinstance(item, TextBlock):
+                records += sys.getsizeof(item.text)
+        return {
+            "messages": len(self.messages),
+            "images": len(self.blobs.blobs),
+            "records_bytes": records,
+            "blob_bytes": self.blobs.nbytes(),
+        }
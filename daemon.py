@@ -0,0 +1,349 @@
+"""Long-lived command daemon and the interactive shell that talks to it.
+
+scrapy.sh used to start a fresh `python3` for every script, re-importing the
+SDKs, rebuilding the clients and booting a new VM each time. The daemon keeps
+one process alive with the clients (and their HTTP connection pools) cached
+in clients.py, and optionally one pre-started instance. Commands are sent over
+a Unix socket as a single JSON line and their output is streamed back, so
+back-to-back jobs skip all of that startup.
+
+    python daemon.py serve [--warm medium]   # run the daemon in the foreground
+    python daemon.py submit research Anthropic
+    python daemon.py shell                   # what scrapy.sh runs
+"""
+import argparse
+import contextvars
+import json
+import os
+import shlex
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+SOCKET_PATH = os.getenv(
+    "SCRAPYBARA_DAEMON_SOCKET",
+    os.path.join(tempfile.gettempdir(), f"scrapybara-cli-{os.getuid()}.sock"),
+)
+
+# Colours used by scrapy.sh
+RESET = "\033[0m"
+GREEN = "\033[32m"
+YELLOW = "\033[33m"
+BLUE = "\033[34m"
+RED = "\033[31m"
+
+# A script is runnable by the daemon if it talks to Scrapybara
+COMPAT_MARKERS = ("from scrapybara import Scrapybara", "from clients import get_scrapybara")
+
+PROMPT = "₍ᐢ•ﻌ•ᐢ₎: "
+
+
+def list_and_check_files(directory: str = ".") -> str:
+    """List files in `directory`, marking which .py files are Scrapybara scripts"""
+    lines = [f"{BLUE}Listando archivos y verificando compatibilidad:{RESET}"]
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if not os.path.isfile(path):
+            continue
+        if name.endswith(".py"):
+            with open(path, encoding="utf-8", errors="ignore") as f:
+                source = f.read()
+            if any(marker in source for marker in COMPAT_MARKERS):
+                lines.append(f"{GREEN}[COMPATIBLE] {name}{RESET}")
+            else:
+                lines.append(f"{RED}[NO COMPATIBLE] {name}{RESET}")
+        else:
+            lines.append(f"{YELLOW}[OTRO ARCHIVO] {name}{RESET}")
+    return "\n".join(lines)
+
+
+# Output of each command is routed back to the client that submitted it.
+# asyncio tasks and asyncio.to_thread copy the context, so prints from deep
+# inside a session still find their way to the right socket.
+_sink = contextvars.ContextVar("sink", default=None)
+
+
+class _RoutedStream:
+    def __init__(self, real):
+        self.real = real
+
+    def write(self, text):
+        sink = _sink.get()
+        if sink is None:
+            return self.real.write(text)
+        sink(text)
+        return len(text)
+
+    def flush(self):
+        self.real.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.real, name)
+
+
+class Daemon:
+    def __init__(self, socket_path: str = SOCKET_PATH, warm: str = None):
+        self.socket_path = socket_path
+        self.warm = warm
+        self.jobs = {}
+        self.job_ids = 0
+        self.handlers = set()
+        self.started = time.time()
+
+    async def serve(self):
+        import asyncio
+
+        from browser_pool import close_context_pool
+        from scheduler import get_scheduler
+
+        self.scheduler = get_scheduler()
+        self.stopping = asyncio.Event()
+        sys.stdout = _RoutedStream(sys.stdout)
+        sys.stderr = _RoutedStream(sys.stderr)
+
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        server = await asyncio.start_unix_server(self._handle, path=self.socket_path)
+        os.chmod(self.socket_path, 0o600)
+        print(f"Daemon listening on {self.socket_path} (pid {os.getpid()})")
+
+        background = []
+        if self.warm:
+            background.append(asyncio.create_task(self._keep_warm(self.warm)))
+        try:
+            async with server:
+                await self.stopping.wait()
+            # Let running commands (including the `shutdown` itself) finish replying
+            await asyncio.gather(*self.handlers, return_exceptions=True)
+        finally:
+            for task in background:
+                task.cancel()
+            await close_context_pool()
+            for instances in self.scheduler.warm_instances.values():
+                while instances:
+                    await asyncio.to_thread(instances.pop().stop)
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+    async def _keep_warm(self, instance_type: str):
+        """Make sure one started instance of `instance_type` is always waiting"""
+        import asyncio
+
+        from clients import get_scrapybara
+
+        while True:
+            if not self.scheduler.warm_instances.get(instance_type):
+                try:
+                    instance = await asyncio.to_thread(get_scrapybara().start, instance_type=instance_type)
+                    self.scheduler.add_warm_instance(instance_type, instance)
+                    print(f"Warm {instance_type} instance ready: {instance.id}")
+                except Exception as e:
+                    print(f"Could not start warm instance: {e}")
+                    await asyncio.sleep(30)
+            await asyncio.sleep(2)
+
+    async def _handle(self, reader, writer):
+        import asyncio
+
+        task = asyncio.current_task()
+        self.handlers.add(task)
+        task.add_done_callback(self.handlers.discard)
+        try:
+            request = json.loads(await reader.readline())
+        except ValueError:
+            writer.close()
+            return
+
+        loop = asyncio.get_running_loop()
+        output = asyncio.Queue()
+
+        async def pump():
+            while True:
+                text = await output.get()
+                if text is None:
+                    break
+                writer.write(json.dumps({"out": text}).encode() + b"\n")
+                await writer.drain()
+
+        pump_task = asyncio.create_task(pump())
+        token = _sink.set(lambda text: loop.call_soon_threadsafe(output.put_nowait, text))
+        self.job_ids += 1
+        job_id = self.job_ids
+        self.jobs[job_id] = {"argv": request.get("argv", []), "started": time.time()}
+        try:
+            code = await self.execute(request.get("argv", []), request.get("cwd") or os.getcwd())
+        except SystemExit as e:
+            code = e.code if isinstance(e.code, int) else 1
+        except Exception as e:
+            print(f"{RED}Error: {type(e).__name__}: {e}{RESET}")
+            code = 1
+        finally:
+            _sink.reset(token)
+            del self.jobs[job_id]
+            loop.call_soon_threadsafe(output.put_nowait, None)
+
+        try:
+            await pump_task
+            writer.write(json.dumps({"exit": code}).encode() + b"\n")
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def execute(self, argv: list, cwd: str) -> int:
+        import asyncio
+
+        if not argv:
+            return 0
+        if argv == ["ls"]:
+            print(list_and_check_files(cwd))
+            return 0
+        if argv == ["status"]:
+            print(f"Up {time.time() - self.started:.0f}s, pid {os.getpid()}")
+            for job_id, job in self.jobs.items():
+                print(f"  job {job_id}: {' '.join(job['argv'])} ({time.time() - job['started']:.0f}s)")
+            for instance_type, instances in self.scheduler.warm_instances.items():
+                print(f"  warm {instance_type}: {len(instances)}")
+            from browser_pool import get_context_pool
+
+            for context_id, entry in get_context_pool().contexts.items():
+                if entry.instance:
+                    print(f"  browser context {context_id}: {entry.instance.id}, {entry.uses} sessions")
+            from clients import pool_stats
+
+            http = pool_stats()
+            if http:
+                print(f"  http pool: {http['open_connections']} open ({http['active_connections']} active), "
+                      f"{http['requests']} requests, reuse {http['reuse_ratio']}, http2 {http['http2']}")
+            return 0
+        if argv == ["shutdown"]:
+            print("Shutting down daemon")
+            self.stopping.set()
+            return 0
+        if argv[0].endswith(".py"):
+            import runpy
+
+            path = os.path.join(cwd, argv[0])
+            if not os.path.isfile(path):
+                print(f"{RED}El archivo {argv[0]} no existe.{RESET}")
+                return 1
+            print(f"{BLUE}Ejecutando archivo Python: {argv[0]}{RESET}")
+            # Scripts call asyncio.run() themselves, so give them their own thread
+            await asyncio.to_thread(runpy.run_path, path, run_name="__main__")
+            return 0
+
+        import cli
+
+        args = cli.build_parser().parse_args(argv)
+        result = await asyncio.to_thread(args.func, args)
+        if hasattr(result, "__await__"):
+            result = await result
+        return result or 0
+
+
+def submit(argv: list, socket_path: str = SOCKET_PATH) -> int:
+    """Send a command to the daemon and stream its output; returns the exit code"""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        sock.sendall(json.dumps({"argv": argv, "cwd": os.getcwd()}).encode() + b"\n")
+        with sock.makefile("r", encoding="utf-8") as stream:
+            for line in stream:
+                message = json.loads(line)
+                if "out" in message:
+                    sys.stdout.write(message["out"])
+                    sys.stdout.flush()
+                elif "exit" in message:
+                    return message["exit"]
+    return 1
+
+
+def is_running(socket_path: str = SOCKET_PATH) -> bool:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(socket_path)
+            return True
+        except OSError:
+            return False
+
+
+def ensure_daemon(socket_path: str = SOCKET_PATH, warm: str = None, timeout: float = 30.0):
+    """Start the daemon in the background unless one is already listening"""
+    if is_running(socket_path):
+        return
+    command = [sys.executable, os.path.abspath(__file__), "--socket", socket_path, "serve"]
+    if warm:
+        command += ["--warm", warm]
+    log = open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "daemon.log"), "a")
+    subprocess.Popen(command, stdout=log, stderr=log, stdin=subprocess.DEVNULL, start_new_session=True)
+    deadline = time.monotonic() + timeout
+    while not is_running(socket_path):
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"Daemon did not start listening on {socket_path}")
+        time.sleep(0.05)
+
+
+def repl(socket_path: str = SOCKET_PATH, warm: str = None) -> int:
+    """Interactive prompt: daemon commands go over the socket, anything else to the shell"""
+    import cli
+
+    daemon_commands = ({"ls", "status", "shutdown"} | set(cli.build_parser().commands)) - {"shell"}
+    ensure_daemon(socket_path, warm)
+
+    while True:
+        try:
+            command = input(PROMPT).strip()
+        except (EOFError, KeyboardInterrupt):
+            command = "exit"
+        if not command:
+            continue
+        if command == "exit":
+            print(f"{BLUE}Saliendo...{RESET}")
+            return 0
+
+        argv = shlex.split(command)
+        if argv[0] in ("python", "python3") and len(argv) > 1 and argv[1].endswith(".py"):
+            argv = argv[1:]
+        if argv[0] in daemon_commands or argv[0].endswith(".py"):
+            try:
+                code = submit(argv, socket_path)
+            except OSError:
+                # Daemon went away (e.g. after `shutdown`); bring it back
+                ensure_daemon(socket_path, warm)
+                code = submit(argv, socket_path)
+        else:
+            code = subprocess.call(command, shell=True)
+        if code:
+            print(f"{RED}Error al ejecutar el comando: {command}{RESET}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Warm-client daemon for the research scripts")
+    parser.add_argument("--socket", default=SOCKET_PATH)
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("serve")
+    p.add_argument("--warm", metavar="INSTANCE_TYPE")
+    p = sub.add_parser("shell")
+    p.add_argument("--warm", metavar="INSTANCE_TYPE")
+    p = sub.add_parser("submit")
+    p.add_argument("argv", nargs=argparse.REMAINDER)
+    sub.add_parser("stop")
+    args, extra = parser.parse_known_args(argv)
+
+    if args.command == "serve":
+        import asyncio
+
+        asyncio.run(Daemon(args.socket, warm=args.warm).serve())
+        return 0
+    if args.command == "shell":
+        return repl(args.socket, warm=args.warm)
+    if args.command == "stop":
+        return submit(["shutdown"], args.socket) if is_running(args.socket) else 0
+    ensure_daemon(args.socket)
+    return submit(args.argv + extra, args.socket)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
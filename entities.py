@@ -0,0 +1,320 @@
+"""Collapse near-duplicate targets into one entity before launching sessions.
+
+Target lists are free text: "Acme" and "Acme, Inc.", "acme.com" and "Acme
+Inc", the GitHub org "anthropics" and the company "Anthropic". Each of those
+used to get its own VM session. `resolve()` builds an index over the targets
+and groups the ones that name the same entity:
+
+- domains are canonicalized (scheme, www., path and port dropped), and a
+  name that is itself a domain counts as one;
+- names are normalized (case, punctuation, spacing and legal suffixes like
+  Inc, LLC, GmbH), and a domain's first label counts as a name ("acme.com" ->
+  "acme"). Descriptive words are part of the name: "Delta Labs" and "Delta
+  Systems" only merge if a domain or GitHub handle says they're the same, and
+  a generic name keeps its suffix, so "Global Inc" isn't "Global";
+- a name that is another target's name plus descriptive words ("TechCorp
+  Solutions" next to "TechCorp" or "techcorp.com") merges with it, unless the
+  same base name also appears with other descriptive words ("TechCorp Labs"),
+  which leaves it unclear which one the bare name means;
+- GitHub handles come from github/username fields, github.com URLs and an
+  optional name -> handle map;
+- remaining names are matched fuzzily, conservatively: long names only,
+  never when their digits differ, and never across two different known
+  domains.
+
+Each group becomes one `Entity` whose target merges its members' fields and
+lists the other names as `aliases`. `fan_out()` copies each entity's result
+back to every alias, so every input still gets an answer.
+
+    python entities.py sales targets.jsonl [--handles handles.json]   # show what would be merged
+"""
+import argparse
+import difflib
+import json
+import re
+import sys
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+from urllib.parse import urlsplit
+
+FUZZY_THRESHOLD = 0.93
+FUZZY_MIN_LENGTH = 6
+FUZZY_WINDOW = 8
+# Legal forms only: "Acme Software" and "Acme Group" are different companies
+SUFFIXES = {
+    "inc", "incorporated", "llc", "llp", "lp", "ltd", "limited", "corp", "corporation", "co", "company", "gmbh",
+    "ag", "sa", "sas", "srl", "nv", "plc", "pty", "bv", "oy", "ab", "kk",
+}
+# Names that are just a descriptive word keep their legal suffix, or every "Global <form>" would merge
+GENERIC_NAMES = {
+    "solutions", "technologies", "technology", "software", "systems", "labs", "group", "holdings", "global",
+    "international", "partners", "ventures", "capital", "consulting", "services", "digital", "media", "hq",
+}
+DOMAIN_RE = re.compile(r"^(?:https?://)?(?:www\.)?(?:[a-z0-9-]+\.)+[a-z]{2,}(?::\d+)?(?:/.*)?$", re.IGNORECASE)
+# Multi-part public suffixes, so "acme.co.uk" has the stem "acme"
+SECOND_LEVEL = {"co", "com", "org", "net", "ac", "gov", "edu"}
+
+
+def canonical_domain(value: str) -> Optional[str]:
+    """"https://www.Acme.com/pricing" -> "acme.com"; None if `value` isn't a domain or URL"""
+    value = (value or "").strip()
+    if not DOMAIN_RE.match(value):
+        return None
+    host = urlsplit(value if "://" in value else f"https://{value}").hostname or ""
+    return host.removeprefix("www.") or None
+
+
+def domain_stem(domain: str) -> str:
+    labels = domain.split(".")
+    if len(labels) >= 3 and labels[-2] in SECOND_LEVEL and len(labels[-1]) == 2:
+        return labels[-3]
+    return labels[-2] if len(labels) >= 2 else labels[0]
+
+
+def github_handle(value: str) -> Optional[str]:
+    """"@Anthropics", "github.com/anthropics/x" -> "anthropics" """
+    value = (value or "").strip()
+    if "github.com" in value.lower():
+        path = urlsplit(value if "://" in value else f"https://{value}").path
+        parts = [p for p in path.split("/") if p]
+        return parts[0].lower() if parts else None
+    value = value.lstrip("@")
+    return value.lower() if re.fullmatch(r"[A-Za-z0-9](?:[A-Za-z0-9-]{0,38})", value) else None
+
+
+def _words(name: str) -> List[str]:
+    words = re.sub(r"[^a-z0-9]+", " ", (name or "").lower()).split()
+    if words and words[0] == "the" and len(words) > 1:
+        words = words[1:]
+    return words
+
+
+def normalize_name(name: str) -> str:
+    """"The TechCorp Solutions, Inc." -> "techcorpsolutions" (spaces dropped too)"""
+    words = _words(name)
+    stripped = list(words)
+    while len(stripped) > 1 and stripped[-1] in SUFFIXES:
+        stripped.pop()
+    if len(stripped) == 1 and stripped[0] in GENERIC_NAMES:
+        return "".join(words)
+    return "".join(stripped)
+
+
+def descriptor_base(name: str) -> Optional[str]:
+    """"TechCorp Solutions, Inc." -> "techcorp"; None if the name doesn't end in descriptive words"""
+    words = _words(name)
+    while len(words) > 1 and words[-1] in SUFFIXES:
+        words.pop()
+    base = list(words)
+    while len(base) > 1 and base[-1] in GENERIC_NAMES:
+        base.pop()
+    if len(base) == len(words) or base[-1] in GENERIC_NAMES or len("".join(base)) < 3:
+        return None
+    return "".join(base)
+
+
+class Entity(NamedTuple):
+    key: str
+    target: dict
+    members: List[dict]
+    aliases: List[str]
+    reasons: List[str]
+
+
+class _UnionFind:
+    """Groups of target indices, with the known domains of each group"""
+
+    def __init__(self, n: int):
+        self.parent = list(range(n))
+        self.domains: List[set] = [set() for _ in range(n)]
+
+    def find(self, i: int) -> int:
+        while self.parent[i] != i:
+            self.parent[i] = self.parent[self.parent[i]]
+            i = self.parent[i]
+        return i
+
+    def compatible(self, a: int, b: int) -> bool:
+        """Two groups can merge unless they have different known domains"""
+        known_a, known_b = self.domains[self.find(a)], self.domains[self.find(b)]
+        return not known_a or not known_b or bool(known_a & known_b)
+
+    def union(self, a: int, b: int) -> bool:
+        a, b = self.find(a), self.find(b)
+        if a == b:
+            return False
+        # The earliest target stays the representative
+        root, child = min(a, b), max(a, b)
+        self.parent[child] = root
+        self.domains[root] |= self.domains[child]
+        return True
+
+
+def _similar(a: str, b: str, threshold: float) -> bool:
+    # Ratio can't reach the threshold if the lengths are too far apart
+    if 2 * min(len(a), len(b)) / (len(a) + len(b)) < threshold:
+        return False
+    # "Company 12" and "Company 13" are different companies
+    if re.sub(r"\D", "", a) != re.sub(r"\D", "", b):
+        return False
+    matcher = difflib.SequenceMatcher(None, a, b)
+    return matcher.quick_ratio() >= threshold and matcher.ratio() >= threshold
+
+
+def _merge(members: List[dict]) -> dict:
+    """The first member's fields, filled in and extended from the others"""
+    merged = dict(members[0])
+    for member in members[1:]:
+        for field, value in member.items():
+            current = merged.get(field)
+            if current in (None, "", []):
+                merged[field] = value
+            elif isinstance(current, list) and isinstance(value, list):
+                merged[field] = list(dict.fromkeys(current + value))
+            elif field in ("notes", "description") and isinstance(value, str) and value and value not in current:
+                merged[field] = f"{current}; {value}"
+    return merged
+
+
+def resolve(
+    targets: List[dict],
+    name_field: str = "name",
+    fuzzy: bool = True,
+    handles: Optional[Dict[str, str]] = None,
+    threshold: float = FUZZY_THRESHOLD,
+    normalize: bool = True,
+) -> List[Entity]:
+    """Group targets that name the same entity, in first-seen order.
+
+    Targets merge on the same canonical domain, GitHub handle or normalized
+    name. A name that is another's plus descriptive words also merges:
+    "TechCorp Solutions" with "TechCorp" (or "techcorp.com"), but not when
+    "TechCorp Labs" is in the list too, and never "Delta Labs" with "Delta
+    Systems". Fuzzy matches come last. Nothing merges across two different
+    known domains.
+
+    With `normalize=False` only identical names (ignoring case) are grouped,
+    for targets that aren't entities, like coding tasks.
+    """
+    handle_map = {normalize_name(name): handle.lower() for name, handle in (handles or {}).items()}
+    union = _UnionFind(len(targets))
+    reasons: Dict[int, List[str]] = {}
+    owners: Dict[str, int] = {}
+    names: List[str] = []
+    # Base name -> its descriptive variants -> the targets using them
+    bases: Dict[str, Dict[str, List[int]]] = {}
+
+    for i, target in enumerate(targets):
+        name = str(target.get(name_field) or "")
+        if not normalize:
+            owner = owners.setdefault(name.strip().lower(), i)
+            if owner != i:
+                union.union(owner, i)
+                reasons.setdefault(i, []).append("same name")
+            names.append("")
+            continue
+        domain = canonical_domain(target.get("website") or "") or canonical_domain(name)
+        handle = (github_handle(target.get("github") or "") or github_handle(target.get("username") or "")
+                  or (github_handle(target.get("website") or "") if "github.com" in str(target.get("website")) else None))
+        normalized = normalize_name(domain_stem(domain) if canonical_domain(name) else name)
+        handle = handle or handle_map.get(normalized)
+        names.append(normalized)
+        base = None if canonical_domain(name) else descriptor_base(name)
+        if base:
+            bases.setdefault(base, {}).setdefault(normalized, []).append(i)
+        if domain and domain.endswith("github.com"):
+            domain = None
+
+        keys = [f"name:{normalized}"] if normalized else []
+        if domain:
+            union.domains[i].add(domain)
+            keys += [f"domain:{domain}", f"name:{normalize_name(domain_stem(domain))}"]
+        if handle:
+            keys += [f"github:{handle}", f"name:{normalize_name(handle)}"]
+        for key in dict.fromkeys(keys):
+            owner = owners.setdefault(key, i)
+            if owner != i and union.compatible(owner, i) and union.union(owner, i):
+                reasons.setdefault(i, []).append(f"same {key.split(':')[0]} {key.split(':', 1)[1]!r}")
+
+    for base, variants in bases.items():
+        owner = owners.get(f"name:{base}")
+        if owner is None or len(variants) > 1:
+            continue
+        for i in next(iter(variants.values())):
+            if union.compatible(owner, i) and union.union(owner, i):
+                reasons.setdefault(max(owner, i), []).append(f"{names[i]!r} is {base!r} with descriptive words")
+
+    if fuzzy:
+        # Sorted neighbourhood: near-identical names sort next to each other, forwards or (for a
+        # difference near the start) reversed, so each name is only compared with a few others
+        candidates = [i for i, name in enumerate(names) if len(name) >= FUZZY_MIN_LENGTH]
+        for order in (sorted(candidates, key=lambda i: names[i]), sorted(candidates, key=lambda i: names[i][::-1])):
+            for position, a in enumerate(order):
+                for b in order[position + 1:position + 1 + FUZZY_WINDOW]:
+                    first, second = sorted((a, b))
+                    if not _similar(names[first], names[second], threshold) or not union.compatible(a, b):
+                        continue
+                    if union.union(a, b):
+                        ratio = difflib.SequenceMatcher(None, names[first], names[second]).ratio()
+                        reasons.setdefault(second, []).append(f"similar name to {names[first]!r} ({ratio:.2f})")
+
+    groups: Dict[int, List[int]] = {}
+    for i in range(len(targets)):
+        groups.setdefault(union.find(i), []).append(i)
+    entities = []
+    for root, indices in sorted(groups.items()):
+        members = [targets[i] for i in indices]
+        merged = _merge(members)
+        primary = str(members[0].get(name_field) or "")
+        aliases = list(dict.fromkeys(str(m.get(name_field)) for m in members[1:] if str(m.get(name_field)) != primary))
+        if aliases:
+            merged["aliases"] = aliases
+        entities.append(Entity(
+            key=primary.strip().lower(),
+            target=merged,
+            members=members,
+            aliases=aliases,
+            reasons=[reason for i in indices for reason in reasons.get(i, [])],
+        ))
+    return entities
+
+
+def fan_out(entities: List[Entity], results: Dict[str, Any], key: Callable[[dict], str]) -> Dict[str, Any]:
+    """Copy each entity's result (by its key) to every member's key"""
+    fanned = {}
+    for entity in entities:
+        if entity.key not in results:
+            continue
+        for member in entity.members:
+            fanned[key(member)] = results[entity.key]
+    return fanned
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Show which targets would be researched as one entity")
+    parser.add_argument("job")
+    parser.add_argument("targets")
+    parser.add_argument("--handles", help="JSON object mapping company names to GitHub handles")
+    parser.add_argument("--output", help="Write the resolved targets (one per entity) as JSONL")
+    args = parser.parse_args(argv)
+
+    from batch_runner import load_targets, resolve_targets
+
+    targets = load_targets(args.targets)
+    handles = None
+    if args.handles:
+        with open(args.handles, encoding="utf-8") as f:
+            handles = json.load(f)
+    entities = resolve_targets(args.job, targets, handles)
+    for entity in entities:
+        if entity.aliases:
+            print(f"{entity.key}: also {', '.join(entity.aliases)} ({'; '.join(entity.reasons)})")
+    print(f"{len(targets)} targets -> {len(entities)} entities")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            for entity in entities:
+                f.write(json.dumps(entity.target) + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
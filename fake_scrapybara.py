@@ -0,0 +1,381 @@
+"""Local stand-ins for the Scrapybara and Anthropic clients, for load tests.
+
+`FakeScrapybara` implements the part of the Scrapybara SDK the scripts use:
+`start` / `instance.stop`, `browser.start` / `authenticate` / `stop`,
+`agent.scrape`, `code.execute` and the `computer`, `bash` and `edit`
+endpoints behind ComputerTool, BashTool and EditTool. `FakeAnthropic` plays a
+scripted agent that browses, clicks, runs bash and finishes after a set
+number of turns, and answers message batches (postprocess.py) with canned
+findings. Neither client touches the network.
+
+Every endpoint sleeps for a sample from a configurable latency distribution
+(scaled by `scale` so hundreds of sessions fit in a minute) and can fail at a
+configured rate with a retryable 429/503-style error. Screenshots are canned
+PNGs from a directory or synthetic noise of a given size, made unique per
+call so memory behaves as it does with real screenshots.
+
+With SCRAPYBARA_FAKE set, `clients.get_scrapybara` / `get_anthropic` return
+these instead of the SDK clients, so the unchanged session scripts, the
+batch runner and the daemon all run against them. The value is a spec:
+
+    SCRAPYBARA_FAKE="scale=0.01;model=lognormal:6,0.5;computer=lognormal:1.5,0.4;fail.model=0.02;turns=8-20"
+
+Latencies are in seconds of simulated time: `fixed:S`, `uniform:LO,HI` or
+`lognormal:MEDIAN,SIGMA`. See loadtest.py for the driver.
+"""
+import base64
+import binascii
+import itertools
+import json
+import math
+import os
+import random
+import re
+import struct
+import threading
+import time
+import zlib
+from typing import Dict, List, Optional
+
+DEFAULTS = {
+    "scale": "1",
+    "seed": "",
+    "turns": "8-20",
+    "screenshot_kb": "300",
+    "screenshots": "",
+    # Simulated seconds per call
+    "model": "lognormal:6,0.5",
+    "start": "lognormal:20,0.3",
+    "stop": "lognormal:2,0.3",
+    "browser": "lognormal:3,0.3",
+    "computer": "lognormal:1.5,0.4",
+    "bash": "lognormal:0.8,0.5",
+    "edit": "lognormal:0.5,0.3",
+    "scrape": "lognormal:30,0.5",
+    "code": "lognormal:2,0.6",
+}
+ENDPOINTS = ("model", "start", "stop", "browser", "computer", "bash", "edit", "scrape", "code")
+
+
+class FakeAPIError(Exception):
+    """Shaped like the SDK errors the scheduler knows how to retry"""
+
+    def __init__(self, status_code: int, endpoint: str, retry_after: float = 0.0):
+        super().__init__(f"fake {endpoint} error {status_code}")
+        self.status_code = status_code
+        self.response = _Response(headers={"retry-after": str(retry_after)} if retry_after else {})
+
+
+class _Response(dict):
+    """Dict with attribute access, since SDK responses are used both ways"""
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return self.get(name)
+
+
+def parse_spec(spec: str) -> Dict[str, str]:
+    config = dict(DEFAULTS)
+    for part in (spec or "").split(";"):
+        if "=" in part:
+            key, value = part.split("=", 1)
+            config[key.strip()] = value.strip()
+    return config
+
+
+class Simulator:
+    """Latency sampling and failure injection shared by the fake clients"""
+
+    def __init__(self, config: Dict[str, str]):
+        self.config = config
+        self.scale = float(config["scale"])
+        self.rng = random.Random(config["seed"] or None)
+        self.lock = threading.Lock()
+        self.calls = {endpoint: 0 for endpoint in ENDPOINTS}
+        self.failures = {endpoint: 0 for endpoint in ENDPOINTS}
+        self.screenshots = Screenshots(config["screenshots"], int(config["screenshot_kb"]) * 1024)
+
+    @classmethod
+    def from_spec(cls, spec: str) -> "Simulator":
+        return cls(parse_spec(spec))
+
+    def sample(self, endpoint: str) -> float:
+        kind, _, params = self.config[endpoint].partition(":")
+        values = [float(v) for v in params.split(",") if v]
+        with self.lock:
+            if kind == "fixed":
+                return values[0]
+            if kind == "uniform":
+                return self.rng.uniform(values[0], values[1])
+            if kind == "lognormal":
+                return self.rng.lognormvariate(math.log(values[0]), values[1])
+        raise ValueError(f"Unknown latency distribution '{self.config[endpoint]}' for {endpoint}")
+
+    def call(self, endpoint: str):
+        """Sleep for one sampled latency, then maybe fail"""
+        time.sleep(self.sample(endpoint) * self.scale)
+        with self.lock:
+            self.calls[endpoint] += 1
+            fail = self.rng.random() < float(self.config.get(f"fail.{endpoint}", 0))
+            if fail:
+                self.failures[endpoint] += 1
+        if fail:
+            status = 429 if endpoint == "model" else 503
+            raise FakeAPIError(status, endpoint, retry_after=round(2 * self.scale, 3) if status == 429 else 0.0)
+
+    def stats(self) -> dict:
+        return {"calls": dict(self.calls), "failures": dict(self.failures)}
+
+
+class Screenshots:
+    """Canned PNGs from a directory, or synthetic noise; each call returns a unique payload"""
+
+    def __init__(self, directory: str, size: int):
+        self.counter = itertools.count()
+        if directory:
+            names = sorted(n for n in os.listdir(directory) if n.endswith(".png"))
+            self.images = [open(os.path.join(directory, n), "rb").read() for n in names]
+        else:
+            self.images = [self._noise_png(size, seed) for seed in range(4)]
+
+    @staticmethod
+    def _chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+    def _noise_png(self, size: int, seed: int) -> bytes:
+        # Random gray pixels don't compress, so the PNG is about `size` bytes
+        width = 1024
+        height = max(1, size // (width + 1))
+        noise = random.Random(seed).randbytes(width * height)
+        rows = b"".join(b"\x00" + noise[y * width:(y + 1) * width] for y in range(height))
+        header = struct.pack(">IIBBBBB", width, height, 8, 0, 0, 0, 0)
+        return b"\x89PNG\r\n\x1a\n" + self._chunk(b"IHDR", header) + self._chunk(b"IDAT", zlib.compress(rows, 0)) + self._chunk(b"IEND", b"")
+
+    def next(self) -> str:
+        n = next(self.counter)
+        image = self.images[n % len(self.images)]
+        # A text chunk before IEND makes every screenshot distinct without breaking the PNG
+        unique = image[:-12] + self._chunk(b"tEXt", b"shot\x00" + str(n).encode()) + image[-12:]
+        return binascii.b2a_base64(unique, newline=False).decode("ascii")
+
+
+def _fake_data(schema, i: int = 0):
+    if isinstance(schema, str):
+        return {"int": i, "float": float(i), "bool": i % 2 == 0}.get(schema, f"Item {i}")
+    if isinstance(schema, list):
+        return [_fake_data(schema[0], j) for j in range(3 + i % 8)]
+    if isinstance(schema, dict):
+        return {key: _fake_data(sub, i) for key, sub in schema.items()}
+    return None
+
+
+class _Browser:
+    def __init__(self, instance):
+        self.instance = instance
+
+    def start(self, **kwargs):
+        self.instance.sim.call("browser")
+        return _Response(cdp_url=f"ws://fake/{self.instance.id}/devtools")
+
+    def authenticate(self, context_id: str, **kwargs):
+        self.instance.sim.call("browser")
+        self.instance.auth_context = context_id
+        return _Response(status="authenticated")
+
+    def stop(self, **kwargs):
+        return _Response(status="stopped")
+
+
+class _Agent:
+    def __init__(self, instance):
+        self.instance = instance
+
+    def scrape(self, cmd: str, schema: Optional[dict] = None, **kwargs):
+        self.instance.sim.call("scrape")
+        return _Response(data=_fake_data(schema or {"result": "str"}))
+
+
+class _Code:
+    def __init__(self, instance):
+        self.instance = instance
+
+    async def execute(self, code: str, timeout: int = 30, kernel_name: str = "python3", **kwargs):
+        import asyncio
+
+        await asyncio.to_thread(self.instance.sim.call, "code")
+        return {"outputs": [{"type": "stream", "name": "stdout", "text": f"ran {len(code)} chars\n"}]}
+
+
+class FakeInstance:
+    _ids = itertools.count(1)
+
+    def __init__(self, sim: Simulator, instance_type: str):
+        self.sim = sim
+        self.id = f"fake-{instance_type}-{next(self._ids)}"
+        self.instance_type = instance_type
+        self.auth_context = None
+        self.browser = _Browser(self)
+        self.agent = _Agent(self)
+        self.code = _Code(self)
+        self.stopped = False
+
+    def stop(self, **kwargs):
+        self.sim.call("stop")
+        self.stopped = True
+        return _Response(status="stopped")
+
+    def computer(self, action: str, **kwargs):
+        self.sim.call("computer")
+        return _Response(output=None if action == "screenshot" else f"{action} done", error=None, base64_image=self.sim.screenshots.next())
+
+    def bash(self, command: str = "", **kwargs):
+        self.sim.call("bash")
+        if "FILE_OPS_EOF" in command:
+            # Answer file_ops batches the way the VM script would
+            payload = re.search(r"PAYLOAD = '([^']*)'", command).group(1)
+            ops = json.loads(base64.b64decode(payload))
+            results = [{"op": op["op"], "path": op["path"], "status": "unchanged" if "sha" in op else "created"} for op in ops]
+            return _Response(output=json.dumps(results), error=None, base64_image=None)
+        # The browser pool's reset and cookie copy (browser_pool.py)
+        if "CONTEXT_RESET_EOF" in command:
+            return _Response(output=json.dumps({"restarted": self.auth_context is None, "closed": 1}), error=None,
+                             base64_image=None)
+        if "CONTEXT_COOKIES_EOF" in command:
+            return _Response(output=json.dumps({"cookies": 3}), error=None, base64_image=None)
+        echoed = re.findall(r"echo (\w+)", command)
+        return _Response(output=f"{echoed[-1]}\n" if echoed else "", error=None, base64_image=None)
+
+    def edit(self, command: str = "view", path: str = "", **kwargs):
+        self.sim.call("edit")
+        return _Response(output=f"{command} {path}: ok", error=None, base64_image=None)
+
+
+class FakeScrapybara:
+    def __init__(self, sim: Simulator):
+        self.sim = sim
+        self.instances: List[FakeInstance] = []
+
+    def start(self, instance_type: str = "medium", **kwargs) -> FakeInstance:
+        self.sim.call("start")
+        instance = FakeInstance(self.sim, instance_type)
+        self.instances.append(instance)
+        return instance
+
+
+class _Block(_Response):
+    def model_dump(self) -> dict:
+        return dict(self)
+
+
+class _Messages:
+    # One scripted step per turn, cycled; the last turn just reports back
+    STEPS = (
+        [("computer", {"action": "screenshot"})],
+        [("computer", {"action": "type", "text": "https://example.com\n"})],
+        [("computer", {"action": "key", "text": "Return"})],
+        [("computer", {"action": "screenshot"})],
+        [("computer", {"action": "scroll", "coordinate": [512, 400], "direction": "down"})],
+        [("computer", {"action": "left_click", "coordinate": [300, 200]})],
+        [("bash", {"command": "ls ~/Documents"})],
+        [("str_replace_editor", {"command": "create", "path": "/root/Documents/notes.md", "file_text": "notes"})],
+    )
+
+    def __init__(self, sim: Simulator):
+        self.sim = sim
+        low, _, high = sim.config["turns"].partition("-")
+        self.turns = (int(low), int(high or low))
+        self.ids = itertools.count(1)
+        self.batches = _Batches(sim)
+
+    def create(self, *, messages: List[dict], max_tokens: int = 4096, **kwargs):
+        from scheduler import estimate_input_tokens
+
+        self.sim.call("model")
+        turn = 1 + sum(1 for m in messages if m["role"] == "assistant")
+        # The session length is fixed by its first prompt, so retries and re-asks agree
+        first = json.dumps(messages[0]["content"][:1], default=str)[:200] if messages else ""
+        total = self.turns[0] + zlib.crc32(first.encode()) % (self.turns[1] - self.turns[0] + 1)
+        if turn >= total:
+            content = [_Block(type="text", text="All done; the findings are saved in Documents.")]
+            stop_reason = "end_turn"
+        else:
+            content = [_Block(type="text", text=f"Step {turn}.")]
+            for name, tool_input in self.STEPS[(turn - 1) % len(self.STEPS)]:
+                content.append(_Block(type="tool_use", id=f"toolu_fake_{next(self.ids)}", name=name, input=dict(tool_input)))
+            stop_reason = "tool_use"
+        usage = _Response(input_tokens=estimate_input_tokens(messages, kwargs.get("system")), output_tokens=min(max_tokens, 40 + 30 * len(content)))
+        return _Response(content=content, stop_reason=stop_reason, usage=usage, model=kwargs.get("model"))
+
+
+class _Batches:
+    """Message Batches stand-in: requests are answered one by one in a background thread.
+
+    Each reply is a findings-shaped JSON object with a table row per
+    `<item name="...">` in the request, so callers can check what was covered.
+    """
+
+    def __init__(self, sim: Simulator):
+        self.sim = sim
+        self.ids = itertools.count(1)
+        self.batches: Dict[str, dict] = {}
+
+    def _answer(self, request: dict) -> dict:
+        try:
+            self.sim.call("model")
+        except FakeAPIError as e:
+            return _Response(type="errored", error=_Response(type="api_error", message=str(e)))
+        text = request["params"]["messages"][-1]["content"]
+        names = re.findall(r'<item name="([^"]*)">', text)
+        findings = {
+            "title": f"Summary of {len(names)} items",
+            "summary": f"Fake summary of {len(names)} items ({len(text)} characters).",
+            "sections": [{"heading": "Overview", "content": "Generated by the local batch stand-in."}],
+            "tables": [{"name": "Ranking", "columns": ["Rank", "Name", "Score", "Reason"],
+                        "rows": [[i + 1, name, zlib.crc32(name.encode()) % 101, "fake"] for i, name in enumerate(names)]}],
+        }
+        usage = _Response(input_tokens=len(text) // 4, output_tokens=200)
+        message = _Response(content=[_Block(type="text", text=json.dumps(findings))], stop_reason="end_turn", usage=usage)
+        return _Response(type="succeeded", message=message)
+
+    def _process(self, batch: dict, requests: List[dict]):
+        for request in requests:
+            batch["results"].append(_Response(custom_id=request["custom_id"], result=self._answer(request)))
+        batch["status"] = "ended"
+
+    def create(self, *, requests: List[dict], **kwargs):
+        batch_id = f"msgbatch_fake_{next(self.ids)}"
+        batch = {"status": "in_progress", "results": [], "total": len(requests)}
+        self.batches[batch_id] = batch
+        threading.Thread(target=self._process, args=(batch, list(requests)), daemon=True).start()
+        return self.retrieve(batch_id)
+
+    def retrieve(self, batch_id: str):
+        batch = self.batches[batch_id]
+        counts = _Response(processing=batch["total"] - len(batch["results"]),
+                           succeeded=sum(1 for r in batch["results"] if r.result.type == "succeeded"),
+                           errored=sum(1 for r in batch["results"] if r.result.type == "errored"))
+        return _Response(id=batch_id, processing_status=batch["status"], request_counts=counts)
+
+    def results(self, batch_id: str):
+        return iter(list(self.batches[batch_id]["results"]))
+
+
+class FakeAnthropic:
+    def __init__(self, sim: Simulator):
+        self.sim = sim
+        # Laid out like anthropic 0.39: messages and batches both live under `beta`
+        self.beta = _Response(messages=_Messages(sim))
+
+
+_simulator: Optional[Simulator] = None
+_simulator_lock = threading.Lock()
+
+
+def get_simulator(spec: Optional[str] = None) -> Simulator:
+    """The process-wide simulator configured by SCRAPYBARA_FAKE"""
+    global _simulator
+    with _simulator_lock:
+        if _simulator is None:
+            _simulator = Simulator.from_spec(spec if spec is not None else os.getenv("SCRAPYBARA_FAKE", ""))
+        return _simulator
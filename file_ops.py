@@ -0,0 +1,197 @@
+"""Batched file operations in one VM round trip.
+
+Writing notes, spreadsheets' CSV sources and code files through the edit and
+bash tools costs one round trip per file. `FileOpsTool` takes a list of
+create / write / append / mkdir / read operations, ships them to the VM as a
+single bash call running a small Python script, and returns one result per
+operation.
+
+Writes are diffed against what is on disk: an identical file is left alone
+and reported as unchanged, a changed one reports its +/- line counts. The
+tool also remembers the hash of every file it wrote or read this session and
+sends only the hash when the model rewrites a file with the same content; if
+the file changed on the VM in the meantime, that operation is resent in full.
+"""
+import asyncio
+import base64
+import hashlib
+import json
+from typing import Any, Dict, List
+
+from scrapybara.anthropic import ToolResult
+
+from progress_log import log_event
+
+OPS = ("create", "write", "append", "mkdir", "read")
+MAX_READ_CHARS = 20000
+
+# Runs in the VM after a `PAYLOAD = ...` line; prints one JSON result per op
+VM_SCRIPT = r'''
+import base64, difflib, hashlib, json, os
+ops = json.loads(base64.b64decode(PAYLOAD))
+home = os.path.expanduser("~")
+results = []
+for op in ops:
+    kind, path = op["op"], op.get("path", "")
+    full = os.path.join(home, os.path.expanduser(path))
+    result = {"op": kind, "path": path}
+    try:
+        if kind == "mkdir":
+            result["status"] = "exists" if os.path.isdir(full) else "created"
+            os.makedirs(full, exist_ok=True)
+        elif kind == "read":
+            with open(full, encoding="utf-8", errors="replace") as f:
+                text = f.read()
+            result.update(status="read", content=text[:op["max_chars"]], truncated=len(text) > op["max_chars"],
+                          sha=hashlib.sha256(text.encode()).hexdigest())
+        elif kind == "append":
+            os.makedirs(os.path.dirname(full) or ".", exist_ok=True)
+            with open(full, "a", encoding="utf-8") as f:
+                f.write(op["content"])
+            result.update(status="appended", bytes=len(op["content"].encode()))
+        else:
+            old = None
+            if os.path.exists(full):
+                with open(full, encoding="utf-8", errors="replace") as f:
+                    old = f.read()
+            if "content" not in op:
+                # Hash-only op: valid only if the file still has that content
+                if old is not None and hashlib.sha256(old.encode()).hexdigest() == op["sha"]:
+                    result["status"] = "unchanged"
+                else:
+                    result["status"] = "stale"
+            elif old == op["content"]:
+                result["status"] = "unchanged"
+            elif kind == "create" and old is not None:
+                result.update(status="error", error="file exists with different content (use write to overwrite)")
+            else:
+                os.makedirs(os.path.dirname(full) or ".", exist_ok=True)
+                with open(full, "w", encoding="utf-8") as f:
+                    f.write(op["content"])
+                added = removed = 0
+                if old is not None:
+                    for line in difflib.ndiff(old.splitlines(), op["content"].splitlines()):
+                        added += line.startswith("+ ")
+                        removed += line.startswith("- ")
+                else:
+                    added = len(op["content"].splitlines())
+                result.update(status="created" if old is None else "written", bytes=len(op["content"].encode()),
+                              added=added, removed=removed)
+    except Exception as e:
+        result.update(status="error", error=f"{type(e).__name__}: {e}")
+    results.append(result)
+print(json.dumps(results))
+'''
+
+
+def _sha(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def _output(response) -> str:
+    if isinstance(response, dict):
+        return response.get("output") or ""
+    return getattr(response, "output", None) or str(response or "")
+
+
+class FileOpsTool:
+    """Tool for running many file operations in one VM call."""
+
+    def __init__(self, instance):
+        self.instance = instance
+        # path -> sha256 of the content this tool last wrote or read there
+        self.known: Dict[str, str] = {}
+
+    def to_params(self) -> Dict[str, Any]:
+        return {
+            "name": "file_ops",
+            "description": """Run several file operations in one call (much faster than one tool call per file).
+            Operations run in order and each gets its own result. Paths are relative to the home directory.
+            - create: new file with `content` (error if a different file already exists)
+            - write: create or overwrite with `content`; identical content is reported as unchanged
+            - append: append `content`
+            - mkdir: create a directory and its parents
+            - read: return the file's content""",
+            "input_schema": {
+                "type": "object",
+                "properties": {
+                    "operations": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "op": {"type": "string", "enum": list(OPS)},
+                                "path": {"type": "string"},
+                                "content": {"type": "string"},
+                            },
+                            "required": ["op", "path"],
+                        },
+                    }
+                },
+                "required": ["operations"],
+            },
+        }
+
+    async def _run(self, ops: List[dict]) -> List[dict]:
+        payload = base64.b64encode(json.dumps(ops).encode()).decode()
+        # Payload goes in the heredoc, not argv, so large files don't hit the argument size limit
+        command = f"python3 - <<'FILE_OPS_EOF'\nPAYLOAD = '{payload}'\n{VM_SCRIPT}\nFILE_OPS_EOF"
+        response = await asyncio.to_thread(self.instance.bash, command=command)
+        return json.loads(_output(response).strip().splitlines()[-1])
+
+    async def __call__(self, operations: List[dict]) -> ToolResult:
+        ops = []
+        for i, op in enumerate(operations or []):
+            if op.get("op") not in OPS or not op.get("path"):
+                return ToolResult(error=f"operation {i}: needs op (one of {', '.join(OPS)}) and path")
+            if op["op"] in ("create", "write", "append") and not isinstance(op.get("content"), str):
+                return ToolResult(error=f"operation {i}: {op['op']} needs string content")
+            op = dict(op)
+            if op["op"] == "read":
+                op["max_chars"] = MAX_READ_CHARS
+            elif op["op"] in ("create", "write") and self.known.get(op["path"]) == _sha(op["content"]):
+                op = {"op": op["op"], "path": op["path"], "sha": self.known[op["path"]]}
+            ops.append(op)
+        if not ops:
+            return ToolResult(error="no operations given")
+
+        try:
+            results = await self._run(ops)
+            # Files that changed since we last saw them: resend those with content
+            stale = [i for i, r in enumerate(results) if r["status"] == "stale"]
+            if stale:
+                resent = await self._run([dict(operations[i]) for i in stale])
+                for i, result in zip(stale, resent):
+                    results[i] = result
+        except Exception as e:
+            return ToolResult(error=f"file_ops failed: {e}")
+
+        lines = []
+        for op, result in zip(operations, results):
+            status = result["status"]
+            if status in ("created", "written", "unchanged") and op["op"] in ("create", "write"):
+                self.known[op["path"]] = _sha(op["content"])
+            elif status == "read":
+                self.known[op["path"]] = result["sha"]
+            elif status == "appended":
+                self.known.pop(op["path"], None)
+            line = f"{op['op']} {op['path']}: {status}"
+            if status == "written":
+                line += f" (+{result['added']} -{result['removed']} lines)"
+            elif status == "created" and "bytes" in result:
+                line += f" ({result['bytes']} bytes)"
+            elif status == "error":
+                line += f": {result['error']}"
+            elif status == "read":
+                line += (" (truncated)" if result["truncated"] else "") + f"\n{result['content']}"
+            lines.append(line)
+
+        counts = {}
+        for result in results:
+            counts[result["status"]] = counts.get(result["status"], 0) + 1
+        log_event("file_ops", ops=len(ops), **counts)
+        errors = counts.get("error", 0)
+        return ToolResult(
+            output="\n".join(lines),
+            error=f"{errors} of {len(ops)} operations failed" if errors == len(ops) else None,
+        )
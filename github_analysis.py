@@ -1,25 +1,33 @@
 import asyncio
+import json
 import os
+import shlex
 from typing import Any, Dict
-from datetime import datetime
 from dotenv import load_dotenv
 
 load_dotenv(".env.example")
 
-from anthropic import Anthropic
-from anthropic.types.beta import BetaToolResultBlockParam, BetaMessageParam
+from scrapybara.anthropic import BashTool, ComputerTool, EditTool
 
-from scrapybara import Scrapybara
-from scrapybara.anthropic import BashTool, ComputerTool, EditTool, ToolResult
+from agent import ToolCollection, sampling_loop
+from browser_pool import close_context_pool, get_context_pool
+from clients import get_anthropic, get_scrapybara
+from entities import fan_out, resolve
+from file_ops import FileOpsTool
+from macros import chromium, documents_dir, run_setup
+from prefetch import make_prefetcher
+from progress_log import logged_session
+from sizing import UsageSampler, choose_instance_type
+from wait_for import WaitForTool
 
 ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY")
 SCRAPYBARA_API_KEY = os.getenv("SCRAPYBARA_API_KEY")
 
-SYSTEM_PROMPT = f"""<SYSTEM_CAPABILITY>
+SYSTEM_PROMPT = """<SYSTEM_CAPABILITY>
 * You are utilizing an Ubuntu virtual machine with Chromium browser installed
 * You can navigate repositories and analyze code
 * You can take screenshots of interesting findings
-* The current date is {datetime.today().strftime('%A, %B %-d, %Y')}
+* The current date is {current_date}
 </SYSTEM_CAPABILITY>
 
 You are a GitHub research assistant. Your task is to:
@@ -39,85 +47,60 @@ Guidelines:
 
 <IMPORTANT>
 * When using Chromium, if a startup wizard appears, IGNORE IT. Click directly on the address bar.
-* Always wait for pages to fully load before analysis
+* Always wait for pages to fully load before analysis: use wait_for with condition "url" instead of repeated screenshots
 * Take screenshots of significant findings
 * Save your analysis in organized documents
 </IMPORTANT>
 """
 
-class ToolCollection:
-    def __init__(self, *tools):
-        self.tools = tools
-        self.tool_map = {tool.to_params()["name"]: tool for tool in tools}
-
-    def to_params(self) -> list:
-        return [tool.to_params() for tool in self.tools]
-
-    async def run(self, *, name: str, tool_input: dict) -> ToolResult:
-        tool = self.tool_map.get(name)
-        if not tool:
-            return None
-        try:
-            return await tool(**tool_input)
-        except Exception as e:
-            print(f"Error running tool {name}: {e}")
-            return None
-
-def make_tool_result(result: ToolResult, tool_use_id: str) -> BetaToolResultBlockParam:
-    tool_result_content = []
-    is_error = False
-    
-    if result.error:
-        is_error = True
-        tool_result_content = result.error
-    else:
-        if result.output:
-            tool_result_content.append({
-                "type": "text",
-                "text": result.output,
-            })
-        if result.base64_image:
-            tool_result_content.append({
-                "type": "image",
-                "source": {
-                    "type": "base64",
-                    "media_type": "image/png",
-                    "data": result.base64_image,
-                },
-            })
-    
-    return {
-        "type": "tool_result",
-        "content": tool_result_content,
-        "tool_use_id": tool_use_id,
-        "is_error": is_error,
-    }
+# Runs in the VM with the research directory as argument; prints {relative path: text or None}
+DOCUMENTS_SCRIPT = r'''
+import json, os, sys
+root = os.path.expanduser(sys.argv[1])
+documents = {}
+for folder, _, names in os.walk(root):
+    for name in sorted(names):
+        path = os.path.join(folder, name)
+        text = None
+        if name.endswith((".md", ".txt", ".json", ".csv")):
+            with open(path, errors="replace") as f:
+                text = f.read(20000)
+        documents[os.path.relpath(path, root)] = text
+print(json.dumps(documents))
+'''
+
+
+async def collect_documents(instance, github_username: str) -> Dict[str, Any]:
+    """The session's result: the files the agent wrote under Documents/github_research/<username>"""
+    directory = f"~/Documents/github_research/{github_username}"
+    command = f"python3 - {shlex.quote(directory)} <<'DOCUMENTS_EOF'\n{DOCUMENTS_SCRIPT}\nDOCUMENTS_EOF"
+    try:
+        response = await asyncio.to_thread(instance.bash, command=command)
+        documents = json.loads((getattr(response, "output", None) or "").strip().splitlines()[-1])
+    except Exception as e:
+        print(f"Could not collect the documents for {github_username}: {e}")
+        documents = {}
+    return {"instance": instance.id, "documents_dir": directory, "documents": documents}
+
 
+@logged_session("github", target_arg="github_username")
 async def analyze_github_profile(github_username: str, context_id: str, description: str = None):
     """Analyze a GitHub profile and its repositories"""
     
-    # Initialize Scrapybara VM with explicit instance type
-    s = Scrapybara(api_key=SCRAPYBARA_API_KEY)
-    instance = s.start(instance_type="medium")
-    print(f"Started Scrapybara instance: {instance.id}")
-
-    try:
-        # Start browser with explicit CDP URL handling
-        cdp_url = instance.browser.start()
-        print(f"Browser started with CDP URL: {cdp_url}")
-        
-        # Authenticate browser with context ID
-        instance.browser.authenticate(context_id=context_id)
-
+    # Reuse a started instance already authenticated for this context, if any
+    s = get_scrapybara(SCRAPYBARA_API_KEY)
+    async with get_context_pool().context(s, context_id, instance_type=choose_instance_type("github")) as instance:
         # Initialize tools
         tools = ToolCollection(
             ComputerTool(instance),
             BashTool(instance),
-            EditTool(instance)
+            EditTool(instance),
+            FileOpsTool(instance),
+            WaitForTool(instance)
         )
 
         # Initialize chat with Claude
-        client = Anthropic(api_key=ANTHROPIC_API_KEY)
+        client = get_anthropic(ANTHROPIC_API_KEY)
         messages = []
 
         # Initial analysis command
@@ -139,60 +122,31 @@ async def analyze_github_profile(github_username: str, context_id: str, descript
         Provide a comprehensive analysis of their GitHub presence.
         """
 
+        # Known setup steps run directly instead of through model turns
+        setup = await run_setup(tools, [
+            documents_dir("github_research", github_username),
+            chromium(f"https://github.com/{github_username}"),
+        ])
+
         messages.append({
             "role": "user",
-            "content": [{"type": "text", "text": analysis_command}],
+            "content": [{"type": "text", "text": analysis_command}] + setup,
         })
 
-        while True:
-            # Get Claude's response
-            response = client.beta.messages.create(
-                model="claude-3-5-sonnet-20241022",
-                max_tokens=4096,
+        # A reused context keeps the size it was started with
+        instance_type = get_context_pool().contexts[context_id].instance_type
+        async with UsageSampler(instance, "github", instance_type, tools=tools):
+            await sampling_loop(
+                client,
+                system_prompt=SYSTEM_PROMPT,
+                tools=tools,
                 messages=messages,
-                system=[{"type": "text", "text": SYSTEM_PROMPT}],
-                tools=tools.to_params(),
-                betas=["computer-use-2024-10-22"]
+                prefetcher=make_prefetcher(instance, seeds=[f"https://github.com/{github_username}"]),
             )
+        result = await collect_documents(instance, github_username)
 
-            # Process tool usage
-            tool_results = []
-            for content in response.content:
-                if content.type == "text":
-                    print(f"\nAssistant: {content.text}")
-                elif content.type == "tool_use":
-                    print(f"\nExecuting: {content.name}")
-                    result = await tools.run(
-                        name=content.name,
-                        tool_input=content.input
-                    )
-                    
-                    if result:
-                        tool_result = make_tool_result(result, content.id)
-                        tool_results.append(tool_result)
-                        
-                        if result.output:
-                            print(f"Output: {result.output}")
-                        if result.error:
-                            print(f"Error: {result.error}")
-
-            # Add assistant's response and tool results to messages
-            messages.append({
-                "role": "assistant",
-                "content": [c.model_dump() for c in response.content]
-            })
-
-            if tool_results:
-                messages.append({
-                    "role": "user",
-                    "content": tool_results
-                })
-            else:
-                break
-
-    finally:
-        instance.stop()
-        print(f"\nAnalysis complete for {github_username}!")
+    print(f"\nAnalysis complete for {github_username}! {len(result['documents'])} documents written")
+    return result
 
 async def run_example_analyses():
     """Run example GitHub profile analyses"""
@@ -209,13 +163,21 @@ async def run_example_analyses():
         }
     ]
     
-    for analysis in analyses:
-        print(f"\nStarting analysis of {analysis['username']}...")
-        await analyze_github_profile(
-            github_username=analysis["username"],
-            description=analysis["description"],
-            context_id=analysis["context_id"]
-        )
+    # "@Anthropics" and "github.com/anthropics" are the same profile; analyze it once
+    entities = resolve(analyses, "username")
+    results = {}
+    try:
+        for entity in entities:
+            analysis = entity.target
+            print(f"\nStarting analysis of {analysis['username']}...")
+            results[entity.key] = await analyze_github_profile(
+                github_username=analysis["username"],
+                description=analysis["description"],
+                context_id=analysis["context_id"]
+            )
+    finally:
+        await close_context_pool()
+    return fan_out(entities, results, key=lambda a: a["username"])
 
 if __name__ == "__main__":
     asyncio.run(run_example_analyses())
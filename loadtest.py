@@ -0,0 +1,198 @@
+"""Load-test the session scripts against the local fake clients.
+
+Runs hundreds of simulated sessions of one job in this process, with the
+real agent loop, scheduler, conversation store and logging, but with
+fake_scrapybara.py standing in for Scrapybara and Anthropic. Reports
+throughput, tail latency per phase (from the progress log the run writes),
+CPU time and memory.
+
+    python loadtest.py compete --sessions 300 --concurrency 50 --spec "scale=0.01;fail.model=0.02"
+
+Latencies are simulated seconds (`scale` shrinks every sleep, so 0.01 runs
+100x faster than real time); CPU and memory are real. By default the rate
+limits are lifted to measure the client side alone. --real-limits applies the
+ANTHROPIC_*/SCRAPYBARA_MAX_INSTANCES limits in simulated time.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+TARGETS = {
+    "compete": lambda i: {"name": f"Company{i}", "website": f"https://company{i}.example.com", "focus_areas": ["Pricing"]},
+    "sales": lambda i: {"name": f"Company{i}", "industry": "SaaS"},
+    "research": lambda i: {"name": f"Company{i}"},
+    "github": lambda i: {"username": f"user{i}", "context_id": f"user{i}-analysis"},
+    "code": lambda i: {"task": f"Task {i}: implement and benchmark a sort"},
+}
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {}
+    ordered = sorted(values)
+
+    def at(q):
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 3)
+
+    return {"n": len(ordered), "p50": at(0.50), "p95": at(0.95), "p99": at(0.99), "max": round(ordered[-1], 3)}
+
+
+def rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+async def _run(job: str, sessions: int, concurrency: int) -> dict:
+    import importlib
+
+    from batch_runner import JOBS
+
+    spec = JOBS[job]
+    session = getattr(importlib.import_module(spec.module), spec.function)
+    limit = asyncio.Semaphore(concurrency)
+    durations = []
+    errors: Dict[str, int] = {}
+    samples = []
+    done = asyncio.Event()
+
+    async def sample_memory():
+        while not done.is_set():
+            samples.append(rss_bytes())
+            await asyncio.sleep(0.2)
+
+    async def one(i: int):
+        async with limit:
+            started = time.monotonic()
+            try:
+                await session(**spec.build(TARGETS[job](i)))
+                durations.append(time.monotonic() - started)
+            except Exception as e:
+                name = type(e).__name__
+                errors[name] = errors.get(name, 0) + 1
+
+    from browser_pool import close_context_pool
+
+    sampler = asyncio.create_task(sample_memory())
+    started = time.monotonic()
+    await asyncio.gather(*(one(i) for i in range(sessions)))
+    await close_context_pool()
+    wall = time.monotonic() - started
+    done.set()
+    await sampler
+    return {"wall": wall, "durations": durations, "errors": errors, "rss_samples": samples}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Load-test a job against the local fake Scrapybara/Anthropic clients")
+    parser.add_argument("job", choices=sorted(TARGETS))
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--spec", default="scale=0.01", help="fake_scrapybara spec: latencies, failure rates, scale, ...")
+    parser.add_argument("--real-limits", action="store_true", help="Apply the configured rate limits (in simulated time)")
+    parser.add_argument("--output", help="Also write the report as JSON")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Show the sessions' own output")
+    args = parser.parse_args(argv)
+
+    # Read at import time by clients.py, progress_log.py and sizing.py
+    log_dir = tempfile.mkdtemp(prefix="loadtest-")
+    os.environ["SCRAPYBARA_FAKE"] = args.spec
+    os.environ.setdefault("SCRAPYBARA_PROGRESS_LOG", os.path.join(log_dir, "progress.log"))
+    os.environ.setdefault("SCRAPYBARA_PROGRESS_LOG_MAX_BYTES", "0")
+    os.environ.setdefault("SCRAPYBARA_SIZING_PATH", os.path.join(log_dir, "instance_profiles.jsonl"))
+
+    from fake_scrapybara import get_simulator
+    from progress_log import LOG_PATH, get_writer, read_events
+    from scheduler import RateLimitScheduler, set_scheduler
+
+    sim = get_simulator(args.spec)
+    scale = sim.scale
+    if args.real_limits:
+        base = RateLimitScheduler.from_env()
+        scheduler = RateLimitScheduler(
+            requests_per_minute=base.requests.rate * 60 / scale,
+            input_tokens_per_minute=base.input_tokens.rate * 60 / scale,
+            max_instances=base.max_instances,
+            base_delay=scale,
+            max_delay=60 * scale,
+        )
+    else:
+        scheduler = RateLimitScheduler(
+            requests_per_minute=1e9, input_tokens_per_minute=1e12, max_instances=args.concurrency,
+            base_delay=scale, max_delay=60 * scale,
+        )
+    set_scheduler(scheduler)
+
+    rss_before = rss_bytes()
+    cpu_before = resource.getrusage(resource.RUSAGE_SELF)
+    sink = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(open(os.devnull, "w"))
+    with sink:
+        result = asyncio.run(_run(args.job, args.sessions, args.concurrency))
+    cpu_after = resource.getrusage(resource.RUSAGE_SELF)
+    get_writer().close()
+
+    phases: Dict[str, List[float]] = {}
+    for event in read_events(LOG_PATH):
+        duration = event.get("duration")
+        if duration is None:
+            continue
+        kind = event["event"]
+        if kind == "tool":
+            kind = f"tool {event.get('tool')}"
+        phases.setdefault(kind, []).append(duration / scale)
+
+    cpu = (cpu_after.ru_utime - cpu_before.ru_utime) + (cpu_after.ru_stime - cpu_before.ru_stime)
+    finished = len(result["durations"])
+    peak = max(result["rss_samples"] or [rss_bytes()])
+    report = {
+        "job": args.job,
+        "sessions": args.sessions,
+        "concurrency": args.concurrency,
+        "scale": scale,
+        "ok": finished,
+        "errors": result["errors"],
+        "wall_s": round(result["wall"], 2),
+        "sessions_per_s": round(finished / result["wall"], 2) if result["wall"] else None,
+        "sessions_per_hour_real_time": round(finished / result["wall"] * scale * 3600, 1) if result["wall"] else None,
+        "session_s": percentiles([d / scale for d in result["durations"]]),
+        "phases_s": {kind: percentiles(values) for kind, values in sorted(phases.items())},
+        "cpu_s": round(cpu, 2),
+        "cpu_ms_per_session": round(cpu * 1000 / max(1, finished), 1),
+        "rss_start_mb": round(rss_before / 1e6, 1),
+        "rss_peak_mb": round(peak / 1e6, 1),
+        "rss_per_concurrent_session_mb": round((peak - rss_before) / 1e6 / max(1, min(args.concurrency, args.sessions)), 2),
+        "fake_calls": sim.stats(),
+        "progress_log": LOG_PATH,
+    }
+
+    print(f"{args.job}: {finished}/{args.sessions} sessions ok in {report['wall_s']}s wall "
+          f"({report['sessions_per_s']}/s, ~{report['sessions_per_hour_real_time']}/h at real latencies)")
+    if result["errors"]:
+        print(f"errors: {result['errors']}")
+    print(f"CPU {report['cpu_s']}s ({report['cpu_ms_per_session']} ms/session), "
+          f"RSS {report['rss_start_mb']} -> {report['rss_peak_mb']} MB peak "
+          f"({report['rss_per_concurrent_session_mb']} MB per concurrent session)")
+    print(f"\n{'PHASE (simulated s)':24} {'N':>6} {'P50':>8} {'P95':>8} {'P99':>8} {'MAX':>8}")
+    for kind, p in [("session", report["session_s"])] + list(report["phases_s"].items()):
+        if p:
+            print(f"{kind:24} {p['n']:>6} {p['p50']:>8.2f} {p['p95']:>8.2f} {p['p99']:>8.2f} {p['max']:>8.2f}")
+    failures = {k: v for k, v in sim.stats()["failures"].items() if v}
+    if failures:
+        print(f"\ninjected failures: {failures}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return 0 if finished == args.sessions else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
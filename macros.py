@@ -0,0 +1,109 @@
+"""Deterministic setup macros run before the agent loop.
+
+Every research session used to spend its first model turns on the same
+chores: launching Chromium, getting past its first-run wizard, opening
+LibreOffice and creating the Documents/<task>/<name> folder, each with a
+round trip and a screenshot. These are fixed sequences, so they run here
+directly through the session's BashTool/ComputerTool. The model starts with a
+short report of what is already in place plus one screenshot of the desktop.
+
+A macro whose check doesn't pass is reported as not done, so the model can
+still do that step itself. SCRAPYBARA_MACROS=0 turns setup off.
+"""
+import os
+import shlex
+import time
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+from progress_log import log_event
+
+ENABLED = os.getenv("SCRAPYBARA_MACROS", "1") != "0"
+CHECK_TIMEOUT = 20
+# Local DevTools port of the Chromium the agent uses (see wait_for)
+CHROMIUM_DEBUG_PORT = 9222
+
+
+class Macro(NamedTuple):
+    description: str
+    steps: Tuple[Tuple[str, dict], ...]
+    # Shell condition that holds once the macro's effect is in place
+    check: Optional[str] = None
+
+
+def documents_dir(*parts: str) -> Macro:
+    path = "/".join(part.strip("/") for part in parts if part)
+    target = f'"$HOME"/Documents/{shlex.quote(path)}'
+    return Macro(
+        f"Created the folder ~/Documents/{path}",
+        (("bash", {"command": f"mkdir -p {target}"}),),
+        check=f"test -d {target}",
+    )
+
+
+def chromium_command(url: Optional[str] = None, profile: Optional[str] = None) -> str:
+    """Shell command starting the agent's Chromium in the background"""
+    # --no-first-run skips the startup wizard instead of clicking through it; the DevTools port lets
+    # wait_for, prefetch and the browser pool reach the agent's tabs
+    flags = (f"--no-sandbox --no-first-run --no-default-browser-check --disable-session-crashed-bubble "
+             f"--remote-debugging-port={CHROMIUM_DEBUG_PORT}")
+    if profile:
+        flags += f" --user-data-dir={shlex.quote(profile)}"
+    return f"(DISPLAY=:1 chromium {flags} {shlex.quote(url) if url else ''} >/dev/null 2>&1 &)"
+
+
+def chromium(url: Optional[str] = None) -> Macro:
+    # If the agent's Chromium is already running (e.g. the pooled, authenticated one from
+    # browser_pool), open the page as a tab in it instead of starting a second browser
+    endpoint = f"http://127.0.0.1:{CHROMIUM_DEBUG_PORT}/json/" + (f"new?{url}" if url else "version")
+    command = f"curl -sf -X {'PUT' if url else 'GET'} {shlex.quote(endpoint)} >/dev/null 2>&1 || {chromium_command(url)}"
+    return Macro(
+        f"Opened Chromium{f' at {url}' if url else ''} (no startup wizard)",
+        (("bash", {"command": command}),),
+        check="DISPLAY=:1 xdotool search --onlyvisible --class chromium",
+    )
+
+
+def libreoffice(app: str) -> Macro:
+    """A blank LibreOffice document; `app` is "writer" or "calc" """
+    return Macro(
+        f"Opened a blank LibreOffice {app.capitalize()} document",
+        (("bash", {"command": f"(DISPLAY=:1 soffice --{app} --norestore --nologo >/dev/null 2>&1 &)"}),),
+        check=f"DISPLAY=:1 xdotool search --onlyvisible --name 'LibreOffice {app.capitalize()}'",
+    )
+
+
+async def _run_macro(tools, macro: Macro) -> Tuple[bool, str]:
+    for name, tool_input in macro.steps:
+        result = await tools.run(name=name, tool_input=tool_input)
+        if result is not None and result.error:
+            return False, result.error.strip()[:200]
+        if result is None and name != "bash":
+            return False, f"{name} call failed"
+    if macro.check:
+        # BashTool returns nothing on empty output, so echo a marker
+        wait = f"timeout {CHECK_TIMEOUT} sh -c {shlex.quote(f'until {macro.check} >/dev/null 2>&1; do sleep 0.5; done')} && echo ready"
+        result = await tools.run(name="bash", tool_input={"command": wait})
+        if not result or "ready" not in (result.output or ""):
+            return False, f"not confirmed after {CHECK_TIMEOUT}s"
+    return True, ""
+
+
+async def run_setup(tools, macros: Sequence[Macro]) -> List[dict]:
+    """Run setup macros and return content blocks for the first user message"""
+    if not ENABLED or not macros:
+        return []
+    lines = []
+    for macro in macros:
+        started = time.monotonic()
+        ok, detail = await _run_macro(tools, macro)
+        log_event("macro", macro=macro.description, ok=ok, duration=round(time.monotonic() - started, 3), error=detail or None)
+        print(f"Setup: {macro.description}: {'done' if ok else detail}")
+        lines.append(f"- {macro.description}" + ("" if ok else f" -- NOT done ({detail}), please do this yourself"))
+
+    report = "Setup already done before this conversation started (don't repeat it):\n" + "\n".join(lines)
+    blocks = [{"type": "text", "text": report}]
+    screenshot = await tools.run(name="computer", tool_input={"action": "screenshot"})
+    if screenshot and screenshot.base64_image:
+        blocks.append({"type": "text", "text": "Current screen:"})
+        blocks.append({"type": "image", "source": {"type": "base64", "media_type": "image/png", "data": screenshot.base64_image}})
+    return blocks
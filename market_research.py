@@ -1,32 +1,35 @@
 import asyncio
 import os
-from typing import Any, cast
-from datetime import datetime
 from dotenv import load_dotenv
 
 load_dotenv(".env.example")
 
-from anthropic import Anthropic
-from anthropic.types.beta import (
-    BetaToolResultBlockParam,
-    BetaMessageParam,
-)
+from scrapybara.anthropic import BashTool, ComputerTool, EditTool
 
-from scrapybara import Scrapybara
-from scrapybara.anthropic import BashTool, ComputerTool, EditTool, ToolResult
+from agent import ToolCollection, sampling_loop
+from clients import get_anthropic, get_scrapybara
+from file_ops import FileOpsTool
+from macros import chromium, run_setup
+from prefetch import make_prefetcher
+from progress_log import logged_session
+from reports import FindingsTool, report_dir
+from scheduler import get_scheduler
+from sizing import UsageSampler, choose_instance_type
+from wait_for import WaitForTool
 
 ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY")
 SCRAPYBARA_API_KEY = os.getenv("SCRAPYBARA_API_KEY")
 
-SYSTEM_PROMPT = f"""<SYSTEM_CAPABILITY>
+SYSTEM_PROMPT = """<SYSTEM_CAPABILITY>
 * You are utilising an Ubuntu virtual machine using linux architecture with internet access.
 * You can feel free to install Ubuntu applications with your bash tool. Use curl instead of wget.
-* To open chromium, please just click on the web browser icon or use the "(DISPLAY=:1 chromium --no-sandbox &)" command in the terminal. Note chromium is what is installed on your system.
-* Using bash tool you can start GUI applications, but you need to set export DISPLAY=:1 and use a subshell. For example "(DISPLAY=:1 xterm &)". GUI apps run with bash tool will appear within your desktop environment, but they may take some time to appear. Take a screenshot to confirm it did.
+* To open chromium, please just click on the web browser icon or use the "(DISPLAY=:1 chromium --no-sandbox --remote-debugging-port=9222 &)" command in the terminal. Note chromium is what is installed on your system.
+* Using bash tool you can start GUI applications, but you need to set export DISPLAY=:1 and use a subshell. For example "(DISPLAY=:1 xterm &)". GUI apps run with bash tool will appear within your desktop environment, but they may take some time to appear. Use the wait_for tool (condition "window") to wait for it instead of taking repeated screenshots.
 * When using your bash tool with commands that are expected to output very large quantities of text, redirect into a tmp file and use str_replace_editor or `grep -n -B <lines before> -A <lines after> <query> <filename>` to confirm output.
+* After navigating, use wait_for with condition "url" to wait for the page to finish loading instead of taking screenshots until it has.
 * When viewing a page it can be helpful to zoom out so that you can see everything on the page.  Either that, or make sure you scroll down to see everything before deciding something isn't available.
 * When using your computer function calls, they take a while to run and send back to you.  Where possible/feasible, try to chain multiple of these calls all into one function calls request.
-* The current date is {datetime.today().strftime('%A, %B %-d, %Y')}.
+* The current date is {current_date}.
 </SYSTEM_CAPABILITY>
 
 <IMPORTANT>
@@ -36,74 +39,23 @@ SYSTEM_PROMPT = f"""<SYSTEM_CAPABILITY>
 
 You are a market research assistant using a Linux virtual desktop. Your task is to:
 1. Research a given company/product using Chromium
-2. Take organized notes in LibreOffice Writer
-3. Create a summary spreadsheet in LibreOffice Calc
-4. Save all documents in an organized way
+2. Submit organized notes (sections) and a summary of key metrics (tables) with the submit_findings tool
 
 Guidelines:
 - Launch GUI apps using bash with DISPLAY=:1 
 - Take screenshots to verify your actions
-- Save files in the Documents folder
-- Format documents professionally
+- Don't open LibreOffice: submit_findings writes the formatted report and spreadsheet for you
 """
 
-class ToolCollection:
-    """A collection of anthropic-defined tools."""
-    def __init__(self, *tools):
-        self.tools = tools
-        self.tool_map = {tool.to_params()["name"]: tool for tool in tools}
-
-    def to_params(self) -> list:
-        return [tool.to_params() for tool in self.tools]
-
-    async def run(self, *, name: str, tool_input: dict[str, Any]) -> ToolResult:
-        tool = self.tool_map.get(name)
-        if not tool:
-            return None
-        try:
-            r = await tool(**tool_input)
-            return r
-        except Exception as e:
-            print(f"Error running tool {name}: {e}")
-            return None
-
-def make_tool_result(result, tool_use_id: str) -> BetaToolResultBlockParam:
-    """Convert tool result to API format"""
-    tool_result_content = []
-    is_error = False
-    
-    if result.error:
-        is_error = True
-        tool_result_content = result.error
-    else:
-        if result.output:
-            tool_result_content.append({
-                "type": "text",
-                "text": result.output,
-            })
-        if result.base64_image:
-            tool_result_content.append({
-                "type": "image",
-                "source": {
-                    "type": "base64",
-                    "media_type": "image/png",
-                    "data": result.base64_image,
-                },
-            })
-    
-    return {
-        "type": "tool_result",
-        "content": tool_result_content,
-        "tool_use_id": tool_use_id,
-        "is_error": is_error,
-    }
-
+@logged_session("research", target_arg="company_name")
 async def research_company(company_name: str, industry: str = None, notes: str = None):
     """Perform automated sales research on a company"""
     
     # Initialize Scrapybara VM with explicit instance type
-    s = Scrapybara(api_key=SCRAPYBARA_API_KEY)
-    instance = s.start(instance_type="medium")
+    scheduler = get_scheduler()
+    s = get_scrapybara(SCRAPYBARA_API_KEY)
+    instance_type = choose_instance_type("research")
+    instance = await scheduler.start_instance(s, instance_type=instance_type)
     print(f"Started Scrapybara instance: {instance.id}")
 
     try:
@@ -112,87 +64,52 @@ async def research_company(company_name: str, industry: str = None, notes: str =
         print(f"Browser started with CDP URL: {cdp_url}")
 
         # Initialize tools
+        findings = FindingsTool("research", company_name)
         tools = ToolCollection(
             ComputerTool(instance),
             BashTool(instance),
-            EditTool(instance)
+            EditTool(instance),
+            FileOpsTool(instance),
+            WaitForTool(instance),
+            findings
         )
 
         # Initialize chat with Claude
-        client = Anthropic(api_key=ANTHROPIC_API_KEY)
+        client = get_anthropic(ANTHROPIC_API_KEY)
         messages = []
 
         # Initial research command
         research_command = f"""Please help me research {company_name}. Follow these steps:
-        1. Launch Firefox and search for the company
-        2. Open LibreOffice Writer to take detailed notes
-        3. Create a spreadsheet summarizing key metrics
-        4. Save all documents in Documents folder
+        1. Search for the company in Chromium
+        2. Organize detailed notes into sections
+        3. Put key metrics in a summary table
+        4. Submit everything with submit_findings
         """
 
+        # Known setup steps run directly instead of through model turns
+        setup = await run_setup(tools, [
+            chromium(),
+        ])
+
         messages.append({
             "role": "user",
-            "content": [{"type": "text", "text": research_command}],
+            "content": [{"type": "text", "text": research_command}] + setup,
         })
 
-        while True:
-            # Get Claude's response
-            response = client.beta.messages.create(
-                model="claude-3-5-sonnet-20241022",
-                max_tokens=4096,
+        async with UsageSampler(instance, "research", instance_type, tools=tools):
+            await sampling_loop(
+                client,
+                system_prompt=SYSTEM_PROMPT,
+                tools=tools,
                 messages=messages,
-                system=[{"type": "text", "text": SYSTEM_PROMPT}],
-                tools=tools.to_params(),
-                betas=["computer-use-2024-10-22"]
+                screenshot_on_empty_bash=True,
+                prefetcher=make_prefetcher(instance, company=company_name),
             )
 
-            # Process tool usage
-            tool_results = []
-            for content in response.content:
-                if content.type == "text":
-                    print(f"\nAssistant: {content.text}")
-                elif content.type == "tool_use":
-                    print(f"\nTool Use: {content.name}")
-                    result = await tools.run(
-                        name=content.name,
-                        tool_input=content.input
-                    )
-                    
-                    # Handle empty bash results by taking a screenshot
-                    if content.name == "bash" and not result:
-                        result = await tools.run(
-                            name="computer",
-                            tool_input={"action": "screenshot"}
-                        )
-                        print(f"Took fallback screenshot after empty bash result")
-                    
-                    if result:
-                        tool_result = make_tool_result(result, content.id)
-                        tool_results.append(tool_result)
-                        
-                        if result.output:
-                            print(f"Tool Output: {result.output}")
-                        if result.error:
-                            print(f"Tool Error: {result.error}")
-
-            # Add assistant's response and tool results to messages
-            messages.append({
-                "role": "assistant",
-                "content": [c.model_dump() for c in response.content]
-            })
-
-            if tool_results:
-                messages.append({
-                    "role": "user",
-                    "content": tool_results
-                })
-            else:
-                # No more tools used - task complete
-                break
-
     finally:
-        instance.stop()
-        print(f"\nResearch complete for {company_name}!")
+        await scheduler.stop_instance(instance)
+        print(f"\nResearch complete for {company_name}! Report saved in {report_dir('research', company_name)}")
+    return findings.result()
 
 if __name__ == "__main__":
     asyncio.run(research_company("Anthropic"))
\ No newline at end of file
@@ -0,0 +1,152 @@
+"""Chunked `agent.scrape` with schema validation, retries and streamed output.
+
+Asking the scrape agent for a whole listing in one call risks truncated or
+timed-out responses, and one failure means starting over. Here the listing
+is split into chunks (pages, filters, ...), every record of a chunk is checked
+against the declared schema, and only chunks that failed, came back invalid
+or came back short are retried. A chunk is short when the scrape also reports
+how many records the page shows (`count_key`) and returned fewer than that,
+which is how a page too big for one response shows up. Records are deduplicated across chunks by a key field and
+appended to a JSONL file as soon as their chunk validates; finished chunks are
+recorded next to it so an interrupted run picks up where it stopped.
+"""
+import json
+import os
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+TYPES = {"str": str, "int": int, "float": (int, float), "bool": bool}
+
+
+def validate(value: Any, schema: Any, path: str = "") -> List[str]:
+    """Check `value` against a scrape schema like {"name": "str", "tags": ["str"]}"""
+    if isinstance(schema, str):
+        expected = TYPES.get(schema)
+        if expected is None:
+            return []
+        if not isinstance(value, expected) or (schema == "str" and not value.strip()):
+            return [f"{path or 'value'}: expected non-empty {schema}, got {value!r:.40}"]
+        return []
+    if isinstance(schema, list):
+        if not isinstance(value, list):
+            return [f"{path or 'value'}: expected list, got {type(value).__name__}"]
+        errors = []
+        for i, item in enumerate(value):
+            errors += validate(item, schema[0], f"{path}[{i}]")
+        return errors
+    if isinstance(schema, dict):
+        if not isinstance(value, dict):
+            return [f"{path or 'value'}: expected object, got {type(value).__name__}"]
+        errors = []
+        for key, sub in schema.items():
+            if key not in value:
+                errors.append(f"{path}.{key}: missing" if path else f"{key}: missing")
+            else:
+                errors += validate(value[key], sub, f"{path}.{key}" if path else key)
+        return errors
+    return []
+
+
+def normalize_key(value: Any) -> str:
+    return " ".join(str(value).lower().split())
+
+
+def scrape_chunks(
+    instance,
+    chunks: Dict[str, str],
+    item_schema: dict,
+    list_key: str = "companies",
+    key_field: str = "name",
+    output: Optional[str] = None,
+    max_attempts: int = 3,
+    scrape: Optional[Callable[..., Any]] = None,
+    count_key: Optional[str] = None,
+) -> Iterator[dict]:
+    """Scrape each chunk (id -> cmd) and yield new, valid records as they arrive.
+
+    A chunk is retried when the call fails, the list is missing, any record in
+    it is invalid, or, with `count_key`, the list is shorter than the count
+    the scrape reported under that key. After `max_attempts` its valid records
+    are kept and the chunk is reported as incomplete.
+    """
+    scrape = scrape or instance.agent.scrape
+    schema = {list_key: [item_schema]}
+    if count_key:
+        schema[count_key] = "int"
+    seen = set()
+    done = set()
+    progress_path = f"{output}.chunks" if output else None
+
+    # Resume: records already written and chunks already finished
+    if output and os.path.exists(output):
+        with open(output, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    seen.add(normalize_key(json.loads(line).get(key_field, "")))
+    if progress_path and os.path.exists(progress_path):
+        with open(progress_path, encoding="utf-8") as f:
+            done = {line.strip() for line in f if line.strip()}
+
+    out = open(output, "a", encoding="utf-8") if output else None
+    progress = open(progress_path, "a", encoding="utf-8") if progress_path else None
+    try:
+        for chunk_id, cmd in chunks.items():
+            if chunk_id in done:
+                print(f"Chunk {chunk_id}: already scraped, skipping")
+                continue
+            kept = 0
+            complete = False
+            for attempt in range(1, max_attempts + 1):
+                try:
+                    response = scrape(cmd=cmd, schema=schema)
+                except Exception as e:
+                    print(f"Chunk {chunk_id}: attempt {attempt} failed: {e}")
+                    continue
+                data = getattr(response, "data", None) or {}
+                items = data.get(list_key)
+                if not isinstance(items, list):
+                    print(f"Chunk {chunk_id}: attempt {attempt} returned no '{list_key}' list")
+                    continue
+                expected = data.get(count_key) if count_key else None
+
+                invalid = 0
+                for item in items:
+                    errors = validate(item, item_schema)
+                    if errors:
+                        invalid += 1
+                        continue
+                    key = normalize_key(item[key_field])
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                    kept += 1
+                    if out:
+                        out.write(json.dumps(item) + "\n")
+                        out.flush()
+                    yield item
+
+                short = isinstance(expected, int) and len(items) < expected
+                if not invalid and not short:
+                    complete = True
+                    break
+                if invalid:
+                    print(f"Chunk {chunk_id}: attempt {attempt} had {invalid}/{len(items)} invalid records, retrying")
+                else:
+                    print(f"Chunk {chunk_id}: attempt {attempt} returned {len(items)} of {expected} records, retrying")
+
+            if complete:
+                if progress:
+                    progress.write(chunk_id + "\n")
+                    progress.flush()
+                print(f"Chunk {chunk_id}: {kept} new records")
+            else:
+                print(f"Chunk {chunk_id}: incomplete after {max_attempts} attempts ({kept} records kept)")
+    finally:
+        if out:
+            out.close()
+        if progress:
+            progress.close()
+
+
+def read_records(path: str) -> Iterable[dict]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
@@ -0,0 +1,375 @@
+"""Cross-target summaries of finished sessions, through the Message Batches API.
+
+After a sweep, the useful questions span targets: what does the market look
+like across every `analyze_competitor` report, and which scraped contacts are
+worth reaching first. Asking an interactive agent session per target for that
+means tools, screenshots and a full loop each time. Here the stored results
+are read from disk instead:
+
+- findings.json of every target under reports/<job>/ (sales, compete, research)
+- JSON/JSONL records: scrapy contacts (`cli.py scrape --contacts-output`) or batch runner output
+
+They are packed into a few large, text-only requests (no tools, no images)
+of up to SCRAPYBARA_POSTPROCESS_CHUNK_CHARS each, and submitted together as
+one message batch. Batches are billed at half the interactive price. The
+batch is polled until it ends, and errored requests are resubmitted. When
+there is more than one chunk, a landscape is reduced in a second, single
+request, and ranking chunks are merged locally by score. The answer is asked
+for in the `submit_findings` shape and rendered by reports.py:
+
+    reports/aggregate/<name>/report.md (.docx, .xlsx)
+
+The batch id and replies are saved next to the report, so an interrupted
+run picks up polling where it left off, and a rerun only re-renders. With
+SCRAPYBARA_FAKE set, batches go to the local stand-in in fake_scrapybara.py.
+
+    python postprocess.py landscape [--job compete] [--root reports] [--name compete-landscape]
+    python postprocess.py rank contacts.jsonl [--goal "..."] [--name contacts-ranking]
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from progress_log import log_event
+from reports import ROOT, render, render_markdown, report_dir
+
+MODEL = os.getenv("SCRAPYBARA_POSTPROCESS_MODEL", "claude-3-5-sonnet-20241022")
+MAX_TOKENS = int(os.getenv("SCRAPYBARA_POSTPROCESS_MAX_TOKENS", 8192))
+CHUNK_CHARS = int(os.getenv("SCRAPYBARA_POSTPROCESS_CHUNK_CHARS", 150_000))
+ITEM_CHARS = 20_000
+POLL_MAX = 60
+
+SYSTEM_PROMPT = """You are an analyst writing a report from research notes that were already collected.
+Answer with one JSON object and nothing else, shaped like:
+{"title": str, "summary": str,
+ "sections": [{"heading": str, "content": str, "bullets": [str]}],
+ "tables": [{"name": str, "columns": [str], "rows": [[...]]}]}
+Only use facts from the notes; say so where they are missing or contradict each other."""
+
+LANDSCAPE = """Below are research reports on {count} companies, each in an <item> tag.
+Write a market landscape:
+- a table "Landscape" with one row per company and the columns Company, Offering, Pricing, Target market,
+  Positioning, Recent changes
+- sections on the market overview, segments and who leads each, pricing patterns, strategic shifts and trends,
+  gaps and opportunities, and threats"""
+
+LANDSCAPE_REDUCE = """Below are {count} partial market landscapes, each covering different companies.
+Merge them into one landscape: a single "Landscape" table with every company from every part, and sections that
+describe the whole market rather than each part."""
+
+RANK = """Below are {count} contacts, each in an <item> tag. {goal}
+Rank them: a table "Ranking" with one row per contact, best first, and the columns Rank, Name, Score, Contact,
+Reason. Score is 0-100 on an absolute scale, so scores from separate lists can be compared. Add a short section on
+how you scored."""
+DEFAULT_GOAL = "We want to reach the companies most likely to buy developer tooling for AI agents."
+
+
+class Item(NamedTuple):
+    name: str
+    text: str
+
+
+def collect_findings(root: str = ROOT, job: Optional[str] = None) -> List[Item]:
+    """Every submitted report under `root` (one job, or all of them except aggregates)"""
+    items = []
+    jobs = [job] if job else sorted(j for j in os.listdir(root) if j != "aggregate") if os.path.isdir(root) else []
+    for job_name in jobs:
+        directory = os.path.join(root, job_name)
+        for target in sorted(os.listdir(directory)) if os.path.isdir(directory) else []:
+            try:
+                with open(os.path.join(directory, target, "findings.json"), encoding="utf-8") as f:
+                    findings = json.load(f)
+            except (OSError, ValueError):
+                continue
+            items.append(Item(findings.get("target", target), render_markdown(findings)))
+    return items
+
+
+def collect_records(path: str) -> List[Item]:
+    """Records from a .json/.jsonl/.csv file, e.g. scrapy contacts or batch runner results"""
+    from batch_runner import load_targets
+
+    items = []
+    for record in load_targets(path):
+        # Failed sessions have nothing to summarize, and aliases repeat the entity they resolved to
+        if record.get("status") not in (None, "ok") or record.get("resolved_to"):
+            continue
+        # Batch runner records carry the target and result next to bookkeeping fields
+        content = {k: v for k, v in record.items() if k not in ("attempts", "duration", "status", "error")}
+        target = record.get("target") if isinstance(record.get("target"), dict) else {}
+        name = record.get("name") or target.get("name") or target.get("username") or record.get("key") or "?"
+        items.append(Item(str(name), json.dumps(content, ensure_ascii=False, default=str)))
+    return items
+
+
+def chunk(items: List[Item], limit: int = CHUNK_CHARS) -> List[List[Item]]:
+    """Consecutive items packed into chunks of at most `limit` characters"""
+    chunks, current, size = [], [], 0
+    for item in items:
+        if len(item.text) > ITEM_CHARS:
+            item = item._replace(text=item.text[:ITEM_CHARS] + "\n[truncated]")
+        if current and size + len(item.text) > limit:
+            chunks.append(current)
+            current, size = [], 0
+        current.append(item)
+        size += len(item.text)
+    return chunks + [current] if current else chunks
+
+
+def _item_tags(items: List[Item]) -> str:
+    return "\n\n".join(f'<item name="{item.name.replace(chr(34), chr(39))}">\n{item.text}\n</item>' for item in items)
+
+
+def make_request(custom_id: str, instructions: str, items: List[Item]) -> dict:
+    return {
+        "custom_id": custom_id,
+        "params": {
+            "model": MODEL,
+            "max_tokens": MAX_TOKENS,
+            "system": SYSTEM_PROMPT,
+            "messages": [{"role": "user", "content": f"{instructions}\n\n{_item_tags(items)}"}],
+        },
+    }
+
+
+def parse_findings(text: str) -> dict:
+    """The JSON object in a reply; the reply as one section if there isn't a valid one"""
+    match = re.search(r"\{.*\}", text, re.DOTALL)
+    if match:
+        try:
+            findings = json.loads(match.group(0))
+            if isinstance(findings, dict):
+                return findings
+        except ValueError:
+            pass
+    return {"summary": "", "sections": [{"heading": "Report", "content": text}]}
+
+
+def _text(message) -> str:
+    content = message.get("content") if isinstance(message, dict) else message.content
+    return "".join((b.get("text") if isinstance(b, dict) else getattr(b, "text", "")) or "" for b in content)
+
+
+def _field(obj, name):
+    return obj.get(name) if isinstance(obj, dict) else getattr(obj, name, None)
+
+
+class BatchSubmitter:
+    """Submit message batches, poll them until they end and resubmit what failed.
+
+    Each stage's batch id and finished replies are saved under `state_dir`, so
+    a rerun with the same requests resumes polling, or reuses the replies,
+    instead of submitting again.
+    """
+
+    def __init__(self, client, state_dir: Optional[str] = None, poll_max: float = POLL_MAX, retries: int = 2):
+        # anthropic 0.39 (requirements.txt) only has batches under beta
+        self.batches = client.beta.messages.batches
+        self.state_dir = state_dir
+        self.poll_max = poll_max
+        self.retries = retries
+
+    def _state_path(self, stage: str) -> Optional[str]:
+        return os.path.join(self.state_dir, f"batch-{stage}.json") if self.state_dir else None
+
+    def _load_state(self, stage: str) -> dict:
+        try:
+            with open(self._state_path(stage), encoding="utf-8") as f:
+                return json.load(f)
+        except (TypeError, OSError, ValueError):
+            return {}
+
+    def _save_state(self, stage: str, state: dict):
+        if self.state_dir:
+            os.makedirs(self.state_dir, exist_ok=True)
+            with open(self._state_path(stage), "w", encoding="utf-8") as f:
+                json.dump(state, f)
+
+    def _wait(self, batch_id: str) -> Tuple[Dict[str, str], Dict[str, str]]:
+        delay = 1.0
+        while True:
+            batch = self.batches.retrieve(batch_id)
+            if _field(batch, "processing_status") == "ended":
+                break
+            counts = _field(batch, "request_counts")
+            print(f"  batch {batch_id}: {_field(counts, 'processing') if counts else '?'} requests processing")
+            time.sleep(delay)
+            delay = min(self.poll_max, delay * 2)
+        texts, errors = {}, {}
+        for response in self.batches.results(batch_id):
+            result = _field(response, "result")
+            custom_id = _field(response, "custom_id")
+            if _field(result, "type") == "succeeded":
+                texts[custom_id] = _text(_field(result, "message"))
+            else:
+                # The SDK nests the API error one level down: result.error.error.message
+                error = _field(result, "error")
+                errors[custom_id] = str(_field(_field(error, "error") or error, "message") if error else _field(result, "type"))
+        return texts, errors
+
+    def run(self, requests: List[dict], stage: str = "map") -> Dict[str, str]:
+        """custom_id -> reply text for every request that succeeded within the retries"""
+        fingerprint = hashlib.sha256(json.dumps(requests, sort_keys=True).encode()).hexdigest()
+        state = self._load_state(stage)
+        if state.get("fingerprint") != fingerprint:
+            state = {}
+        texts = dict(state.get("texts", {}))
+        if state.get("finished"):
+            print(f"Reusing the {stage} replies of an earlier run")
+            return texts
+        pending = [r for r in requests if r["custom_id"] not in texts]
+        batch_id = state.get("batch_id")
+        for attempt in range(self.retries + 1):
+            if batch_id:
+                print(f"Resuming batch {batch_id}")
+            else:
+                batch_id = _field(self.batches.create(requests=pending), "id")
+                print(f"Submitted batch {batch_id} with {len(pending)} requests")
+            self._save_state(stage, {"fingerprint": fingerprint, "batch_id": batch_id, "texts": texts})
+            done, errors = self._wait(batch_id)
+            texts.update(done)
+            pending = [r for r in pending if r["custom_id"] not in texts]
+            batch_id = None
+            if not pending:
+                break
+            if attempt < self.retries:
+                reason = next(iter(errors.values()), "no result")
+                print(f"  {len(pending)} requests failed ({reason}), resubmitting")
+        self._save_state(stage, {"fingerprint": fingerprint, "texts": texts, "finished": not pending})
+        return texts
+
+
+class Task(NamedTuple):
+    instructions: str
+    # Combines the findings of several chunks; None means one more request with `reduce_instructions`
+    merge: Optional[Callable[[List[dict]], dict]]
+    reduce_instructions: Optional[str] = None
+
+
+def concat(parts: List[dict]) -> dict:
+    """Every chunk's sections and tables, one after the other"""
+    return {
+        "title": parts[0].get("title"),
+        "summary": " ".join(part.get("summary", "") for part in parts).strip(),
+        "sections": [section for part in parts for section in part.get("sections", [])],
+        "tables": [table for part in parts for table in part.get("tables", [])],
+    }
+
+
+def merge_rankings(parts: List[dict]) -> dict:
+    """Concatenate the chunks' ranking tables and re-rank by score"""
+    rows, columns = [], None
+    for part in parts:
+        for table in part.get("tables", []):
+            names = [str(c).lower() for c in table.get("columns", [])]
+            if "score" in names:
+                columns = columns or table["columns"]
+                rows += [row for row in table.get("rows", []) if len(row) == len(columns)]
+    if not columns:
+        return concat(parts)
+    names = [str(c).lower() for c in columns]
+    score, rank = names.index("score"), names.index("rank") if "rank" in names else None
+
+    def as_number(value):
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return -1.0
+
+    rows.sort(key=lambda row: as_number(row[score]), reverse=True)
+    if rank is not None:
+        rows = [row[:rank] + [position] + row[rank + 1:] for position, row in enumerate(rows, 1)]
+    return {
+        "title": parts[0].get("title") or "Ranking",
+        "summary": " ".join(part.get("summary", "") for part in parts).strip(),
+        "sections": parts[0].get("sections", []),
+        "tables": [{"name": "Ranking", "columns": columns, "rows": rows}],
+    }
+
+
+def aggregate(client, task: Task, items: List[Item], name: str, root: str = ROOT,
+              chunk_chars: int = CHUNK_CHARS, poll_max: float = POLL_MAX) -> Optional[str]:
+    """Summarize `items` in batched requests and render the result; returns the report directory"""
+    if not items:
+        print("Nothing to summarize")
+        return None
+    started = time.monotonic()
+    directory = report_dir("aggregate", name, root)
+    submitter = BatchSubmitter(client, directory, poll_max)
+    chunks = chunk(items, chunk_chars)
+    requests = [make_request(f"{slug_id(name)}-{i}", task.instructions.format(count=len(c)), c)
+                for i, c in enumerate(chunks)]
+    texts = submitter.run(requests)
+    parts = [parse_findings(texts[r["custom_id"]]) for r in requests if r["custom_id"] in texts]
+    missing = len(requests) - len(parts)
+    if not parts:
+        print("Every request failed; nothing written")
+        return None
+
+    if len(parts) == 1:
+        findings = parts[0]
+    elif task.merge:
+        findings = task.merge(parts)
+    else:
+        partials = [Item(f"part {i + 1}", render_markdown(dict(part, target=f"part {i + 1}")))
+                    for i, part in enumerate(parts)]
+        reduce_request = make_request(f"{slug_id(name)}-reduce", task.reduce_instructions.format(count=len(partials)),
+                                      partials)
+        reply = submitter.run([reduce_request], stage="reduce").get(reduce_request["custom_id"])
+        findings = parse_findings(reply) if reply else concat(parts)
+
+    if missing:
+        findings.setdefault("sections", []).append(
+            {"heading": "Coverage", "content": f"{missing} of {len(requests)} chunks failed and are not included."})
+    findings.update(job="aggregate", target=name, items=len(items), submitted_at=time.strftime("%Y-%m-%dT%H:%M:%S"))
+    written = render(findings, directory)
+    input_chars = sum(len(r["params"]["messages"][0]["content"]) for r in requests)
+    log_event("postprocess", name=name, items=len(items), requests=len(requests), failed=missing,
+              input_tokens=input_chars // 4, duration=round(time.monotonic() - started, 3))
+    print(f"{len(items)} targets summarized in {len(requests)} batched request(s), "
+          f"~{input_chars // 4} input tokens, {time.monotonic() - started:.0f}s; wrote {', '.join(written)}")
+    return directory
+
+
+def slug_id(name: str) -> str:
+    # custom_id allows [a-zA-Z0-9_-]{1,64}
+    return re.sub(r"[^a-zA-Z0-9_-]+", "-", name)[:48] or "aggregate"
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Summarize finished sessions across targets with batched requests")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("landscape", help="Market landscape from every submitted report")
+    p.add_argument("--job", help="Only this job's reports (default: all)")
+    p = sub.add_parser("rank", help="Rank records such as scraped contacts")
+    p.add_argument("input", help=".json, .jsonl or .csv file of records")
+    p.add_argument("--goal", default=DEFAULT_GOAL, help="What the ranking is for")
+    for p in sub.choices.values():
+        p.add_argument("--root", default=ROOT)
+        p.add_argument("--name")
+        p.add_argument("--chunk-chars", type=int, default=CHUNK_CHARS)
+        p.add_argument("--poll", type=float, default=POLL_MAX, help="Longest wait between status checks, in seconds")
+    args = parser.parse_args(argv)
+
+    from clients import get_anthropic
+
+    if args.command == "landscape":
+        items = collect_findings(args.root, args.job)
+        task = Task(LANDSCAPE, None, LANDSCAPE_REDUCE)
+        name = args.name or f"{args.job or 'all'}-landscape"
+    else:
+        items = collect_records(args.input)
+        goal = args.goal.replace("{", "{{").replace("}", "}}")
+        task = Task(RANK.replace("{goal}", goal), merge_rankings)
+        name = args.name or f"{os.path.splitext(os.path.basename(args.input))[0]}-ranking"
+    directory = aggregate(get_anthropic(), task, items, name, args.root, args.chunk_chars, args.poll)
+    return 0 if directory else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
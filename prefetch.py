@@ -0,0 +1,207 @@
+"""Speculative prefetch of the pages the agent is likely to open next.
+
+Research sessions follow predictable paths: a company homepage, then its
+/pricing, /about and /careers pages and a news search; a GitHub profile, then
+its repositories tab and top repositories. The prefetcher watches the URLs the
+agent types, predicts the next ones, and while the model call is in flight
+warms them in the agent's own Chromium: over its DevTools port (see
+`macros.chromium`) it adds `<link rel=prefetch>` hints to an open tab on the
+same site. Chromium fetches those pages into its HTTP cache in the background,
+under the same cache partition the later navigation uses, without opening
+tabs or touching the screen. A prediction with no open tab on its site isn't
+warmed.
+
+Only URLs Chromium actually took a hint for count as warmed, so every
+navigation is a hit (it was warmed) or a miss, with the latency of the tool
+call that loaded it, and the gain can be measured.
+"""
+import json
+import os
+import re
+import time
+from typing import Dict, Iterable, List, Optional
+from urllib.parse import quote_plus, urlsplit
+
+from macros import CHROMIUM_DEBUG_PORT
+from progress_log import log_event
+from wait_for import DEVTOOLS_CLIENT
+
+URL_RE = re.compile(r"(?:https?://)?(?:[a-z0-9-]+\.)+[a-z]{2,}(?:/[^\s'\"<>]*)?", re.IGNORECASE)
+SITE_PAGES = ("/pricing", "/about", "/careers", "/blog")
+MAX_WARM_PER_TURN = 4
+ENABLED = os.getenv("SCRAPYBARA_PREFETCH", "1") != "0"
+
+
+def canonical(url: str) -> str:
+    """Normalize a URL for matching: scheme, lowercase host, no www, no trailing slash"""
+    if "://" not in url:
+        url = "https://" + url
+    parts = urlsplit(url)
+    host = parts.netloc.lower().removeprefix("www.")
+    path = parts.path.rstrip("/")
+    query = f"?{parts.query}" if parts.query else ""
+    return f"https://{host}{path}{query}"
+
+
+def extract_urls(tool_name: str, tool_input: dict) -> List[str]:
+    """URLs the agent types (into the address bar) in a tool call"""
+    if tool_name != "computer" or not isinstance(tool_input, dict) or tool_input.get("action") != "type":
+        return []
+    return [canonical(match) for match in URL_RE.findall(tool_input.get("text", ""))]
+
+
+def predict(url: str, company: Optional[str] = None) -> List[str]:
+    """Likely next URLs after `url`, most likely first"""
+    parts = urlsplit(url)
+    host = parts.netloc
+    segments = [s for s in parts.path.split("/") if s]
+    if host == "github.com":
+        if len(segments) == 1 and not parts.query:
+            user = segments[0]
+            return [f"https://github.com/{user}?tab=repositories", f"https://github.com/orgs/{user}/repositories"]
+        if len(segments) == 1 and "tab=repositories" in parts.query:
+            user = segments[0]
+            return [f"https://github.com/{user}?tab=repositories&sort=stargazers"]
+        if len(segments) == 2:
+            repo = "/".join(segments)
+            return [f"https://github.com/{repo}/pulse", f"https://github.com/{repo}/graphs/contributors"]
+        return []
+    if host.endswith(("google.com", "bing.com", "duckduckgo.com")):
+        return []
+    predictions = []
+    if not segments:
+        predictions += [f"https://{host}{page}" for page in SITE_PAGES]
+        name = company or host.split(".")[0]
+        predictions.append(f"https://www.google.com/search?q={quote_plus(name + ' news')}&tbm=nws")
+    elif len(segments) == 1:
+        predictions += [f"https://{host}{page}" for page in SITE_PAGES if page != "/" + segments[0]]
+    return [canonical(u) for u in predictions]
+
+
+# Runs in the VM after `URLS = [...]` and `DEBUG_PORT = ...` lines; prints the URLs it warmed
+WARM_SCRIPT = DEVTOOLS_CLIENT + r'''
+def site(url):
+    host = urllib.parse.urlsplit(url).hostname or ""
+    return host[4:] if host.startswith("www.") else host
+
+warmed = []
+try:
+    pages = devtools_pages(DEBUG_PORT)
+except OSError:
+    pages = []
+for page in pages:
+    urls = [u for u in URLS if u not in warmed and site(u) == site(page["url"])]
+    if not urls:
+        continue
+    # On the tab's own origin, so "acme.com/pricing" is fetched as the "www.acme.com/pricing" it will be
+    origin = "{0.scheme}://{0.netloc}".format(urllib.parse.urlsplit(page["url"]))
+    hrefs = [origin + url.split(site(url), 1)[1] for url in urls]
+    expression = "".join(
+        "document.head.appendChild(Object.assign(document.createElement('link'), {rel: 'prefetch', href: %s}));"
+        % json.dumps(href) for href in hrefs
+    )
+    try:
+        result = devtools(page["webSocketDebuggerUrl"], "Runtime.evaluate", {"expression": expression})
+    except OSError:
+        continue
+    if result is not None and "exceptionDetails" not in result:
+        warmed += urls
+print(json.dumps(warmed))
+'''
+
+
+def _output(response) -> str:
+    if isinstance(response, dict):
+        return response.get("output") or ""
+    return getattr(response, "output", None) or ""
+
+
+class ChromiumWarmer:
+    """Warms URLs in the agent's Chromium with prefetch hints sent over its DevTools port"""
+
+    def __init__(self, instance):
+        self.instance = instance
+
+    def warm(self, urls: Iterable[str]) -> List[str]:
+        """The URLs Chromium took a hint for"""
+        header = f"URLS = {list(urls)!r}\nDEBUG_PORT = {CHROMIUM_DEBUG_PORT!r}\n"
+        command = f"timeout 20 python3 - <<'PREFETCH_EOF'\n{header}{WARM_SCRIPT}\nPREFETCH_EOF"
+        lines = _output(self.instance.bash(command=command)).strip().splitlines()
+        try:
+            return [url for url in json.loads(lines[-1]) if isinstance(url, str)]
+        except (IndexError, ValueError, TypeError):
+            return []
+
+
+class Prefetcher:
+    def __init__(self, warmer, seeds: Iterable[str] = (), company: Optional[str] = None, max_per_turn: int = MAX_WARM_PER_TURN):
+        self.warmer = warmer
+        self.company = company
+        self.max_per_turn = max_per_turn
+        self.visited = set()
+        self.warmed: Dict[str, float] = {}
+        self.queue: List[str] = []
+        self._typed: Optional[str] = None
+        self.stats = {"predicted": 0, "warmed": 0, "skipped": 0, "hits": 0, "misses": 0, "hit_latency": 0.0,
+                      "miss_latency": 0.0}
+        for seed in seeds:
+            self._enqueue([canonical(seed)] + predict(canonical(seed), company))
+
+    def _enqueue(self, urls: Iterable[str]):
+        for url in urls:
+            if url not in self.visited and url not in self.warmed and url not in self.queue:
+                self.queue.append(url)
+                self.stats["predicted"] += 1
+
+    def observe(self, tool_name: str, tool_input: dict, duration: float):
+        """Feed every tool call (after it ran) so navigations can be tracked"""
+        for url in extract_urls(tool_name, tool_input):
+            self._typed = url
+        if tool_name == "computer" and isinstance(tool_input, dict) and tool_input.get("action") == "key" \
+                and tool_input.get("text", "").lower() in ("return", "enter", "kp_enter") and self._typed:
+            self._navigated(self._typed, duration)
+            self._typed = None
+
+    def _navigated(self, url: str, duration: float):
+        hit = url in self.warmed
+        self.stats["hits" if hit else "misses"] += 1
+        self.stats["hit_latency" if hit else "miss_latency"] += duration
+        log_event("navigation", url=url, prefetched=hit, duration=round(duration, 3))
+        self.visited.add(url)
+        # Newest predictions go first; stale ones stay behind them
+        fresh = [u for u in predict(url, self.company) if u not in self.visited and u not in self.warmed]
+        self.stats["predicted"] += len([u for u in fresh if u not in self.queue])
+        self.queue = fresh + [u for u in self.queue if u not in fresh]
+
+    def warm(self):
+        """Warm the next few predictions; call while the model is thinking"""
+        batch, self.queue = self.queue[:self.max_per_turn], self.queue[self.max_per_turn:]
+        if not batch:
+            return
+        try:
+            warmed = self.warmer.warm(batch)
+        except Exception as e:
+            print(f"Prefetch failed: {e}")
+            return
+        now = time.monotonic()
+        for url in warmed:
+            self.warmed[url] = now
+        self.stats["warmed"] += len(warmed)
+        # No open tab on their site (or no DevTools port); they aren't counted as hits later
+        self.stats["skipped"] += len(batch) - len(warmed)
+
+    def summary(self) -> dict:
+        s = dict(self.stats)
+        navigations = s["hits"] + s["misses"]
+        s["hit_rate"] = round(s["hits"] / navigations, 3) if navigations else None
+        s["avg_hit_latency"] = round(s["hit_latency"] / s["hits"], 3) if s["hits"] else None
+        s["avg_miss_latency"] = round(s["miss_latency"] / s["misses"], 3) if s["misses"] else None
+        s["wasted"] = len([u for u in self.warmed if u not in self.visited])
+        return s
+
+
+def make_prefetcher(instance, seeds: Iterable[str] = (), company: Optional[str] = None) -> Optional[Prefetcher]:
+    """A VM-backed prefetcher, or None when SCRAPYBARA_PREFETCH=0"""
+    if not ENABLED:
+        return None
+    return Prefetcher(ChromiumWarmer(instance), seeds=seeds, company=company)
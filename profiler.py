@@ -0,0 +1,249 @@
+"""Where a session's wall time and tokens went, from the progress log.
+
+The agent loop already logs every model call, tool call and instance
+start/stop with its duration. With SCRAPYBARA_PROFILE=1 it also logs `phase`
+events for the work in between: building the request payload, waiting for
+rate-limit admission, turning tool results into records and archiving
+screenshots. This module reads those events back, so it works offline on any
+recorded log, and turns them into:
+
+  * a Chrome trace (`--trace out.json`) that chrome://tracing, Perfetto and
+    speedscope open directly: one row per session, model calls with their
+    phases nested inside, tool calls, instance boot and shutdown;
+  * a top-N summary of where the time went, the slowest turns and the most
+    expensive tools.
+
+    python profiler.py [--path LOG] [--session ID | --job JOB | --target NAME] [--top 10] [--trace out.json]
+"""
+import argparse
+import json
+import os
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Iterable, List, Optional
+
+from progress_log import LOG_PATH, log_event, read_events
+
+ENABLED = os.getenv("SCRAPYBARA_PROFILE", "0") == "1"
+
+_noop = nullcontext()
+
+
+@contextmanager
+def _timed(name: str, fields: dict):
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        log_event("phase", phase=name, duration=round(time.monotonic() - started, 4), **fields)
+
+
+def phase(name: str, **fields):
+    """Time a block as a `phase` event when profiling is on; a no-op otherwise"""
+    return _timed(name, fields) if ENABLED else _noop
+
+
+def load(paths: Iterable[str], session: Optional[str] = None, job: Optional[str] = None, target: Optional[str] = None) -> List[dict]:
+    """Session events from one or more logs (rotated files included), oldest first"""
+    events = []
+    for path in paths:
+        for event in read_events(path):
+            if not event.get("session"):
+                continue
+            if session and event["session"] != session:
+                continue
+            if job and event.get("job") != job:
+                continue
+            if target and str(event.get("target", "")).lower() != target.lower():
+                continue
+            events.append(event)
+    events.sort(key=lambda e: e["ts"])
+    return events
+
+
+def log_paths(path: str) -> List[str]:
+    """`path` and its rotated backups, oldest first"""
+    backups = []
+    i = 1
+    while os.path.exists(f"{path}.{i}"):
+        backups.append(f"{path}.{i}")
+        i += 1
+    return list(reversed(backups)) + ([path] if os.path.exists(path) else [])
+
+
+def _span_name(event: dict) -> str:
+    kind = event["event"]
+    if kind == "model_call":
+        return f"model turn {event.get('turn')}"
+    if kind == "tool":
+        return f"{event.get('tool')}:{event['action']}" if event.get("action") else str(event.get("tool"))
+    if kind == "phase":
+        return str(event.get("phase"))
+    if kind == "session_end":
+        return f"{event.get('job')} {event.get('target')}"
+    return kind
+
+
+def to_trace(events: List[dict]) -> dict:
+    """Chrome trace format: complete events ("X") whose start is end time minus duration"""
+    threads = {}
+    trace = []
+    for event in events:
+        session = event["session"]
+        if session not in threads:
+            threads[session] = len(threads) + 1
+            trace.append({
+                "name": "thread_name", "ph": "M", "pid": 1, "tid": threads[session],
+                "args": {"name": f"{session} {event.get('job')} {event.get('target')}"},
+            })
+        duration = event.get("duration")
+        if duration is None:
+            continue
+        args = {k: v for k, v in event.items() if k not in ("ts", "event", "session", "job", "target", "duration")}
+        trace.append({
+            "name": _span_name(event),
+            "cat": event["event"],
+            "ph": "X",
+            "ts": round((event["ts"] - duration) * 1e6),
+            "dur": round(duration * 1e6),
+            "pid": 1,
+            "tid": threads[session],
+            "args": args,
+        })
+        if event["event"] == "model_call" and event.get("input_tokens") is not None:
+            trace.append({
+                "name": "tokens", "ph": "C", "pid": 1, "tid": threads[session], "ts": round(event["ts"] * 1e6),
+                "args": {"input": event.get("input_tokens"), "output": event.get("output_tokens") or 0},
+            })
+    return {"traceEvents": trace, "displayTimeUnit": "ms"}
+
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def profile(events: List[dict]) -> dict:
+    """Aggregate wall time and tokens by phase, turn and tool"""
+    phases = defaultdict(float)
+    turns: Dict[tuple, dict] = {}
+    tools: Dict[str, dict] = {}
+    sessions = {}
+
+    def turn_state(event):
+        key = (event["session"], event.get("turn"))
+        return turns.setdefault(key, {
+            "session": event["session"], "target": event.get("target"), "turn": event.get("turn"),
+            "model": 0.0, "tools": 0.0, "input_tokens": 0, "output_tokens": 0, "calls": [],
+        })
+
+    for event in events:
+        kind = event["event"]
+        duration = event.get("duration") or 0.0
+        if kind == "model_call":
+            phases["model"] += duration
+            state = turn_state(event)
+            state["model"] += duration
+            state["input_tokens"] += event.get("input_tokens") or 0
+            state["output_tokens"] += event.get("output_tokens") or 0
+        elif kind == "tool":
+            phases["tools"] += duration
+            state = turn_state(event)
+            state["tools"] += duration
+            name = _span_name(event)
+            state["calls"].append(name)
+            stats = tools.setdefault(name, {"calls": 0, "durations": [], "errors": 0, "result_tokens": 0.0})
+            stats["calls"] += 1
+            stats["durations"].append(duration)
+            stats["errors"] += bool(event.get("error"))
+        elif kind == "phase":
+            # Phases break down the time around model and tool calls; listed, not added to the total
+            phases[f"  {event.get('phase')}"] += duration
+        elif kind in ("instance_start", "instance_stop"):
+            phases[kind.replace("_", " ")] += duration
+        elif kind == "throttled":
+            phases["  throttled backoff"] += event.get("delay") or 0.0
+        elif kind == "session_end":
+            sessions[event["session"]] = duration
+
+    # Tool results are what grows the next request: charge each turn's input
+    # token growth (minus the model's own output) evenly to that turn's tools
+    by_session = defaultdict(list)
+    for state in turns.values():
+        by_session[state["session"]].append(state)
+    for states in by_session.values():
+        states.sort(key=lambda s: s["turn"] or 0)
+        for state, following in zip(states, states[1:]):
+            growth = following["input_tokens"] - state["input_tokens"] - state["output_tokens"]
+            if growth > 0 and state["calls"]:
+                for name in state["calls"]:
+                    tools[name]["result_tokens"] += growth / len(state["calls"])
+
+    accounted = sum(phases.get(name, 0.0) for name in ("model", "tools", "instance start", "instance stop"))
+    wall = sum(sessions.values())
+    if wall > accounted:
+        phases["other (loop, prints, waits)"] = wall - accounted
+    return {"wall": wall, "sessions": len(sessions), "phases": dict(phases), "turns": list(turns.values()), "tools": tools}
+
+
+def render(report: dict, top: int = 10) -> str:
+    lines = []
+    wall = report["wall"] or sum(v for k, v in report["phases"].items() if not k.startswith(" ")) or 1.0
+    lines.append(f"{report['sessions']} finished sessions, {report['wall']:.1f}s wall")
+    lines.append("")
+    lines.append(f"{'PHASE':34} {'SECONDS':>9} {'SHARE':>6}")
+    for name, seconds in sorted(report["phases"].items(), key=lambda item: (item[0].startswith(" "), -item[1])):
+        lines.append(f"{name:34} {seconds:>9.2f} {seconds / wall:>6.1%}")
+
+    lines.append("")
+    lines.append(f"Slowest {top} turns")
+    lines.append(f"{'SESSION':12} {'TARGET':20} {'TURN':>4} {'TOTAL s':>8} {'MODEL s':>8} {'TOOLS s':>8} {'IN TOK':>7} {'OUT TOK':>7}  TOOLS")
+    slowest = sorted(report["turns"], key=lambda t: t["model"] + t["tools"], reverse=True)[:top]
+    for t in slowest:
+        lines.append(
+            f"{t['session']:12} {str(t['target'])[:20]:20} {t['turn'] or 0:>4} {t['model'] + t['tools']:>8.2f} "
+            f"{t['model']:>8.2f} {t['tools']:>8.2f} {t['input_tokens']:>7} {t['output_tokens']:>7}  {', '.join(t['calls'])[:40]}"
+        )
+
+    lines.append("")
+    lines.append(f"Most expensive {top} tools")
+    lines.append(f"{'TOOL':28} {'CALLS':>5} {'TOTAL s':>8} {'MEAN s':>7} {'P95 s':>7} {'ERRORS':>6} {'~RESULT TOK':>11}")
+    ranked = sorted(report["tools"].items(), key=lambda item: sum(item[1]["durations"]), reverse=True)[:top]
+    for name, s in ranked:
+        total = sum(s["durations"])
+        lines.append(
+            f"{name[:28]:28} {s['calls']:>5} {total:>8.2f} {total / s['calls']:>7.2f} "
+            f"{_percentile(s['durations'], 0.95):>7.2f} {s['errors']:>6} {round(s['result_tokens']):>11}"
+        )
+    return "\n".join(lines)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Profile recorded sessions from the progress log")
+    parser.add_argument("--path", default=LOG_PATH, help="Progress log (rotated backups are read too)")
+    parser.add_argument("--session")
+    parser.add_argument("--job")
+    parser.add_argument("--target")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--trace", help="Write a Chrome trace / speedscope JSON file here")
+    args = parser.parse_args(argv)
+
+    paths = log_paths(args.path)
+    if not paths:
+        print(f"No log at {args.path}")
+        return 1
+    events = load(paths, session=args.session, job=args.job, target=args.target)
+    if not events:
+        print("No matching session events")
+        return 1
+    print(render(profile(events), top=args.top))
+    if args.trace:
+        with open(args.trace, "w", encoding="utf-8") as f:
+            json.dump(to_trace(events), f)
+        print(f"\nTrace written to {args.trace} (open in chrome://tracing, ui.perfetto.dev or speedscope.app)")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
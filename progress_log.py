@@ -0,0 +1,261 @@
+"""Structured progress log written to scrapybara_progress.log.
+
+Every event is one JSON line carrying the session id, job, target and (when
+relevant) the turn, tool and duration. Callers only put records on an
+in-memory queue; a background thread drains it in batches, writes each batch
+with a single write() and rotates the file by size, so logging never blocks
+the event loop.
+
+Only one process writes the file: batch worker processes `forward_to` the
+coordinator, which writes their records along with its own, so rotation never
+races between writers.
+
+    python progress_log.py tail [-f]   # live view grouped by session
+"""
+import argparse
+import atexit
+import contextvars
+import functools
+import inspect
+import itertools
+import json
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+LOG_PATH = os.getenv("SCRAPYBARA_PROGRESS_LOG", "scrapybara_progress.log")
+MAX_BYTES = int(os.getenv("SCRAPYBARA_PROGRESS_LOG_MAX_BYTES", 10 * 1024 * 1024))
+BACKUP_COUNT = 5
+MAX_BATCH = 1000
+
+_session = contextvars.ContextVar("progress_session", default=None)
+_session_ids = itertools.count(1)
+
+
+class ProgressWriter:
+    """Queue-backed JSONL writer with size-based rotation.
+
+    With `send`, batches of records are handed to it instead of being written.
+    """
+
+    def __init__(self, path: str = LOG_PATH, max_bytes: int = MAX_BYTES, backup_count: int = BACKUP_COUNT,
+                 send: Optional[Callable[[List[dict]], Any]] = None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.send = send
+        self.queue = queue.SimpleQueue()
+        self.written = 0
+        self._stop = object()
+        self._thread = threading.Thread(target=self._run, name="progress-log", daemon=True)
+        self._thread.start()
+
+    def put(self, record: dict):
+        self.queue.put(record)
+
+    def close(self, timeout: float = 5.0):
+        self.queue.put(self._stop)
+        self._thread.join(timeout)
+
+    def _rotate(self, f):
+        f.close()
+        for i in range(self.backup_count - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        if self.backup_count:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        return open(self.path, "ab")
+
+    def _run(self):
+        f = None if self.send else open(self.path, "ab")
+        try:
+            while True:
+                batch = [self.queue.get()]
+                while len(batch) < MAX_BATCH:
+                    try:
+                        batch.append(self.queue.get_nowait())
+                    except queue.Empty:
+                        break
+                stopping = any(record is self._stop for record in batch)
+                records = [record for record in batch if record is not self._stop]
+                if records and self.send:
+                    self.send(records)
+                elif records:
+                    data = "".join(
+                        json.dumps(record, separators=(",", ":"), default=str) + "\n" for record in records
+                    ).encode("utf-8")
+                    if self.max_bytes and f.tell() + len(data) > self.max_bytes and f.tell() > 0:
+                        f = self._rotate(f)
+                    f.write(data)
+                    f.flush()
+                self.written += len(records)
+                if stopping:
+                    return
+        finally:
+            if f is not None:
+                f.close()
+
+
+_writer: Optional[ProgressWriter] = None
+_writer_lock = threading.Lock()
+
+
+def get_writer() -> ProgressWriter:
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = ProgressWriter()
+            atexit.register(_writer.close)
+        return _writer
+
+
+def forward_to(send: Callable[[List[dict]], Any]):
+    """Hand this process's records to `send` in batches instead of writing the log itself"""
+    global _writer
+    with _writer_lock:
+        if _writer is not None:
+            _writer.close()
+        _writer = ProgressWriter(send=send)
+        atexit.register(_writer.close)
+
+
+def log_event(event: str, **fields):
+    """Record one event, tagged with the current session if there is one"""
+    record = {"ts": round(time.time(), 3), "event": event}
+    session = _session.get()
+    if session:
+        record.update(session)
+    record.update({k: v for k, v in fields.items() if v is not None})
+    get_writer().put(record)
+
+
+@contextmanager
+def log_session(job: str, target: str):
+    """Tag every event inside the block with a new session id"""
+    session_id = f"{os.getpid()}-{next(_session_ids)}"
+    token = _session.set({"session": session_id, "job": job, "target": target})
+    started = time.monotonic()
+    log_event("session_start")
+    status = "error"
+    try:
+        yield session_id
+        status = "ok"
+    finally:
+        log_event("session_end", status=status, duration=round(time.monotonic() - started, 3))
+        _session.reset(token)
+
+
+def logged_session(job: str, target_arg: str):
+    """Decorator for async session functions: run each call inside `log_session`"""
+    def decorate(fn):
+        signature = inspect.signature(fn)
+
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            target = signature.bind(*args, **kwargs).arguments.get(target_arg)
+            with log_session(job, target):
+                return await fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def _parse(lines: Iterable) -> Iterator[dict]:
+    # A crash mid-write can leave a torn line; skip it rather than lose the rest
+    for line in lines:
+        try:
+            yield json.loads(line)
+        except ValueError:
+            continue
+
+
+def read_events(path: str = LOG_PATH) -> Iterator[dict]:
+    with open(path, encoding="utf-8") as f:
+        yield from _parse(f)
+
+
+def summarize(events: Iterable[dict], sessions: Optional[Dict[str, dict]] = None) -> Dict[str, dict]:
+    """Fold events into one state dict per session"""
+    sessions = {} if sessions is None else sessions
+    for event in events:
+        session_id = event.get("session")
+        if not session_id:
+            continue
+        state = sessions.setdefault(session_id, {
+            "job": event.get("job"), "target": event.get("target"), "status": "running",
+            "started": event["ts"], "turns": 0, "tools": 0, "model_time": 0.0, "tool_time": 0.0,
+        })
+        state["last"] = event
+        kind = event["event"]
+        if kind == "model_call":
+            state["turns"] = max(state["turns"], event.get("turn", 0))
+            state["model_time"] += event.get("duration", 0)
+        elif kind == "tool":
+            state["tools"] += 1
+            state["tool_time"] += event.get("duration", 0)
+        elif kind == "session_end":
+            state["status"] = event.get("status", "ok")
+            state["duration"] = event.get("duration")
+    return sessions
+
+
+def render(sessions: Dict[str, dict], limit: int = 50) -> str:
+    rows = sorted(sessions.items(), key=lambda item: item[1]["last"]["ts"], reverse=True)[:limit]
+    lines = [f"{'SESSION':12} {'JOB':8} {'TARGET':24} {'STATUS':8} {'TURN':>4} {'TOOLS':>5} {'MODEL s':>8} {'TOOL s':>7}  LAST EVENT"]
+    for session_id, s in rows:
+        last = s["last"]
+        detail = last["event"] + (f" {last['tool']}" if last.get("tool") else "")
+        lines.append(
+            f"{session_id:12} {str(s['job'])[:8]:8} {str(s['target'])[:24]:24} {s['status']:8} "
+            f"{s['turns']:>4} {s['tools']:>5} {s['model_time']:>8.1f} {s['tool_time']:>7.1f}  {detail}"
+        )
+    return "\n".join(lines)
+
+
+def tail(path: str = LOG_PATH, follow: bool = False, interval: float = 1.0):
+    """Print sessions grouped from the log; with `follow`, keep redrawing as it grows"""
+    sessions = {}
+    position = 0
+    inode = None
+    while True:
+        try:
+            stat = os.stat(path)
+            if inode is not None and (stat.st_ino != inode or stat.st_size < position):
+                position = 0  # rotated
+            inode = stat.st_ino
+            with open(path, "rb") as f:
+                f.seek(position)
+                chunk = f.read()
+            # Only consume complete lines; a partial last line is picked up next round
+            complete = chunk[:chunk.rfind(b"\n") + 1]
+            position += len(complete)
+            summarize(_parse(complete.splitlines()), sessions)
+        except FileNotFoundError:
+            pass
+        if not follow:
+            print(render(sessions))
+            return
+        print("\033[2J\033[H" + render(sessions), flush=True)
+        time.sleep(interval)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Structured progress log")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("tail", help="Show sessions grouped from the log")
+    p.add_argument("-f", "--follow", action="store_true")
+    p.add_argument("--path", default=LOG_PATH)
+    args = parser.parse_args(argv)
+    try:
+        tail(args.path, follow=args.follow)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,338 @@
+"""Reports rendered locally from structured findings.
+
+The research sessions used to have the agent open LibreOffice Writer and Calc
+and type notes and spreadsheet cells through the GUI, one click and
+screenshot at a time. `FindingsTool` ("submit_findings") lets the agent hand
+over its research as JSON instead: a title, a summary, sections and tables.
+They are rendered here, outside the VM, in one step:
+
+    reports/<job>/<target>/findings.json   the submitted findings
+    reports/<job>/<target>/report.md       always
+    reports/<job>/<target>/report.docx     with python-docx installed
+    reports/<job>/<target>/report.xlsx     with openpyxl installed (otherwise one .csv per table)
+
+Several submissions in one session are merged: a section or table with the
+same heading/name replaces the earlier one. Sessions then only browse.
+
+    python reports.py render [--root reports] [--job sales]   # re-render every target and write index files
+"""
+import argparse
+import asyncio
+import csv
+import json
+import os
+import re
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+from progress_log import log_event
+
+ROOT = os.getenv("SCRAPYBARA_REPORTS_DIR", "reports")
+
+
+def slug(name: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "-", name.lower()).strip("-")[:60] or "target"
+
+
+def report_dir(job: str, target: str, root: str = ROOT) -> str:
+    return os.path.join(root, job, slug(target))
+
+
+def merge(old: Optional[dict], new: dict) -> dict:
+    """Merge a new submission into the earlier one for the same target"""
+    if not old:
+        return dict(new)
+    merged = dict(old)
+    for key in ("title", "summary"):
+        if new.get(key):
+            merged[key] = new[key]
+    for key, name in (("sections", "heading"), ("tables", "name")):
+        items = {item.get(name): item for item in old.get(key, [])}
+        for item in new.get(key, []):
+            items[item.get(name)] = item
+        merged[key] = list(items.values())
+    merged["sources"] = list(dict.fromkeys(old.get("sources", []) + new.get("sources", [])))
+    return merged
+
+
+def _text(value: Any) -> str:
+    return "" if value is None else str(value)
+
+
+def _cell(value: Any) -> str:
+    """Markdown table cell"""
+    return _text(value).replace("|", "\\|").replace("\n", " ")
+
+
+def render_markdown(findings: dict) -> str:
+    lines = [f"# {findings.get('title') or findings['target']}", ""]
+    if findings.get("summary"):
+        lines += [findings["summary"], ""]
+    for section in findings.get("sections", []):
+        lines += [f"## {section.get('heading', '')}", ""]
+        if section.get("content"):
+            lines += [section["content"], ""]
+        lines += [f"- {bullet}" for bullet in section.get("bullets", [])]
+        if section.get("bullets"):
+            lines.append("")
+    for table in findings.get("tables", []):
+        columns = table.get("columns", [])
+        lines += [f"## {table.get('name', 'Table')}", "", "| " + " | ".join(_cell(c) for c in columns) + " |",
+                  "|" + "---|" * len(columns)]
+        lines += ["| " + " | ".join(_cell(v) for v in row) + " |" for row in table.get("rows", [])]
+        lines.append("")
+    if findings.get("sources"):
+        lines += ["## Sources", ""] + [f"- {source}" for source in findings["sources"]] + [""]
+    return "\n".join(lines)
+
+
+def render_docx(findings: dict, path: str) -> bool:
+    try:
+        import docx
+    except ImportError:
+        return False
+    document = docx.Document()
+    document.add_heading(findings.get("title") or findings["target"], level=0)
+    if findings.get("summary"):
+        document.add_paragraph(findings["summary"])
+    for section in findings.get("sections", []):
+        document.add_heading(section.get("heading", ""), level=1)
+        if section.get("content"):
+            document.add_paragraph(section["content"])
+        for bullet in section.get("bullets", []):
+            document.add_paragraph(str(bullet), style="List Bullet")
+    for table in findings.get("tables", []):
+        columns = table.get("columns", [])
+        document.add_heading(table.get("name", "Table"), level=1)
+        grid = document.add_table(rows=1, cols=max(1, len(columns)))
+        grid.style = "Table Grid"
+        for cell, column in zip(grid.rows[0].cells, columns):
+            cell.text = _text(column)
+        for row in table.get("rows", []):
+            for cell, value in zip(grid.add_row().cells, row):
+                cell.text = _text(value)
+    if findings.get("sources"):
+        document.add_heading("Sources", level=1)
+        for source in findings["sources"]:
+            document.add_paragraph(source, style="List Bullet")
+    document.save(path)
+    return True
+
+
+def _sheet_title(name: str, index: int, used: set) -> str:
+    """A valid, unique sheet title: at most 31 characters including the index suffix"""
+    base = re.sub(r"[\[\]:*?/\\]", " ", name).strip("' ") or f"Table {index + 1}"
+    title, n = base[:31], index + 1
+    while title.lower() in used:
+        suffix = f" {n}"
+        title = base[:31 - len(suffix)].rstrip() + suffix
+        n += 1
+    used.add(title.lower())
+    return title
+
+
+def _sheet_cell(value):
+    """Spreadsheet cell value: numbers and blanks as they are, anything else as text"""
+    return value if isinstance(value, (int, float)) or value is None else str(value)
+
+
+def _quote_formulas(cells):
+    """Store text a spreadsheet would run as a formula (=, +, -, @) as quoted text"""
+    for cell in cells:
+        if isinstance(cell.value, str) and cell.value.startswith(("=", "+", "-", "@")):
+            cell.data_type = "s"
+            cell.quotePrefix = True
+
+
+def _write_tables(tables: List[dict], path: str) -> List[str]:
+    """All tables as one .xlsx (openpyxl) or, failing that, one .csv each; returns the files written"""
+    try:
+        import openpyxl
+        from openpyxl.styles import Font
+    except ImportError:
+        written = []
+        for table in tables:
+            csv_path = os.path.join(os.path.dirname(path), f"{slug(table.get('name', 'table'))}.csv")
+            with open(csv_path, "w", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f)
+                writer.writerow(table.get("columns", []))
+                writer.writerows(table.get("rows", []))
+            written.append(csv_path)
+        return written
+    workbook = openpyxl.Workbook()
+    workbook.remove(workbook.active)
+    titles = set()
+    for i, table in enumerate(tables):
+        sheet = workbook.create_sheet(_sheet_title(table.get("name") or "", i, titles))
+        sheet.append([_sheet_cell(value) for value in table.get("columns", [])])
+        for cell in sheet[1]:
+            cell.font = Font(bold=True)
+        for row in table.get("rows", []):
+            sheet.append([_sheet_cell(value) for value in row])
+        for row in sheet.iter_rows():
+            _quote_formulas(row)
+        for column in sheet.columns:
+            width = max(len(str(cell.value or "")) for cell in column)
+            sheet.column_dimensions[column[0].column_letter].width = min(60, max(10, width + 2))
+    workbook.save(path)
+    return [path]
+
+
+def render(findings: dict, directory: str) -> List[str]:
+    """Write every format for one target; returns the files written"""
+    os.makedirs(directory, exist_ok=True)
+    written = []
+    with open(os.path.join(directory, "findings.json"), "w", encoding="utf-8") as f:
+        json.dump(findings, f, indent=2, ensure_ascii=False)
+    written.append(f.name)
+    with open(os.path.join(directory, "report.md"), "w", encoding="utf-8") as f:
+        f.write(render_markdown(findings))
+    written.append(f.name)
+    if render_docx(findings, os.path.join(directory, "report.docx")):
+        written.append(os.path.join(directory, "report.docx"))
+    if findings.get("tables"):
+        written += _write_tables(findings["tables"], os.path.join(directory, "report.xlsx"))
+    return written
+
+
+class FindingsTool:
+    """Tool the agent submits its research through, instead of typing it into LibreOffice."""
+
+    def __init__(self, job: str, target: str, root: str = ROOT):
+        self.job = job
+        self.target = target
+        self.directory = report_dir(job, target, root)
+        # Merged submissions of this session; an earlier run's report is overwritten, not extended
+        self.findings: Optional[dict] = None
+
+    def to_params(self) -> Dict[str, Any]:
+        return {
+            "name": "submit_findings",
+            "description": """Submit your research findings; they are written as a formatted report (.docx, .md) and
+            spreadsheet (.xlsx) for you. Use this instead of LibreOffice. You can submit several times: a section
+            or table with the same heading/name replaces the earlier one.
+            - sections: notes and analysis, each with a heading, text and/or bullet points
+            - tables: spreadsheet data, each with a name, column names and rows
+            - sources: URLs you used""",
+            "input_schema": {
+                "type": "object",
+                "properties": {
+                    "title": {"type": "string"},
+                    "summary": {"type": "string", "description": "A few sentences with the key takeaways"},
+                    "sections": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "heading": {"type": "string"},
+                                "content": {"type": "string"},
+                                "bullets": {"type": "array", "items": {"type": "string"}},
+                            },
+                            "required": ["heading"],
+                        },
+                    },
+                    "tables": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "name": {"type": "string"},
+                                "columns": {"type": "array", "items": {"type": "string"}},
+                                "rows": {"type": "array", "items": {"type": "array", "items": {}}},
+                            },
+                            "required": ["name", "columns", "rows"],
+                        },
+                    },
+                    "sources": {"type": "array", "items": {"type": "string"}},
+                },
+                "required": ["summary"],
+            },
+        }
+
+    def _submit(self, submission: dict) -> List[str]:
+        findings = merge(self.findings, submission)
+        findings.update(job=self.job, target=self.target, submitted_at=time.strftime("%Y-%m-%dT%H:%M:%S"))
+        written = render(findings, self.directory)
+        self.findings = findings
+        return written
+
+    def result(self) -> dict:
+        """What a session returns: where its report is and what was submitted (both None if nothing was)"""
+        return {"report_dir": self.directory if self.findings else None, "findings": self.findings}
+
+    async def __call__(self, summary: str, title: str = None, sections: list = None, tables: list = None,
+                       sources: list = None):
+        # Imported here so `cli.py reports` doesn't pull in the SDK
+        from scrapybara.anthropic import ToolResult
+
+        for table in tables or []:
+            width = len(table.get("columns", []))
+            bad = [i for i, row in enumerate(table.get("rows", [])) if not isinstance(row, list) or len(row) != width]
+            if bad:
+                return ToolResult(error=f"table {table.get('name')!r}: rows {bad[:5]} don't have {width} values")
+        submission = {"title": title, "summary": summary, "sections": sections or [], "tables": tables or [],
+                      "sources": sources or []}
+        started = time.monotonic()
+        try:
+            written = await asyncio.to_thread(self._submit, submission)
+        except Exception as e:
+            return ToolResult(error=f"could not write the report: {e}")
+        log_event("findings", sections=len(sections or []), tables=len(tables or []), files=len(written),
+                  duration=round(time.monotonic() - started, 3))
+        return ToolResult(output="Report written: " + ", ".join(os.path.basename(p) for p in written))
+
+
+def render_all(root: str = ROOT, job: Optional[str] = None) -> List[dict]:
+    """Re-render every submitted target under `root` and write index.md / index.xlsx next to them"""
+    rows = []
+    for job_name in sorted(os.listdir(root)) if os.path.isdir(root) else []:
+        if job and job_name != job or not os.path.isdir(os.path.join(root, job_name)):
+            continue
+        for target in sorted(os.listdir(os.path.join(root, job_name))):
+            directory = os.path.join(root, job_name, target)
+            try:
+                with open(os.path.join(directory, "findings.json"), encoding="utf-8") as f:
+                    findings = json.load(f)
+            except (OSError, ValueError):
+                continue
+            written = render(findings, directory)
+            rows.append({
+                "job": job_name,
+                "target": findings.get("target", target),
+                "title": findings.get("title") or "",
+                "summary": findings.get("summary", ""),
+                "sections": len(findings.get("sections", [])),
+                "tables": len(findings.get("tables", [])),
+                "submitted_at": findings.get("submitted_at", ""),
+                "files": len(written),
+                "path": directory,
+            })
+
+    if rows:
+        columns = list(rows[0])
+        index = {"target": "index", "title": f"Reports under {root}", "summary": f"{len(rows)} targets",
+                 "tables": [{"name": "Targets", "columns": columns, "rows": [[row[c] for c in columns] for row in rows]}]}
+        with open(os.path.join(root, "index.md"), "w", encoding="utf-8") as f:
+            f.write(render_markdown(index))
+        _write_tables(index["tables"], os.path.join(root, "index.xlsx"))
+    return rows
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Re-render submitted findings and index them")
+    parser.add_argument("command", choices=["render"])
+    parser.add_argument("--root", default=ROOT)
+    parser.add_argument("--job")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    rows = render_all(args.root, args.job)
+    for row in rows:
+        print(f"{row['job']:10} {row['target'][:40]:40} {row['sections']:>3} sections {row['tables']:>3} tables")
+    print(f"Rendered {len(rows)} reports in {time.perf_counter() - started:.2f}s; index in {args.root}/index.md")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
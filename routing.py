@@ -0,0 +1,206 @@
+"""Per-turn model and max_tokens routing for the agent loop.
+
+Many turns are mechanical: after a click, a keypress or a file write the model
+usually just takes a screenshot or moves on to the next step. Those turns go
+to the fast tier (a smaller `max_tokens` and, if SCRAPYBARA_FAST_MODEL names a
+cheaper computer-use capable model, that model). Planning, reading a screen or
+a file, and anything after an error go to the strong tier.
+
+Escalation rules:
+  * the first turn, and any turn after a turn that only observed (screenshot,
+    file view, bash output), is strong;
+  * a tool error, a failed tool call, or hedging in the model's text ("not
+    sure", "didn't work", ...) makes the next `escalate_turns` turns strong;
+  * a fast turn that hits `max_tokens` is re-asked on the strong tier;
+  * after `max_fast_streak` fast turns in a row the next turn is strong.
+
+Every decision is kept in `router.decisions` and logged as a `route` event, so
+routing can be checked against a fake client (tests/test_routing.py plays
+scripted turns through it); `summary()` estimates the cost and latency saved
+against running every turn on the strong tier.
+"""
+import os
+import re
+import time
+from typing import Any, List, NamedTuple, Optional
+
+from progress_log import log_event
+
+# USD per million input/output tokens
+PRICES = {
+    "claude-3-5-sonnet-20241022": (3.0, 15.0),
+    "claude-3-7-sonnet-20250219": (3.0, 15.0),
+    "claude-3-5-haiku-20241022": (0.8, 4.0),
+    "claude-3-haiku-20240307": (0.25, 1.25),
+}
+
+# Actions that change state without giving the model anything new to read
+ACTIONS = {
+    "computer": {"left_click", "right_click", "double_click", "middle_click", "mouse_move", "left_click_drag", "key", "type", "scroll"},
+    "str_replace_editor": {"create", "str_replace", "insert", "undo_edit"},
+}
+# "failed" and "error" only as the model's own setbacks, not narration like "error rates" or "failed startups"
+HEDGING = re.compile(
+    r"\b(not sure|unsure|unclear|unable to|couldn'?t|can'?t find|cannot find|didn'?t work|doesn'?t seem|"
+    r"(?:that|this|it) (?:failed|didn'?t load)|failed to (?:load|open|find|click|run|save|submit)|"
+    r"(?:got|getting|seeing|hit|encountered|there(?:'s| is| was)) an? error|an error (?:occurred|appeared|message)|"
+    r"try again|another approach|something went wrong)\b",
+    re.IGNORECASE,
+)
+MAX_BASH_OUTPUT = 200
+
+
+class Tier(NamedTuple):
+    name: str
+    model: str
+    max_tokens: int
+
+
+class Decision(NamedTuple):
+    turn: int
+    tier: str
+    model: str
+    max_tokens: int
+    reason: str
+    duration: float
+    input_tokens: int
+    output_tokens: int
+    retried: bool
+
+
+class Router:
+    def __init__(self, fast: Tier, strong: Tier, enabled: bool = True, escalate_turns: int = 2, max_fast_streak: int = 3):
+        self.fast = fast
+        self.strong = strong
+        self.enabled = enabled
+        self.escalate_turns = escalate_turns
+        self.max_fast_streak = max_fast_streak
+        self.decisions: List[Decision] = []
+        self._escalated = 0
+        self._fast_streak = 0
+        self._last_calls: List[tuple] = []
+        self._pending: List[tuple] = []
+        self._escalation_reason = None
+        self._last_tier: Optional[Tier] = None
+
+    @classmethod
+    def from_env(cls, model: str, **kwargs) -> "Router":
+        """Tiers from SCRAPYBARA_FAST_MODEL / _FAST_MAX_TOKENS / _STRONG_MODEL / _STRONG_MAX_TOKENS"""
+        return cls(
+            fast=Tier("fast", os.getenv("SCRAPYBARA_FAST_MODEL", model), int(os.getenv("SCRAPYBARA_FAST_MAX_TOKENS", 1024))),
+            strong=Tier("strong", os.getenv("SCRAPYBARA_STRONG_MODEL", model), int(os.getenv("SCRAPYBARA_STRONG_MAX_TOKENS", 4096))),
+            enabled=os.getenv("SCRAPYBARA_ROUTING", "1") != "0",
+            **kwargs,
+        )
+
+    def escalate(self, reason: str):
+        self._escalated = self.escalate_turns
+        self._escalation_reason = reason
+
+    def choose(self, turn: int):
+        """The tier for this turn and why"""
+        if not self.enabled:
+            return self.strong, "routing off"
+        if turn == 1:
+            return self.strong, "planning"
+        if self._escalated > 0:
+            return self.strong, f"escalated: {self._escalation_reason}"
+        if self._fast_streak >= self.max_fast_streak:
+            return self.strong, "re-plan after fast streak"
+        if not self._last_calls:
+            return self.strong, "no tool calls"
+        if all(mechanical for _, mechanical in self._last_calls):
+            return self.fast, "after " + ", ".join(sorted({label for label, _ in self._last_calls}))
+        return self.strong, "observation to read"
+
+    def observe_tool(self, name: str, tool_input: Any, result: Any):
+        """Feed each tool call of the turn with its ToolResult (or None if it failed)"""
+        action = tool_input.get("action") if isinstance(tool_input, dict) else None
+        if name == "str_replace_editor" and isinstance(tool_input, dict):
+            action = tool_input.get("command")
+        label = f"{name}:{action}" if action else name
+        if result is None or getattr(result, "error", None):
+            self.escalate(f"{label} failed")
+        if name == "bash":
+            mechanical = len(getattr(result, "output", None) or "") <= MAX_BASH_OUTPUT
+        elif name == "file_ops":
+            operations = tool_input.get("operations") if isinstance(tool_input, dict) else None
+            mechanical = all(op.get("op") != "read" for op in operations or ())
+        elif name == "submit_findings":
+            mechanical = True
+        else:
+            mechanical = action in ACTIONS.get(name, ())
+        self._pending.append((label, mechanical))
+
+    def observe_response(self, response):
+        """Feed the model's response: hedging in its text escalates"""
+        for block in response.content:
+            if getattr(block, "type", None) == "text" and HEDGING.search(block.text or ""):
+                self.escalate("low confidence")
+                break
+
+    def _end_turn(self):
+        self._last_calls, self._pending = self._pending, []
+        self._fast_streak = self._fast_streak + 1 if self._last_tier is self.fast else 0
+
+    async def create_message(self, scheduler, client, *, turn: int, **kwargs):
+        """Route one turn's model call through `scheduler.create_message`"""
+        # Tool results observed since the last call belong to the previous turn
+        if turn > 1:
+            self._end_turn()
+        tier, reason = self.choose(turn)
+        if reason.startswith("escalated"):
+            self._escalated -= 1
+        started = time.monotonic()
+        response = await scheduler.create_message(client, model=tier.model, max_tokens=tier.max_tokens, **kwargs)
+        retried = False
+        if tier is self.fast and getattr(response, "stop_reason", None) == "max_tokens":
+            self._record(turn, tier, reason + ", hit max_tokens", started, response, False)
+            tier, reason, retried = self.strong, "fast turn hit max_tokens", True
+            started = time.monotonic()
+            response = await scheduler.create_message(client, model=tier.model, max_tokens=tier.max_tokens, **kwargs)
+        self._record(turn, tier, reason, started, response, retried)
+        self._last_tier = tier
+        self.observe_response(response)
+        return response
+
+    def _record(self, turn: int, tier: Tier, reason: str, started: float, response, retried: bool):
+        usage = getattr(response, "usage", None)
+        decision = Decision(
+            turn, tier.name, tier.model, tier.max_tokens, reason, round(time.monotonic() - started, 3),
+            getattr(usage, "input_tokens", None) or 0, getattr(usage, "output_tokens", None) or 0, retried,
+        )
+        self.decisions.append(decision)
+        log_event(
+            "route", turn=turn, tier=tier.name, model=tier.model, max_tokens=tier.max_tokens,
+            reason=reason, duration=decision.duration, retried=retried or None,
+        )
+
+    def summary(self) -> dict:
+        """Turns per tier and the estimated cost/latency saved versus strong-only"""
+        def cost(model, input_tokens, output_tokens):
+            price_in, price_out = PRICES.get(model, PRICES["claude-3-5-sonnet-20241022"])
+            return (input_tokens * price_in + output_tokens * price_out) / 1e6
+
+        fast = [d for d in self.decisions if d.tier == "fast"]
+        strong = [d for d in self.decisions if d.tier == "strong"]
+        # A fast call that had to be re-asked was pure overhead
+        wasted = [d for d in fast if d.reason.endswith("hit max_tokens")]
+        kept = [d for d in fast if d not in wasted]
+        saved_cost = sum(cost(self.strong.model, d.input_tokens, d.output_tokens) - cost(d.model, d.input_tokens, d.output_tokens) for d in kept)
+        saved_cost -= sum(cost(d.model, d.input_tokens, d.output_tokens) for d in wasted)
+        saved_latency = None
+        if kept and strong:
+            # Per output token, so long strong turns don't inflate the estimate
+            strong_rate = sum(d.duration for d in strong) / max(1, sum(d.output_tokens for d in strong))
+            saved_latency = sum(strong_rate * d.output_tokens - d.duration for d in kept) - sum(d.duration for d in wasted)
+        return {
+            "turns": len({d.turn for d in self.decisions}),
+            "fast_turns": len(kept),
+            "strong_turns": len(strong),
+            "escalated_retries": len(wasted),
+            "cost_usd": round(sum(cost(d.model, d.input_tokens, d.output_tokens) for d in self.decisions), 4),
+            "saved_cost_usd": round(saved_cost, 4),
+            "saved_latency_s": round(saved_latency, 2) if saved_latency is not None else None,
+        }
+
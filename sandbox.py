@@ -0,0 +1,450 @@
+"""Local sandboxed Python execution for code-only sessions.
+
+`coding_session` used to boot a medium VM even when the task only needs a
+Python interpreter. `LocalSandbox` runs `code_execution` cells in a small pool
+of local worker processes instead. Workers are started ahead of time with
+numpy, pandas and matplotlib (Agg backend) already imported and are reused
+across cells and sessions.
+
+Workers start with a minimal environment (no API keys or other variables
+from the parent) and confine themselves before running any cell: they enter
+new user, mount and network namespaces and pivot into a root that only holds
+the Python install and system libraries (read-only), the sessions directory
+and a private /tmp. The old root is detached, so the repo, .env files and the
+parent's /proc are out of reach, and the network namespace has no interfaces.
+If the kernel doesn't allow that, the sandbox refuses to run cells and
+`coding_session` uses a VM instead.
+
+Each worker also runs with resource limits: CPU seconds per cell
+(RLIMIT_CPU), address space (RLIMIT_AS), largest file written (RLIMIT_FSIZE)
+and a wall clock timeout enforced by the parent. A worker that times out,
+crashes or hits a limit is killed and replaced. Every cell runs in a fresh
+namespace with the session's own directory as working directory, so files
+written under Documents/ stay with the session.
+
+    python sandbox.py bench   # cold process per cell vs warm pool
+"""
+import asyncio
+import atexit
+import json
+import os
+import select
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional
+
+MAX_WORKERS = int(os.getenv("SCRAPYBARA_SANDBOX_WORKERS", 2))
+MEMORY_MB = int(os.getenv("SCRAPYBARA_SANDBOX_MEMORY_MB", 2048))
+MAX_FILE_MB = int(os.getenv("SCRAPYBARA_SANDBOX_MAX_FILE_MB", 100))
+ROOT = os.getenv("SCRAPYBARA_SANDBOX_DIR", "code_sessions")
+PREIMPORT = ("numpy", "pandas", "matplotlib", "matplotlib.pyplot")
+MAX_OUTPUT_CHARS = 20000
+# Recycle workers now and then so leaked state and memory don't pile up
+MAX_CELLS_PER_WORKER = 50
+# Only these parent variables reach workers, on top of the fixed ones in Worker
+PASSTHROUGH_ENV = ("LANG", "LC_ALL", "TZ", "LD_LIBRARY_PATH")
+# Visible read-only inside the sandbox, along with the Python install
+SYSTEM_PATHS = (
+    "/usr", "/bin", "/sbin", "/lib", "/lib32", "/lib64", "/etc/ld.so.cache", "/etc/ld.so.conf",
+    "/etc/ld.so.conf.d", "/etc/localtime", "/etc/passwd", "/etc/group", "/etc/fonts",
+)
+DEVICES = ("/dev/null", "/dev/zero", "/dev/full", "/dev/random", "/dev/urandom")
+
+CLONE_NEWNS, CLONE_NEWUSER, CLONE_NEWNET = 0x00020000, 0x10000000, 0x40000000
+MS_RDONLY, MS_NOSUID, MS_NODEV, MS_NOEXEC, MS_REMOUNT = 1, 2, 4, 8, 32
+MS_BIND, MS_REC, MS_PRIVATE, MS_RELATIME = 4096, 16384, 1 << 18, 1 << 21
+MNT_DETACH = 2
+SYS_PIVOT_ROOT = {"x86_64": 155, "aarch64": 41}
+
+
+class SandboxUnavailable(RuntimeError):
+    """The sandbox can't run cells safely here (no isolation, or workers don't start)"""
+
+
+def _sandbox_root() -> str:
+    return os.path.realpath(ROOT)
+
+
+def _confine(libc):
+    """Move this process into its own user, mount and network namespaces and pivot into a
+    root holding only the Python install, system libraries, the sessions directory and /tmp"""
+    import ctypes
+
+    def check(result, what):
+        if result != 0:
+            err = ctypes.get_errno()
+            raise OSError(err, f"{what}: {os.strerror(err)}")
+
+    def mount(source, target, fstype, flags, data=None):
+        check(libc.mount(source and source.encode(), target.encode(), fstype and fstype.encode(), flags,
+                         data and data.encode()), f"mount {target}")
+
+    def bind(source, new_root, writable=False, recursive=True):
+        target = new_root + source
+        if os.path.isdir(source):
+            os.makedirs(target, exist_ok=True)
+        else:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            open(target, "a").close()
+        mount(source, target, None, MS_BIND | (MS_REC if recursive else 0))
+        # Flags the source mount already has must be kept when remounting inside a user namespace
+        flag = os.statvfs(source).f_flag
+        kept = flag & (MS_NOSUID | MS_NODEV | MS_NOEXEC | 1024 | 2048) | (MS_RELATIME if flag & 4096 else 0)
+        mount(None, target, None, MS_REMOUNT | MS_BIND | MS_NOSUID | kept | (0 if writable else MS_RDONLY))
+
+    uid, gid = os.getuid(), os.getgid()
+    check(libc.unshare(CLONE_NEWUSER | CLONE_NEWNS | CLONE_NEWNET), "unshare")
+    for name, value in (("setgroups", "deny"), ("uid_map", f"0 {uid} 1"), ("gid_map", f"0 {gid} 1")):
+        with open(f"/proc/self/{name}", "w") as f:
+            f.write(value)
+    if os.uname().machine not in SYS_PIVOT_ROOT:
+        raise OSError(f"pivot_root not supported on {os.uname().machine}")
+
+    # Nothing mounted from here on propagates back to the host
+    mount(None, "/", None, MS_REC | MS_PRIVATE)
+    sessions = _sandbox_root()
+    here = os.path.dirname(os.path.realpath(__file__))
+    readonly = list(SYSTEM_PATHS) + [sys.base_prefix, sys.prefix, sys.exec_prefix]
+    # The Python install and site-packages, but never the repo this file lives in
+    readonly += [p for p in sys.path if p and os.path.isabs(p) and os.path.realpath(p) != here]
+
+    # Built on a tmpfs over an empty directory the workers share; each sees only its own mount
+    new_root = os.path.join(sessions, ".root")
+    os.makedirs(new_root, exist_ok=True)
+    mount("none", new_root, "tmpfs", MS_NOSUID | MS_NODEV, "mode=0755")
+    done = []
+    for path in sorted({os.path.normpath(p) for p in readonly if os.path.lexists(p)}, key=len):
+        if any(path == d or path.startswith(d + "/") for d in done):
+            continue
+        if os.path.islink(path) and os.path.dirname(path) == "/":
+            # /bin -> usr/bin on merged-usr systems
+            os.symlink(os.readlink(path), new_root + path)
+            continue
+        bind(path, new_root)
+        done.append(path)
+    for device in DEVICES:
+        if os.path.exists(device):
+            bind(device, new_root, writable=True)
+    os.makedirs(new_root + "/tmp")
+    mount("none", new_root + "/tmp", "tmpfs", MS_NOSUID | MS_NODEV, f"mode=1777,size={MAX_FILE_MB * 4}m")
+    # Not recursive, so the new root doesn't show up inside itself
+    bind(sessions, new_root, writable=True, recursive=False)
+
+    os.makedirs(new_root + "/.old")
+    check(libc.syscall(SYS_PIVOT_ROOT[os.uname().machine], new_root.encode(), (new_root + "/.old").encode()),
+          "pivot_root")
+    os.chdir("/")
+    check(libc.umount2(b"/.old", MNT_DETACH), "umount old root")
+    os.rmdir("/.old")
+    mount(None, "/", None, MS_REMOUNT | MS_BIND | MS_RDONLY | MS_NOSUID | MS_NODEV)
+
+
+def _worker_main():
+    """Worker process: read one JSON request per line, answer on the original stdout"""
+    import contextlib
+    import ctypes
+    import io
+    import resource
+    import socket
+    import traceback
+
+    replies = os.fdopen(os.dup(1), "w")
+    requests = sys.stdin
+
+    # Confined before anything from a cell runs; subprocesses of cells inherit it
+    reason = None
+    try:
+        _confine(ctypes.CDLL(None, use_errno=True))
+    except (OSError, AttributeError) as e:
+        reason = str(e)
+
+    for module in PREIMPORT:
+        try:
+            __import__(module)
+        except ImportError:
+            pass
+
+    def no_network(*args, **kwargs):
+        raise PermissionError("network access is disabled in the sandbox")
+
+    class NoSocket(socket.socket):
+        def __init__(self, family=-1, type=-1, proto=-1, fileno=None):
+            if fileno is None and family in (-1, socket.AF_INET, socket.AF_INET6):
+                no_network()
+            super().__init__(family, type, proto, fileno)
+
+    socket.socket = NoSocket
+    socket.create_connection = socket.getaddrinfo = no_network
+
+    memory = MEMORY_MB * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+    file_size = MAX_FILE_MB * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_FSIZE, (file_size, file_size))
+
+    replies.write(json.dumps({"ready": True, "isolated": reason is None, "reason": reason}) + "\n")
+    replies.flush()
+
+    for line in requests:
+        request = json.loads(line)
+        if reason is not None:
+            # The parent never sends cells to an unconfined worker; refuse anyway
+            replies.write(json.dumps({"output": "", "error": f"sandbox is not isolated: {reason}"}) + "\n")
+            replies.flush()
+            continue
+        os.makedirs(request["cwd"], exist_ok=True)
+        os.chdir(request["cwd"])
+        # CPU budget for this cell on top of what the worker has used so far
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        used = int(usage.ru_utime + usage.ru_stime)
+        resource.setrlimit(resource.RLIMIT_CPU, (used + int(request["timeout"]) + 1, resource.RLIM_INFINITY))
+
+        buffer = io.StringIO()
+        error = None
+        # Subprocesses write to the fds directly; capture those in a file
+        with tempfile.TemporaryFile("w+") as fd_output:
+            saved = os.dup(1), os.dup(2)
+            os.dup2(fd_output.fileno(), 1)
+            os.dup2(fd_output.fileno(), 2)
+            try:
+                with contextlib.redirect_stdout(buffer), contextlib.redirect_stderr(buffer):
+                    exec(compile(request["code"], "<cell>", "exec"), {"__name__": "__main__"})
+            except MemoryError:
+                error = "MemoryError: the cell exceeded the sandbox memory limit"
+            except BaseException as e:
+                # Drop this function's frame so the traceback starts in the cell
+                error = "".join(traceback.format_exception(type(e), e, e.__traceback__.tb_next))
+            finally:
+                os.dup2(saved[0], 1)
+                os.dup2(saved[1], 2)
+                os.close(saved[0])
+                os.close(saved[1])
+            fd_output.seek(0)
+            output = buffer.getvalue() + fd_output.read()
+
+        if "matplotlib.pyplot" in sys.modules:
+            sys.modules["matplotlib.pyplot"].close("all")
+        replies.write(json.dumps({"output": output[-MAX_OUTPUT_CHARS:], "error": error}) + "\n")
+        replies.flush()
+
+
+class Worker:
+    def __init__(self):
+        # Built from scratch: API keys and anything else in the parent's environment stay out
+        env = {name: os.environ[name] for name in PASSTHROUGH_ENV if name in os.environ}
+        env.update(
+            PATH="/usr/local/bin:/usr/bin:/bin", HOME="/tmp", TMPDIR="/tmp", LANG=env.get("LANG", "C.UTF-8"),
+            MPLBACKEND="Agg", MPLCONFIGDIR=os.path.join(_sandbox_root(), ".matplotlib"),
+            OPENBLAS_NUM_THREADS="1", OMP_NUM_THREADS="1", MKL_NUM_THREADS="1",
+            SCRAPYBARA_SANDBOX_DIR=_sandbox_root(), SCRAPYBARA_SANDBOX_MEMORY_MB=str(MEMORY_MB),
+            SCRAPYBARA_SANDBOX_MAX_FILE_MB=str(MAX_FILE_MB),
+        )
+        os.makedirs(_sandbox_root(), exist_ok=True)
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "worker"],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            text=True, env=env, start_new_session=True,
+        )
+        self.cells = 0
+        self.ready = None
+
+    def _read(self, timeout: Optional[float]) -> Optional[dict]:
+        ready, _, _ = select.select([self.process.stdout], [], [], timeout)
+        line = self.process.stdout.readline() if ready else ""
+        return json.loads(line) if line else None
+
+    def wait_ready(self, timeout: float = 60) -> bool:
+        if self.ready is None:
+            self.ready = self._read(timeout) or False
+        return bool(self.ready)
+
+    def run(self, code: str, timeout: float, cwd: str) -> Optional[dict]:
+        """One cell; None if the worker died or ran past the timeout"""
+        self.cells += 1
+        try:
+            self.process.stdin.write(json.dumps({"code": code, "timeout": timeout, "cwd": cwd}) + "\n")
+            self.process.stdin.flush()
+        except (BrokenPipeError, OSError):
+            return None
+        return self._read(timeout + 5)
+
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    def kill(self):
+        if self.alive():
+            self.process.kill()
+        self.process.wait()
+
+
+class LocalSandbox:
+    """Pool of warm, resource-limited Python workers"""
+
+    def __init__(self, max_workers: int = MAX_WORKERS):
+        self.max_workers = max_workers
+        self.idle: List[Worker] = []
+        self.lock = threading.Lock()
+        self.slots = threading.Semaphore(max_workers)
+        self.stats = {"cells": 0, "errors": 0, "killed": 0, "started": 0}
+        self.refusal: Optional[str] = None
+
+    def _spawn(self) -> Worker:
+        self.stats["started"] += 1
+        return Worker()
+
+    def warm(self):
+        """Start idle workers up to the pool size (they import numpy/pandas in the background)"""
+        with self.lock:
+            while len(self.idle) < self.max_workers:
+                self.idle.append(self._spawn())
+
+    def _acquire(self) -> Worker:
+        self.slots.acquire()
+        with self.lock:
+            worker = self.idle.pop(0) if self.idle else None
+        if worker is None or not worker.alive():
+            worker = self._spawn()
+        if not worker.wait_ready():
+            worker.kill()
+            self.slots.release()
+            raise SandboxUnavailable("sandbox worker failed to start")
+        if not worker.ready.get("isolated"):
+            self.refusal = f"sandbox is not isolated: {worker.ready.get('reason')}"
+            worker.kill()
+            self.slots.release()
+            raise SandboxUnavailable(self.refusal)
+        return worker
+
+    def unavailable(self) -> Optional[str]:
+        """Why cells can't run here (e.g. the kernel doesn't allow the namespaces), or None"""
+        if self.refusal is None:
+            try:
+                self._release(self._acquire(), healthy=True)
+            except SandboxUnavailable as e:
+                return str(e)
+        return self.refusal
+
+    def _release(self, worker: Worker, healthy: bool):
+        if healthy and worker.alive() and worker.cells < MAX_CELLS_PER_WORKER:
+            with self.lock:
+                self.idle.append(worker)
+        else:
+            worker.kill()
+            # Replace it now so the next cell finds a warm worker
+            with self.lock:
+                self.idle.append(self._spawn())
+        self.slots.release()
+
+    def run(self, code: str, timeout: float = 30, cwd: str = ".") -> dict:
+        """Run a cell; returns the same shape as `instance.code.execute`"""
+        cwd = os.path.realpath(cwd)
+        if not cwd.startswith(_sandbox_root() + os.sep):
+            # Nothing outside the sessions directory is visible to the workers
+            raise ValueError(f"{cwd} is outside the sandbox directory {_sandbox_root()}")
+        worker = self._acquire()
+        result = worker.run(code, timeout, cwd)
+        healthy = result is not None
+        self.stats["cells"] += 1
+        if result is None:
+            reason = f"timed out after {timeout}s" if worker.alive() else "was killed (CPU, memory or file size limit)"
+            self.stats["killed"] += 1
+            result = {"output": "", "error": f"Execution {reason}"}
+        if result["error"]:
+            self.stats["errors"] += 1
+        self._release(worker, healthy)
+        return {
+            "outputs": [{"type": "stream", "name": "stdout", "text": result["output"]}] if result["output"] else [],
+            "error": result["error"],
+        }
+
+    def close(self):
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for worker in idle:
+            worker.kill()
+
+
+class LocalSession:
+    """Code execution backend for one session: the shared pool plus the session's own directory"""
+
+    kernel = "local"
+    # Every cell runs in a fresh namespace, so no cell depends on an earlier one
+    stateful = False
+
+    def __init__(self, sandbox: LocalSandbox, workdir: str):
+        self.sandbox = sandbox
+        self.workdir = workdir
+        os.makedirs(workdir, exist_ok=True)
+
+    async def execute(self, code: str, timeout: int = 30) -> dict:
+        return await asyncio.to_thread(self.sandbox.run, code, timeout, self.workdir)
+
+    def file_digests(self, paths: List[str]) -> Dict[str, str]:
+        # Imported here so worker processes, which run this file, don't load it
+        from cell_cache import local_digests
+
+        return local_digests(paths, self.workdir)
+
+
+def session_dir(name: str) -> str:
+    """A fresh directory for a session's files under SCRAPYBARA_SANDBOX_DIR"""
+    slug = "".join(c if c.isalnum() else "-" for c in name.lower()).strip("-")[:40] or "session"
+    os.makedirs(ROOT, exist_ok=True)
+    return tempfile.mkdtemp(prefix=f"{slug}-", dir=ROOT)
+
+
+_sandbox: Optional[LocalSandbox] = None
+
+
+def get_sandbox() -> LocalSandbox:
+    global _sandbox
+    if _sandbox is None:
+        _sandbox = LocalSandbox()
+        _sandbox.warm()
+        atexit.register(_sandbox.close)
+    return _sandbox
+
+
+def _bench(cells: int = 20):
+    code = "import numpy as np, pandas as pd\nprint(pd.DataFrame(np.arange(6).reshape(3, 2)).sum().tolist())"
+    workdir = session_dir("bench")
+
+    started = time.perf_counter()
+    for _ in range(cells):
+        subprocess.run([sys.executable, "-c", code], cwd=workdir, capture_output=True, check=False)
+    cold = time.perf_counter() - started
+    print(f"cold process per cell: {cells} cells in {cold:.2f}s ({cold / cells * 1000:.0f} ms/cell)")
+
+    sandbox = LocalSandbox()
+    sandbox.warm()
+    for worker in sandbox.idle:
+        worker.wait_ready()
+    started = time.perf_counter()
+    for _ in range(cells):
+        result = sandbox.run(code, cwd=workdir)
+    warm = time.perf_counter() - started
+    print(f"warm sandbox pool   : {cells} cells in {warm:.2f}s ({warm / cells * 1000:.0f} ms/cell)")
+    print(f"last output: {result['outputs'][0]['text'].strip() if result['outputs'] else result['error']}")
+    print(f"isolated: {sandbox.unavailable() or 'yes'}")
+    for label, cell in (
+        ("network", "import urllib.request; urllib.request.urlopen('http://example.com', timeout=3)"),
+        ("env", "import os; print(sorted(k for k in os.environ if 'KEY' in k or 'TOKEN' in k) or 'no keys')"),
+        ("files", f"print(open({os.path.abspath(__file__)!r}).read())"),
+        ("memory", "x = bytearray(8 * 1024 ** 3)"),
+        ("timeout", "while True: pass"),
+    ):
+        result = sandbox.run(cell, timeout=2, cwd=workdir)
+        print(f"{label:8}: {(result['error'] or 'no error').strip().splitlines()[-1]}")
+    print(f"stats: {sandbox.stats}")
+    sandbox.close()
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["worker"]:
+        _worker_main()
+    elif sys.argv[1:] == ["bench"]:
+        _bench()
+    else:
+        print(__doc__)
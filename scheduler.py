@@ -0,0 +1,370 @@
+import asyncio
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Optional
+
+from profiler import phase
+from progress_log import log_event
+
+# Priorities for model calls: sessions that are already mid-run go first so a
+# burst of new sessions can't starve the ones holding a VM.
+MID_RUN = 0
+NEW_SESSION = 1
+
+# Status codes that mean "slow down" rather than "this request is wrong"
+RETRYABLE_STATUS_CODES = {429, 503, 529}
+RETRYABLE_ERROR_NAMES = {"RateLimitError", "OverloadedError"}
+
+# Rough token cost of one screenshot in a request
+IMAGE_TOKENS = 1600
+
+
+class TokenBucket:
+    """Continuously refilling token bucket measured in units per minute.
+
+    Thread-safe: sessions on different threads' event loops share one bucket.
+    """
+
+    def __init__(self, per_minute: float, capacity: Optional[float] = None, clock: Callable[[], float] = time.monotonic):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity if capacity is not None else per_minute
+        self.tokens = self.capacity
+        self.clock = clock
+        self.updated = clock()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` tokens are available (0 if they are now)."""
+        with self.lock:
+            self._refill()
+            # Requests larger than the bucket wait for a full bucket instead of forever
+            amount = min(amount, self.capacity)
+            if self.tokens >= amount:
+                return 0.0
+            return (amount - self.tokens) / self.rate
+
+    def take(self, amount: float):
+        with self.lock:
+            self._refill()
+            self.tokens -= min(amount, self.capacity)
+
+    def adjust(self, delta: float):
+        """Charge (positive) or refund (negative) tokens after the fact."""
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens - delta)
+
+
+def estimate_input_tokens(*payloads: Any) -> int:
+    """Cheap upper-ish estimate of the input tokens in a request payload."""
+    chars = 0
+    images = 0
+    stack = list(payloads)
+    while stack:
+        item = stack.pop()
+        if isinstance(item, str):
+            chars += len(item)
+        elif isinstance(item, dict):
+            if item.get("type") == "image":
+                images += 1
+                continue
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple)):
+            stack.extend(item)
+    return chars // 4 + images * IMAGE_TOKENS
+
+
+def is_retryable(error: Exception) -> bool:
+    """True for rate-limit and overload errors from either SDK."""
+    if type(error).__name__ in RETRYABLE_ERROR_NAMES:
+        return True
+    if getattr(error, "status_code", None) in RETRYABLE_STATUS_CODES:
+        return True
+    body = getattr(error, "body", None)
+    if isinstance(body, dict):
+        details = body.get("error", body)
+        if isinstance(details, dict) and details.get("type") in ("rate_limit_error", "overloaded_error"):
+            return True
+    return False
+
+
+def _wake(loop: asyncio.AbstractEventLoop, future: asyncio.Future, value: Any = True) -> bool:
+    """Resolve `future` from any thread; False if its loop is already closed"""
+
+    def resolve():
+        if not future.done():
+            future.set_result(value)
+
+    try:
+        loop.call_soon_threadsafe(resolve)
+        return True
+    except RuntimeError:
+        return False
+
+
+def _retry_after(error: Exception) -> float:
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after", 0))
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class RateLimitScheduler:
+    """Central admission control for model calls and VM instances.
+
+    Model calls are admitted through token buckets for requests/min and input
+    tokens/min, in priority order. Instance starts are capped by a concurrency
+    limit. Rate-limit and overload errors are retried with jittered exponential
+    backoff. The clock, sleep and random sources are injectable so the whole
+    thing can be driven by a fake clock and fake clients.
+
+    One scheduler is shared by every event loop in the process (the daemon
+    runs each command on its own thread and loop), so the admission queue and
+    the instance slot count are plain data under one lock, and waiters are
+    woken through their own loop with `call_soon_threadsafe`.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float = 50,
+        input_tokens_per_minute: float = 40000,
+        max_instances: int = 5,
+        max_retries: int = 6,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], Any] = asyncio.sleep,
+        rng: Callable[[], float] = random.random,
+    ):
+        self.requests = TokenBucket(requests_per_minute, clock=clock)
+        self.input_tokens = TokenBucket(input_tokens_per_minute, clock=clock)
+        self.max_instances = max_instances
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.clock = clock
+        self.sleep = sleep
+        self.rng = rng
+        self.cooldown_until = 0.0
+        self.retries = 0
+        # Pre-started instances by instance_type, handed out before starting new ones
+        self.warm_instances = {}
+        self._lock = threading.Lock()
+        self._tickets = itertools.count()
+        # Model calls waiting for admission, across all loops, and the waiters to wake by ticket
+        self._queue = []
+        self._turns: Dict[tuple, tuple] = {}
+        # Instance slots: how many are taken, who is waiting, and which instances hold one
+        self._slots_used = 0
+        self._slot_waiters = deque()
+        self._slot_holders = set()
+
+    @classmethod
+    def from_env(cls, share: float = 1.0, **kwargs) -> "RateLimitScheduler":
+        """Build a scheduler from environment limits, scaled by `share` (e.g. 1/workers)."""
+        return cls(
+            requests_per_minute=float(os.getenv("ANTHROPIC_REQUESTS_PER_MINUTE", 50)) * share,
+            input_tokens_per_minute=float(os.getenv("ANTHROPIC_INPUT_TOKENS_PER_MINUTE", 40000)) * share,
+            max_instances=max(1, int(int(os.getenv("SCRAPYBARA_MAX_INSTANCES", 5)) * share)),
+            **kwargs,
+        )
+
+    def _wake_head(self):
+        """Wake the waiter at the front of the admission queue (call with the lock held)"""
+        while self._queue:
+            waiter = self._turns.pop(self._queue[0], None)
+            if waiter is None or _wake(*waiter):
+                return
+            # Its loop is gone; the ticket can never be admitted
+            heapq.heappop(self._queue)
+
+    async def _wait_turn(self, ticket: tuple):
+        while True:
+            with self._lock:
+                if self._queue[0] == ticket:
+                    return
+                future = asyncio.get_running_loop().create_future()
+                self._turns[ticket] = (asyncio.get_running_loop(), future)
+            try:
+                await future
+            finally:
+                with self._lock:
+                    self._turns.pop(ticket, None)
+
+    async def _acquire_slot(self):
+        """Take an instance slot, waiting in FIFO order with every other loop"""
+        with self._lock:
+            if self._slots_used < self.max_instances and not self._slot_waiters:
+                self._slots_used += 1
+                return
+            future = asyncio.get_running_loop().create_future()
+            self._slot_waiters.append((asyncio.get_running_loop(), future))
+        try:
+            await future
+        except BaseException:
+            # Waiters only leave the queue when a slot is handed to them, so one that is
+            # no longer queued owns a slot it must pass on
+            with self._lock:
+                waiter = (asyncio.get_running_loop(), future)
+                handed_over = waiter not in self._slot_waiters
+                if not handed_over:
+                    self._slot_waiters.remove(waiter)
+            if handed_over:
+                self._release_slot()
+            raise
+
+    def _release_slot(self):
+        """Hand the slot to the next live waiter, or give it back"""
+        with self._lock:
+            while self._slot_waiters:
+                # A waiter cancelled meanwhile passes the slot on itself
+                if _wake(*self._slot_waiters.popleft()):
+                    return
+            self._slots_used -= 1
+
+    def backoff(self, attempt: int, error: Optional[Exception] = None) -> float:
+        delay = min(self.max_delay, self.base_delay * 2 ** attempt)
+        delay = delay / 2 + self.rng() * delay / 2
+        if error is not None:
+            delay = max(delay, _retry_after(error))
+        return delay
+
+    async def _admit(self, priority: int, tokens: int):
+        ticket = (priority, next(self._tickets))
+        with self._lock:
+            heapq.heappush(self._queue, ticket)
+        try:
+            while True:
+                await self._wait_turn(ticket)
+                with self._lock:
+                    wait = max(
+                        self.cooldown_until - self.clock(),
+                        self.requests.wait_time(1),
+                        self.input_tokens.wait_time(tokens),
+                    )
+                    if wait <= 0:
+                        self.requests.take(1)
+                        self.input_tokens.take(tokens)
+                        break
+                await self.sleep(wait)
+        finally:
+            with self._lock:
+                if ticket in self._queue:
+                    self._queue.remove(ticket)
+                    heapq.heapify(self._queue)
+                self._wake_head()
+
+    async def _retrying(self, label: str, call: Callable[[], Any], before: Callable[[], Any] = None):
+        attempt = 0
+        while True:
+            if before is not None:
+                await before()
+            try:
+                return await asyncio.to_thread(call)
+            except Exception as e:
+                if not is_retryable(e) or attempt >= self.max_retries:
+                    raise
+                delay = self.backoff(attempt, e)
+                attempt += 1
+                self.retries += 1
+                retry_after = _retry_after(e)
+                if retry_after:
+                    with self._lock:
+                        self.cooldown_until = max(self.cooldown_until, self.clock() + retry_after)
+                print(f"{label} throttled ({type(e).__name__}), retrying in {delay:.1f}s (attempt {attempt}/{self.max_retries})")
+                log_event("throttled", call=label, error=type(e).__name__, delay=round(delay, 3), attempt=attempt)
+                await self.sleep(delay)
+
+    async def create_message(self, client, *, mid_run: bool = False, **kwargs):
+        """Call `client.beta.messages.create(**kwargs)` under the rate limits."""
+        estimate = estimate_input_tokens(kwargs.get("messages"), kwargs.get("system"), kwargs.get("tools"))
+        priority = MID_RUN if mid_run else NEW_SESSION
+
+        async def admit():
+            with phase("admission"):
+                await self._admit(priority, estimate)
+
+        response = await self._retrying(
+            "Model call",
+            lambda: client.beta.messages.create(**kwargs),
+            before=admit,
+        )
+        usage = getattr(response, "usage", None)
+        if usage is not None and getattr(usage, "input_tokens", None) is not None:
+            self.input_tokens.adjust(usage.input_tokens - estimate)
+        return response
+
+    async def start_instance(self, client, **kwargs):
+        """Start a Scrapybara instance once a concurrency slot is free."""
+        await self._acquire_slot()
+        with self._lock:
+            warm = self.warm_instances.get(kwargs.get("instance_type"))
+            instance = warm.pop() if warm else None
+        if instance is not None:
+            self._hold_slot(instance)
+            log_event("instance_start", instance=instance.id, warm=True, duration=0.0)
+            return instance
+        started = self.clock()
+        try:
+            instance = await self._retrying("Instance start", lambda: client.start(**kwargs))
+        except BaseException:
+            self._release_slot()
+            raise
+        self._hold_slot(instance)
+        log_event("instance_start", instance=instance.id, duration=round(self.clock() - started, 3))
+        return instance
+
+    def _hold_slot(self, instance):
+        with self._lock:
+            self._slot_holders.add(id(instance))
+
+    def at_capacity(self) -> bool:
+        """Whether `start_instance` would have to wait for a slot"""
+        with self._lock:
+            return self._slots_used >= self.max_instances or bool(self._slot_waiters)
+
+    def add_warm_instance(self, instance_type: str, instance):
+        """Offer an already running instance to the next `start_instance` call"""
+        with self._lock:
+            self.warm_instances.setdefault(instance_type, []).append(instance)
+
+    async def stop_instance(self, instance):
+        """Stop an instance started by `start_instance` and free the slot it holds."""
+        started = self.clock()
+        try:
+            await asyncio.to_thread(instance.stop)
+            log_event("instance_stop", instance=instance.id, duration=round(self.clock() - started, 3))
+        finally:
+            with self._lock:
+                held = id(instance) in self._slot_holders
+                self._slot_holders.discard(id(instance))
+            # Only instances that took a slot give one back, and only once
+            if held:
+                self._release_slot()
+
+
+_scheduler: Optional[RateLimitScheduler] = None
+
+
+def get_scheduler() -> RateLimitScheduler:
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = RateLimitScheduler.from_env()
+    return _scheduler
+
+
+def set_scheduler(scheduler: Optional[RateLimitScheduler]):
+    global _scheduler
+    _scheduler = scheduler
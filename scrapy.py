@@ -1,45 +1,162 @@
-from scrapybara import Scrapybara
+import asyncio
+import json
 import os
+from typing import Optional
 from dotenv import load_dotenv
 
-load_dotenv(dotenv_path="C:\\Users\\Ivenaccip\\Documents\\scrapybara\\.env", override=True)
-
-client = Scrapybara(api_key="scrapy-a2e81cdd-8749-455d-88c7-1d2840e8098d")
+from clients import get_scrapybara
+from entities import fan_out, resolve
+from paginated_scrape import read_records, scrape_chunks
+from scheduler import get_scheduler
+from sizing import UsageSampler, choose_instance_type
 
-# Start instance
-instance = client.start(instance_type="medium")
+load_dotenv(dotenv_path="C:\\Users\\Ivenaccip\\Documents\\scrapybara\\.env", override=True)
 
-# Scrape W25
-response = instance.agent.scrape(
-    cmd="Open https://ycombinator.com/companies, filter companies by 'W25', and extract company name, description, and tags.",
-    schema={
-        "companies": [
-            {
-                "name": "str",
-                "description": "str",
-                "tags": ["str"]
-            }
-        ]
-    },
-)
+SCRAPYBARA_API_KEY = os.getenv("SCRAPYBARA_API_KEY", "scrapy-a2e81cdd-8749-455d-88c7-1d2840e8098d")
 
-print(response)
+COMPANY_SCHEMA = {
+    "name": "str",
+    "description": "str",
+    "tags": ["str"]
+}
 
-print(response.data)
+# Industry filters on ycombinator.com/companies, used to split a batch into chunks
+YC_INDUSTRIES = [
+    "B2B",
+    "Consumer",
+    "Education",
+    "Fintech",
+    "Healthcare",
+    "Industrials",
+    "Real Estate and Construction",
+    "Government",
+    "Unspecified",
+]
+# Pages within an industry: one scrape response only holds so many records (a few dozen companies
+# with descriptions), and a big industry like B2B overflows it, so each page asks for a name range
+NAME_RANGES = ["A-E", "F-J", "K-O", "P-T", "U-Z or a digit"]
 
-print(f"Scraped W25 companies: {response.data['companies']}")
 
-# Find best way to conect each company 
-for company in response.data['companies'][0:3]:
-    print(f"\Contact info for {company['name']}...")
-    contact_info = instance.agent.scrape(
-        cmd=f"Open https://ycombinator.com/companies and find the best way to contact YC W25 company {company['name']}",
+def scrape_companies(instance, batch: str = "W25") -> list:
+    """Scrape every YC company in `batch` with name, description and tags"""
+    response = instance.agent.scrape(
+        cmd=f"Open https://ycombinator.com/companies, filter companies by '{batch}', and extract company name, description, and tags.",
         schema={
-            "contact_method": "str",
-            "contact_details": "str"
+            "companies": [COMPANY_SCHEMA]
         },
     )
-    print(f"\n Found contact info for {company['name']}: {contact_info.data}")
 
-# Stop
-instance.stop()
\ No newline at end of file
+    print(response)
+
+    print(response.data)
+
+    print(f"Scraped {batch} companies: {response.data['companies']}")
+    return response.data['companies']
+
+
+def scrape_companies_paginated(instance, batch: str = "W25", output: Optional[str] = None) -> list:
+    """Scrape `batch` one industry filter and name range at a time, validating and streaming each chunk.
+
+    That is one `agent.scrape` call per industry and name range: 9 x 5 = 45
+    calls per batch, plus retries. Each call also reports how many companies
+    the page lists in that range. A page holding more than one response fits
+    comes back short of that count and is retried as incomplete; add finer
+    NAME_RANGES if that keeps happening. With `output`, an interrupted run
+    resumes and the companies it had already written are returned along with
+    the new ones.
+    """
+    chunks = {
+        f"{batch}/{industry}/{letters}": (
+            f"Open https://www.ycombinator.com/companies?batch={batch}&industry={industry.replace(' ', '%20')}, "
+            f"scroll to the end of the list, and extract the name, description, and tags of every company "
+            f"whose name starts with {letters}, and as total, how many such companies the list shows."
+        )
+        for industry in YC_INDUSTRIES
+        for letters in NAME_RANGES
+    }
+    companies = []
+    for company in scrape_chunks(instance, chunks, COMPANY_SCHEMA, output=output, count_key="total"):
+        print(f"Scraped {company['name']}")
+        companies.append(company)
+    print(f"Scraped {len(companies)} new {batch} companies")
+    if output:
+        # Everything written so far, including earlier runs; new records were appended to it
+        companies = read_records(output)
+        print(f"{len(companies)} {batch} companies in {output}")
+    return companies
+
+
+def find_contacts(instance, companies: list, batch: str = "W25", limit: int = 3) -> dict:
+    """Find the best way to contact each of the first `limit` companies.
+
+    Paginated chunks can list a company twice under slightly different names;
+    each company is looked up once and its contact copied to the other names.
+    """
+    contacts = {}
+    entities = resolve(companies)[0:limit]
+    for entity in entities:
+        company = entity.target
+        print(f"\nContact info for {company['name']}...")
+        contact_info = instance.agent.scrape(
+            cmd=f"Open https://ycombinator.com/companies and find the best way to contact YC {batch} company {company['name']}",
+            schema={
+                "contact_method": "str",
+                "contact_details": "str"
+            },
+        )
+        print(f"\n Found contact info for {company['name']}: {contact_info.data}")
+        contacts[entity.key] = contact_info.data
+    return fan_out(entities, contacts, key=lambda c: c['name'])
+
+
+def save_contacts(companies: list, contacts: dict, path: str):
+    """One JSONL record per company with a contact, for ranking with `postprocess.py rank`"""
+    with open(path, "w", encoding="utf-8") as f:
+        for company in companies:
+            if company['name'] in contacts:
+                f.write(json.dumps({**company, "contact": contacts[company['name']]}) + "\n")
+
+
+def scrape_and_find_contacts(instance, batch: str, limit: int, paginate: bool, output: Optional[str],
+                             contacts_output: Optional[str]) -> dict:
+    # Scrape the batch
+    if paginate:
+        companies = scrape_companies_paginated(instance, batch, output)
+    else:
+        companies = scrape_companies(instance, batch)
+
+    # Find best way to conect each company
+    contacts = find_contacts(instance, companies, batch, limit)
+    if contacts_output:
+        save_contacts(companies, contacts, contacts_output)
+    return contacts
+
+
+async def run(batch: str = "W25", limit: int = 3, paginate: bool = False, output: Optional[str] = None,
+              contacts_output: Optional[str] = None) -> dict:
+    if output and not paginate:
+        raise ValueError("output is only written by the paginated scrape; pass paginate=True")
+    scheduler = get_scheduler()
+    client = get_scrapybara(SCRAPYBARA_API_KEY)
+
+    # Start an instance of the size measured to fit scraping, within the instance limit
+    instance_type = choose_instance_type("scrape")
+    instance = await scheduler.start_instance(client, instance_type=instance_type)
+
+    try:
+        # agent.scrape drives the browser, not the shell the sampler uses, so samples can run alongside it
+        async with UsageSampler(instance, "scrape", instance_type):
+            return await asyncio.to_thread(scrape_and_find_contacts, instance, batch, limit, paginate, output,
+                                           contacts_output)
+    finally:
+        # Stop
+        await scheduler.stop_instance(instance)
+
+
+def main(batch: str = "W25", limit: int = 3, paginate: bool = False, output: Optional[str] = None,
+         contacts_output: Optional[str] = None) -> dict:
+    return asyncio.run(run(batch, limit, paginate, output, contacts_output))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""Screenshot payloads that are decoded at most once and never re-encoded.
+
+Tool results arrive with the screenshot as a base64 string, which is already
+the exact API payload, so `ScreenshotBuffer` keeps that string as is. The raw
+PNG bytes are decoded only when something needs them (archiving to disk) and
+are written out through memoryview slices, not copies. A buffer built from
+raw bytes encodes base64 once, on first send.
+
+    python screenshots.py bench   # allocations per screenshot, old path vs this one
+"""
+import base64
+import binascii
+import hashlib
+import os
+import sys
+from typing import Optional
+
+SCREENSHOT_DIR = os.getenv("SCRAPYBARA_SCREENSHOT_DIR")
+CHUNK_SIZE = 1 << 20
+
+
+class ScreenshotBuffer:
+    __slots__ = ("_b64", "_raw", "media_type", "__weakref__")
+
+    def __init__(self, b64: Optional[str] = None, raw: Optional[bytes] = None, media_type: str = "image/png"):
+        if b64 is None and raw is None:
+            raise ValueError("ScreenshotBuffer needs base64 or raw data")
+        self._b64 = b64
+        self._raw = raw
+        self.media_type = sys.intern(media_type)
+
+    @classmethod
+    def from_base64(cls, data: str, media_type: str = "image/png") -> "ScreenshotBuffer":
+        return cls(b64=data, media_type=media_type)
+
+    @classmethod
+    def from_bytes(cls, data: bytes, media_type: str = "image/png") -> "ScreenshotBuffer":
+        return cls(raw=data, media_type=media_type)
+
+    def base64(self) -> str:
+        """The API payload, encoded at most once"""
+        if self._b64 is None:
+            self._b64 = binascii.b2a_base64(self._raw, newline=False).decode("ascii")
+        return self._b64
+
+    @property
+    def raw(self) -> memoryview:
+        """Decoded image bytes, decoded at most once"""
+        if self._raw is None:
+            # a2b_base64 reads an ASCII str in place; b64decode would copy it to bytes first
+            self._raw = binascii.a2b_base64(self._b64)
+        return memoryview(self._raw)
+
+    def drop_raw(self):
+        """Free the decoded bytes when the base64 payload can stand in for them"""
+        if self._b64 is not None:
+            self._raw = None
+
+    @property
+    def key(self) -> str:
+        """Cheap in-process identity for dedup (no copy of the payload)"""
+        data = self._b64 if self._b64 is not None else self._raw
+        return f"{hash(data) & 0xFFFFFFFFFFFFFFFF:016x}-{len(data)}"
+
+    def same_as(self, other: "ScreenshotBuffer") -> bool:
+        if self._b64 is not None and other._b64 is not None:
+            return self._b64 == other._b64
+        return self.raw == other.raw
+
+    @property
+    def nbytes(self) -> int:
+        return (len(self._b64) if self._b64 is not None else 0) + (len(self._raw) if self._raw is not None else 0)
+
+
+class ScreenshotArchive:
+    """Content-addressed screenshot files under `root` (identical shots are stored once)"""
+
+    def __init__(self, root: str = SCREENSHOT_DIR):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def save(self, buffer: ScreenshotBuffer, keep_raw: bool = False) -> str:
+        raw = buffer.raw
+        digest = hashlib.sha1(raw).hexdigest()
+        extension = buffer.media_type.split("/")[-1]
+        path = os.path.join(self.root, f"{digest}.{extension}")
+        if not os.path.exists(path):
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "wb", buffering=0) as f:
+                for start in range(0, len(raw), CHUNK_SIZE):
+                    f.write(raw[start:start + CHUNK_SIZE])
+            os.replace(tmp, path)
+        raw.release()
+        if not keep_raw:
+            buffer.drop_raw()
+        return path
+
+
+_archive: Optional[ScreenshotArchive] = None
+
+
+def get_archive() -> Optional[ScreenshotArchive]:
+    """The archive configured by SCRAPYBARA_SCREENSHOT_DIR, or None if archiving is off"""
+    global _archive
+    if _archive is None and SCREENSHOT_DIR:
+        _archive = ScreenshotArchive(SCREENSHOT_DIR)
+    return _archive
+
+
+def _bench(count: int = 20, size: int = 1_500_000):
+    import tempfile
+    import tracemalloc
+
+    payloads = [base64.b64encode(os.urandom(size)).decode("ascii") for _ in range(count)]
+
+    def before(data: str, root: str):
+        # Old path: payload copied into the result dict, decoded to save,
+        # then re-encoded when the message was built
+        block = {"type": "image", "source": {"type": "base64", "media_type": "image/png", "data": data}}
+        raw = base64.b64decode(block["source"]["data"])
+        with open(os.path.join(root, "shot.png"), "wb") as f:
+            f.write(raw)
+        return {"type": "image", "source": {"type": "base64", "media_type": "image/png", "data": base64.b64encode(raw).decode()}}
+
+    def after(data: str, archive: ScreenshotArchive):
+        buffer = ScreenshotBuffer.from_base64(data)
+        archive.save(buffer)
+        return {"type": "image", "source": {"type": "base64", "media_type": buffer.media_type, "data": buffer.base64()}}
+
+    with tempfile.TemporaryDirectory() as root:
+        archive = ScreenshotArchive(os.path.join(root, "archive"))
+        for label, run, arg in (("before", before, root), ("after", after, archive)):
+            tracemalloc.start()
+            extra = []
+            for data in payloads:
+                tracemalloc.reset_peak()
+                baseline, _ = tracemalloc.get_traced_memory()
+                message = run(data, arg)
+                _, peak = tracemalloc.get_traced_memory()
+                extra.append(peak - baseline)
+                del message
+            tracemalloc.stop()
+            average = sum(extra) / count
+            print(f"{label:6}: {average / 1e6:6.2f} MB allocated per {len(payloads[0]) / 1e6:.1f} MB screenshot payload")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["bench"]:
+        _bench()
+    else:
+        print(__doc__)
@@ -0,0 +1,328 @@
+"""Instance size chosen from measured resource usage.
+
+Every session used to start a "medium" instance, whether it only browses
+GitHub or crunches pandas. While a session runs, `UsageSampler` samples CPU,
+memory and how long a full-screen capture takes inside the VM every
+`SAMPLE_INTERVAL` seconds. When the session ends, one profile line per
+session (job, instance type, duration, outcome, p95 CPU/memory, capture
+latency) is appended to instance_profiles.jsonl. Samples go through the VM's
+shell, so they are only taken between the agent's tool calls, never during one.
+
+`choose_instance_type(job)` reads those profiles:
+
+- sizes that completed reliably without saturating CPU or memory are
+  candidates, and the one with the lowest cost per session (duration x hourly
+  price) wins;
+- if the chosen size is mostly idle and the next smaller one has too few runs
+  to judge, that one is tried so it gets measured, and if every measured size
+  saturates, the next larger one is used.
+
+Every job starts on "medium", so the second rule is what moves a job that
+idles there (browsing) down to "small", and one that saturates it (heavy code
+execution) up to "large", once a few runs are in.
+SCRAPYBARA_SIZING=auto (default) applies both rules, `measured` only picks
+among sizes that already have enough runs, `recommend` only prints the choice
+and keeps "medium", `off` skips the lookup. SCRAPYBARA_INSTANCE_TYPE forces one
+size everywhere. Prices per instance-hour are estimates; set
+SCRAPYBARA_INSTANCE_PRICES="small=0.05,medium=0.1,large=0.2" to your rates.
+
+    python sizing.py report [--path instance_profiles.jsonl]   # per job and size: time, usage, cost, recommendation
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from typing import Dict, List, NamedTuple, Optional
+
+from progress_log import log_event
+
+SIZES = ("small", "medium", "large")
+DEFAULT = "medium"
+PROFILE_PATH = os.getenv("SCRAPYBARA_SIZING_PATH", "instance_profiles.jsonl")
+MODE = os.getenv("SCRAPYBARA_SIZING", "auto")
+# Modes in which the chosen size is used rather than only printed
+APPLIED = ("auto", "measured")
+FORCED = os.getenv("SCRAPYBARA_INSTANCE_TYPE")
+SAMPLE_INTERVAL = float(os.getenv("SCRAPYBARA_SIZING_INTERVAL", 20))
+# Fewer runs than this on a size are not enough to judge it
+MIN_SESSIONS = 3
+SATURATED = 0.85
+IDLE = 0.5
+MIN_SUCCESS = 0.8
+
+
+def _prices() -> Dict[str, float]:
+    prices = {"small": 0.05, "medium": 0.10, "large": 0.20}
+    for item in filter(None, os.getenv("SCRAPYBARA_INSTANCE_PRICES", "").split(",")):
+        size, _, price = item.partition("=")
+        prices[size.strip()] = float(price)
+    return prices
+
+
+PRICES = _prices()
+
+# Runs in the VM; cumulative CPU counters, memory, and a timed X screen capture
+SAMPLE_SCRIPT = r'''
+import json, os, subprocess, time
+cpu = [int(x) for x in open("/proc/stat").readline().split()[1:]]
+mem = {line.split(":")[0]: int(line.split()[1]) for line in open("/proc/meminfo")}
+started = time.monotonic()
+try:
+    captured = subprocess.run(["xwd", "-root", "-silent"], env=dict(os.environ, DISPLAY=":1"),
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=10).returncode == 0
+except (OSError, subprocess.TimeoutExpired):
+    captured = False
+print(json.dumps({"cpu_total": sum(cpu), "cpu_idle": cpu[3] + cpu[4], "cpus": os.cpu_count(),
+                  "mem_total_kb": mem["MemTotal"], "mem_available_kb": mem["MemAvailable"],
+                  "capture_ms": round((time.monotonic() - started) * 1000) if captured else None}))
+'''
+
+
+def _output(response) -> str:
+    if isinstance(response, dict):
+        return response.get("output") or ""
+    return getattr(response, "output", None) or str(response or "")
+
+
+def _p95(values: List[float]) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+
+
+class UsageSampler:
+    """Samples VM usage in the background for one session and stores its profile at the end"""
+
+    def __init__(self, instance, job: str, instance_type: str, interval: float = SAMPLE_INTERVAL,
+                 path: str = PROFILE_PATH, tools=None):
+        self.instance = instance
+        # The session's ToolCollection; sampling waits while one of its tools runs
+        self.tools = tools
+        self.job = job
+        self.instance_type = instance_type
+        self.interval = interval
+        self.path = path
+        self.cpu: List[float] = []
+        self.mem: List[float] = []
+        self.capture_ms: List[float] = []
+        self.cpus = None
+        self.mem_total_mb = None
+        self._last = None
+        self._task = None
+        self._started = 0.0
+
+    async def sample(self):
+        command = f"python3 - <<'SIZING_EOF'\n{SAMPLE_SCRIPT}\nSIZING_EOF"
+        try:
+            if self.tools is not None:
+                async with self.tools.lock:
+                    response = await asyncio.to_thread(self.instance.bash, command=command)
+            else:
+                response = await asyncio.to_thread(self.instance.bash, command=command)
+            sample = json.loads(_output(response).strip().splitlines()[-1])
+        except Exception:
+            # A missed sample isn't worth disturbing the session for
+            return
+        if self._last is not None:
+            total = sample["cpu_total"] - self._last["cpu_total"]
+            idle = sample["cpu_idle"] - self._last["cpu_idle"]
+            if total > 0:
+                self.cpu.append(1 - idle / total)
+        self._last = sample
+        self.cpus = sample["cpus"]
+        self.mem_total_mb = round(sample["mem_total_kb"] / 1024)
+        self.mem.append(1 - sample["mem_available_kb"] / sample["mem_total_kb"])
+        if sample["capture_ms"] is not None:
+            self.capture_ms.append(sample["capture_ms"])
+
+    async def _run(self):
+        while True:
+            await self.sample()
+            await asyncio.sleep(self.interval)
+
+    async def __aenter__(self):
+        self._started = time.monotonic()
+        self._task = asyncio.create_task(self._run())
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        profile = self.profile(ok=exc_type is None)
+        log_event("instance_profile", **{k: v for k, v in profile.items() if k != "job"})
+        try:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(profile) + "\n")
+        except OSError as e:
+            print(f"Could not store the instance profile: {e}")
+
+    def profile(self, ok: bool) -> dict:
+        return {
+            "job": self.job,
+            "instance_type": self.instance_type,
+            "ok": ok,
+            "duration": round(time.monotonic() - self._started, 1),
+            "samples": len(self.mem),
+            "cpus": self.cpus,
+            "mem_total_mb": self.mem_total_mb,
+            "cpu_p95": _p95(self.cpu) if self.cpu else None,
+            "mem_p95": _p95(self.mem) if self.mem else None,
+            "capture_ms_p50": statistics.median(self.capture_ms) if self.capture_ms else None,
+            "at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+
+
+class SizeStats(NamedTuple):
+    sessions: int
+    success: float
+    duration_p50: float
+    cpu_p95: Optional[float]
+    mem_p95: Optional[float]
+    capture_ms_p50: Optional[float]
+    cost: float
+
+    @property
+    def saturated(self) -> bool:
+        return (self.cpu_p95 or 0) >= SATURATED or (self.mem_p95 or 0) >= SATURATED
+
+    @property
+    def idle(self) -> bool:
+        return self.cpu_p95 is not None and self.mem_p95 is not None and max(self.cpu_p95, self.mem_p95) < IDLE
+
+
+class Decision(NamedTuple):
+    instance_type: str
+    reason: str
+
+
+def load_profiles(path: str = PROFILE_PATH) -> List[dict]:
+    profiles = []
+    try:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    profiles.append(json.loads(line))
+                except ValueError:
+                    continue
+    except OSError:
+        pass
+    return profiles
+
+
+def summarize(profiles: List[dict]) -> Dict[str, Dict[str, SizeStats]]:
+    """job -> instance type -> stats"""
+    groups: Dict[tuple, List[dict]] = {}
+    for profile in profiles:
+        groups.setdefault((profile["job"], profile["instance_type"]), []).append(profile)
+    summary: Dict[str, Dict[str, SizeStats]] = {}
+    for (job, size), runs in groups.items():
+        durations = [run["duration"] for run in runs if run["ok"]] or [run["duration"] for run in runs]
+
+        def p95_of(key):
+            values = [run[key] for run in runs if run.get(key) is not None]
+            return round(_p95(values), 3) if values else None
+
+        captures = [run["capture_ms_p50"] for run in runs if run.get("capture_ms_p50") is not None]
+        duration = statistics.median(durations)
+        summary.setdefault(job, {})[size] = SizeStats(
+            sessions=len(runs),
+            success=sum(run["ok"] for run in runs) / len(runs),
+            duration_p50=round(duration, 1),
+            cpu_p95=p95_of("cpu_p95"),
+            mem_p95=p95_of("mem_p95"),
+            capture_ms_p50=statistics.median(captures) if captures else None,
+            cost=round(duration / 3600 * PRICES.get(size, PRICES[DEFAULT]), 4),
+        )
+    return summary
+
+
+def recommend(stats: Dict[str, SizeStats], default: str = DEFAULT, explore: bool = False) -> Decision:
+    """Pick a size for one job from its per-size stats; `explore` may pick a size not measured yet"""
+    judged = {size: s for size, s in stats.items() if s.sessions >= MIN_SESSIONS}
+    fits = [size for size, s in judged.items() if s.success >= MIN_SUCCESS and not s.saturated]
+    if fits:
+        best = min(fits, key=lambda size: judged[size].cost)
+        smaller = SIZES[SIZES.index(best) - 1] if best in SIZES and SIZES.index(best) > 0 else None
+        if explore and judged[best].idle and smaller and smaller not in judged:
+            return Decision(smaller, f"{best} is mostly idle (p95 CPU {judged[best].cpu_p95:.0%}, "
+                                     f"memory {judged[best].mem_p95:.0%}); measuring {smaller}")
+        s = judged[best]
+        return Decision(best, f"cheapest size that fits: ${s.cost:.3f}/session, {s.duration_p50:.0f}s p50, "
+                              f"{s.success:.0%} ok over {s.sessions} runs")
+    saturated = [size for size, s in judged.items() if s.saturated and size in SIZES]
+    if saturated:
+        largest = max(saturated, key=SIZES.index)
+        if SIZES.index(largest) + 1 < len(SIZES):
+            bigger = SIZES[SIZES.index(largest) + 1]
+            if explore:
+                return Decision(bigger, f"{largest} saturates CPU or memory; trying {bigger}")
+            return Decision(default, f"{largest} saturates CPU or memory; SCRAPYBARA_SIZING=auto would try {bigger}")
+    return Decision(default, "not enough measured runs yet")
+
+
+_cache: Dict[str, object] = {"mtime": None, "summary": {}}
+
+
+def choose_instance_type(job: str, default: str = DEFAULT) -> str:
+    """The instance type a new `job` session should start with"""
+    if FORCED:
+        return FORCED
+    if MODE == "off":
+        return default
+    try:
+        mtime = os.path.getmtime(PROFILE_PATH)
+    except OSError:
+        return default
+    if _cache["mtime"] != mtime:
+        _cache.update(mtime=mtime, summary=summarize(load_profiles(PROFILE_PATH)))
+    stats = _cache["summary"].get(job)
+    if not stats:
+        return default
+    decision = recommend(stats, default, explore=MODE != "measured")
+    if decision.instance_type != default:
+        print(f"Instance size for {job}: {decision.instance_type} ({decision.reason})"
+              + ("" if MODE in APPLIED else f"; keeping {default} (SCRAPYBARA_SIZING={MODE})"))
+    log_event("instance_size", size=decision.instance_type, reason=decision.reason, applied=MODE in APPLIED)
+    return decision.instance_type if MODE in APPLIED else default
+
+
+def render(summary: Dict[str, Dict[str, SizeStats]]) -> str:
+    def pct(value):
+        return "-" if value is None else f"{value:.0%}"
+
+    lines = [f"{'JOB':10} {'SIZE':7} {'RUNS':>5} {'OK':>5} {'P50 TIME':>9} {'CPU P95':>8} {'MEM P95':>8} "
+             f"{'CAPTURE':>8} {'$/SESSION':>10}"]
+    for job in sorted(summary):
+        for size in sorted(summary[job], key=lambda s: SIZES.index(s) if s in SIZES else len(SIZES)):
+            s = summary[job][size]
+            capture = "-" if s.capture_ms_p50 is None else f"{s.capture_ms_p50:.0f}ms"
+            lines.append(f"{job:10} {size:7} {s.sessions:>5} {s.success:>5.0%} {s.duration_p50:>8.0f}s "
+                         f"{pct(s.cpu_p95):>8} {pct(s.mem_p95):>8} {capture:>8} {s.cost:>10.4f}")
+        decision = recommend(summary[job], explore=MODE != "measured")
+        lines.append(f"{'':10} -> {decision.instance_type}: {decision.reason}")
+    return "\n".join(lines)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Measured instance usage per job and size, and the size to use")
+    parser.add_argument("command", choices=["report"])
+    parser.add_argument("--path", default=PROFILE_PATH)
+    args = parser.parse_args(argv)
+
+    profiles = load_profiles(args.path)
+    if not profiles:
+        print(f"No instance profiles in {args.path} yet")
+        return 0
+    print(render(summarize(profiles)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,9 @@
+import os
+import sys
+import tempfile
+
+# The modules live at the repo root, not in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Read at import time by progress_log.py; keep test events out of the repo's log
+os.environ.setdefault("SCRAPYBARA_PROGRESS_LOG", os.path.join(tempfile.mkdtemp(prefix="scrapybara-tests-"), "progress.log"))
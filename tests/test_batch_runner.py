@@ -0,0 +1,58 @@
+"""batch_runner: worker caps against the instance limit, and retries with backoff."""
+import asyncio
+import queue
+import sys
+from types import SimpleNamespace
+
+import batch_runner
+import scheduler
+from batch_runner import Job, worker_count
+from scheduler import RateLimitScheduler
+
+
+def test_workers_capped_at_instance_limit(monkeypatch):
+    monkeypatch.setenv("SCRAPYBARA_MAX_INSTANCES", "5")
+    assert worker_count(16) == 5
+    assert worker_count(3) == 3
+    assert worker_count(0) == 1
+    # Each worker's share still gets at least one slot, and together they stay within the limit
+    shares = [RateLimitScheduler.from_env(share=1 / worker_count(16)).max_instances for _ in range(worker_count(16))]
+    assert shares == [1] * 5
+
+
+def run_shard(monkeypatch, session, retries):
+    sleeps = []
+
+    async def sleep(seconds):
+        sleeps.append(seconds)
+
+    monkeypatch.setitem(sys.modules, "flaky_job", SimpleNamespace(run=session))
+    monkeypatch.setitem(batch_runner.JOBS, "flaky", Job("flaky_job", "run", "name", ("name",), lambda t: {"name": t["name"]}))
+    monkeypatch.setattr(scheduler, "_scheduler", RateLimitScheduler(sleep=sleep, rng=lambda: 0.0, base_delay=1.0))
+    results = queue.Queue()
+    asyncio.run(batch_runner._run_shard("flaky", 0, [{"name": "Acme"}], 1, retries, results))
+    return results.get_nowait()[2], sleeps
+
+
+def test_retries_back_off_before_resubmitting(monkeypatch):
+    calls = []
+
+    async def session(name):
+        calls.append(name)
+        if len(calls) < 3:
+            raise RuntimeError("VM failed to start")
+        return {"name": name}
+
+    record, sleeps = run_shard(monkeypatch, session, retries=2)
+    assert record["status"] == "ok" and record["attempts"] == 3 and "error" not in record
+    # Exponential: base_delay * 2**attempt, halved by the zero jitter
+    assert sleeps == [0.5, 1.0]
+
+
+def test_no_sleep_after_the_last_attempt(monkeypatch):
+    async def session(name):
+        raise RuntimeError("boom")
+
+    record, sleeps = run_shard(monkeypatch, session, retries=1)
+    assert record["status"] == "error" and record["error"] == "RuntimeError: boom"
+    assert sleeps == [0.5]
@@ -0,0 +1,84 @@
+"""MemoizedCells: hits, misses and what invalidates a cached cell."""
+import asyncio
+
+from cell_cache import CellCache, MemoizedCells, local_digests
+
+
+class Kernel:
+    """Records real executions; each returns a numbered output"""
+
+    def __init__(self):
+        self.ran = []
+
+    async def __call__(self, code, timeout):
+        self.ran.append(code)
+        return f"out:{len(self.ran)}", None
+
+
+def memo(tmp_path, stateful=True):
+    cache = CellCache(str(tmp_path / "cache"))
+    return MemoizedCells(cache, "kernel", stateful, lambda paths: local_digests(paths, str(tmp_path))), cache
+
+
+def run(memo, code, kernel, **kwargs):
+    return asyncio.run(memo.run(code, 30, kernel, **kwargs))
+
+
+def test_pure_cell_hits_after_first_run(tmp_path):
+    cells, cache = memo(tmp_path)
+    kernel = Kernel()
+    assert run(cells, "# pure\nprint(1)", kernel) == ("out:1", None)
+    output, error = run(cells, "# pure\nprint(1)", kernel)
+    assert error is None and output.endswith("out:1")
+    assert len(kernel.ran) == 1
+    assert cache.stats["hits"] == 1 and cache.stats["misses"] == 1
+
+
+def test_unmarked_cells_always_run(tmp_path):
+    cells, cache = memo(tmp_path)
+    kernel = Kernel()
+    run(cells, "print(1)", kernel)
+    run(cells, "print(1)", kernel)
+    assert len(kernel.ran) == 2
+    assert cache.stats["stores"] == 0
+
+
+def test_input_file_change_invalidates(tmp_path):
+    cells, _ = memo(tmp_path)
+    kernel = Kernel()
+    data = tmp_path / "data.csv"
+    data.write_text("a,b\n1,2\n")
+    code = "# pure\nprint(open('data.csv').read())"
+    run(cells, code, kernel)
+    run(cells, code, kernel)
+    assert len(kernel.ran) == 1
+    data.write_text("a,b\n3,4\n")
+    run(cells, code, kernel)
+    assert len(kernel.ran) == 2
+
+
+def test_state_change_and_restart_invalidate(tmp_path):
+    cells, _ = memo(tmp_path)
+    kernel = Kernel()
+    code = "# pure\nprint(x)"
+    run(cells, code, kernel)
+    # An unmarked cell may change x, so the pure cell runs again
+    run(cells, "x = 2", kernel)
+    run(cells, code, kernel)
+    assert kernel.ran == [code, "x = 2", code]
+    # After a restart the lineage is back at the start, where the first result was stored
+    cells.restart()
+    run(cells, code, kernel)
+    assert len(kernel.ran) == 3
+
+
+def test_deterministic_hit_is_replayed_before_the_next_real_cell(tmp_path):
+    cells, _ = memo(tmp_path)
+    kernel = Kernel()
+    setup = "# deterministic\nimport json"
+    run(cells, setup, kernel)
+    cells.restart()
+    run(cells, setup, kernel)
+    assert kernel.ran == [setup]
+    run(cells, "print(json)", kernel)
+    assert kernel.ran == [setup, setup, "print(json)"]
@@ -0,0 +1,109 @@
+"""The shared client registry and its HTTP pool, against a local HTTP stub."""
+import http.server
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import clients
+
+
+class Stub:
+    """Keep-alive HTTP/1.1 server answering every POST with a small JSON body; counts connections"""
+
+    def __init__(self):
+        self.connections = 0
+        stub = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                stub.connections += 1
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                body = b'{"id": "msg_1", "type": "message", "role": "assistant", "model": "stub", "content": [], ' \
+                       b'"stop_reason": "end_turn", "usage": {"input_tokens": 1, "output_tokens": 1}}'
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stub():
+    clients.reset()
+    server = Stub()
+    yield server
+    clients.reset()
+    server.close()
+
+
+def test_sessions_reuse_pooled_connections(stub):
+    sessions, requests_per_session, threads = 20, 10, 4
+
+    def session(_):
+        client = clients.get_http_client()
+        for _ in range(requests_per_session):
+            assert client.post(f"{stub.url}/v1/messages", json={"turn": 1}).status_code == 200
+
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(session, range(sessions)))
+
+    stats = clients.pool_stats()
+    total = sessions * requests_per_session
+    assert stats["requests"] == total
+    # At most one connection per concurrent thread, kept alive across sessions
+    assert stub.connections <= threads
+    assert stats["new_connections"] == stub.connections
+    assert stats["reuse_ratio"] >= 1 - threads / total
+    assert stats["active_connections"] == 0
+    assert stats["open_connections"] == stats["idle_connections"] <= threads
+    assert stats["peak_in_flight"] <= threads
+
+
+def test_one_http_client_until_reset(stub):
+    first = clients.get_http_client()
+    assert clients.get_http_client() is first
+    clients.reset()
+    assert clients.pool_stats() == {}
+    assert first.is_closed
+    assert clients.get_http_client() is not first
+
+
+def test_sdk_clients_are_shared_per_api_key(monkeypatch):
+    monkeypatch.setattr(clients, "FAKE", "scale=0.001")
+    clients.reset()
+    try:
+        assert clients.get_scrapybara("key-a") is clients.get_scrapybara("key-a")
+        assert clients.get_scrapybara("key-a") is not clients.get_scrapybara("key-b")
+        assert clients.get_anthropic("key-a") is clients.get_anthropic("key-a")
+    finally:
+        clients.reset()
+
+
+def test_anthropic_sends_through_the_shared_pool(stub, monkeypatch):
+    pytest.importorskip("anthropic")
+    monkeypatch.setattr(clients, "FAKE", None)
+    monkeypatch.setenv("ANTHROPIC_BASE_URL", stub.url)
+    client = clients.get_anthropic("test-key")
+    for _ in range(5):
+        client.messages.create(model="stub", max_tokens=1, messages=[{"role": "user", "content": "hi"}])
+    assert clients.pool_stats()["requests"] == 5
+    assert stub.connections == 1
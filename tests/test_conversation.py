@@ -0,0 +1,98 @@
+"""Conversation's blob table: screenshot dedup, reference counts and trimming to max_images."""
+import base64
+from types import SimpleNamespace
+
+from conversation import OMITTED_IMAGE, BlobStore, Conversation
+from screenshots import ScreenshotBuffer
+
+
+def shot(n):
+    return base64.b64encode(bytes([n]) * 64).decode("ascii")
+
+
+def result(image=None, output=None, error=None):
+    return SimpleNamespace(output=output, error=error, base64_image=image)
+
+
+def images(api):
+    return [block for message in api for result in message["content"] if result["type"] == "tool_result"
+            for block in result["content"] if isinstance(block, dict)]
+
+
+def add_turn(conversation, n, image):
+    conversation.add_assistant([{"type": "tool_use", "id": f"t{n}", "name": "computer", "input": {"action": "screenshot"}}])
+    conversation.add_tool_results([conversation.tool_result(result(image), f"t{n}")])
+
+
+def test_identical_screenshots_are_stored_once():
+    conversation = Conversation(max_images=None)
+    for n in range(3):
+        add_turn(conversation, n, shot(1))
+    assert len(conversation.blobs.blobs) == 1
+    assert list(conversation.blobs.refs.values()) == [3]
+    sent = images(conversation.to_api())
+    assert [block["source"]["data"] for block in sent] == [shot(1)] * 3
+
+
+def test_old_screenshots_are_replaced_and_their_blobs_freed():
+    conversation = Conversation(max_images=2)
+    for n in range(4):
+        add_turn(conversation, n, shot(n))
+    sent = images(conversation.to_api())
+    assert sent[:2] == [{"type": "text", "text": OMITTED_IMAGE}] * 2
+    assert [block["source"]["data"] for block in sent[2:]] == [shot(2), shot(3)]
+    assert len(conversation.blobs.blobs) == 2
+    assert conversation.blobs.nbytes() == 2 * len(shot(0))
+
+
+def test_a_shared_blob_outlives_its_oldest_reference():
+    conversation = Conversation(max_images=2)
+    add_turn(conversation, 0, shot(7))
+    add_turn(conversation, 1, shot(7))
+    add_turn(conversation, 2, shot(8))
+    # The first reference was dropped, the second still sends the same blob
+    sent = images(conversation.to_api())
+    assert sent[0] == {"type": "text", "text": OMITTED_IMAGE}
+    assert sent[1]["source"]["data"] == shot(7)
+    assert sorted(conversation.blobs.refs.values()) == [1, 1]
+
+
+def test_hash_collisions_get_their_own_blob():
+    class Colliding(ScreenshotBuffer):
+        __slots__ = ()
+        key = "same"
+
+    store = BlobStore()
+    first = store.put(Colliding.from_base64(shot(1)))
+    second = store.put(Colliding.from_base64(shot(2)))
+    assert first != second
+    assert store.get(second).base64() == shot(2)
+    store.release(first)
+    assert store.get(first) is None and store.get(second) is not None
+
+
+def test_round_trip_through_api_format():
+    messages = [
+        {"role": "user", "content": "Research Acme"},
+        {"role": "assistant", "content": [{"type": "tool_use", "id": "a", "name": "bash", "input": {"command": "ls"}}]},
+        {"role": "user", "content": [{"type": "tool_result", "tool_use_id": "a", "is_error": True, "content": [
+            {"type": "text", "text": "boom"},
+            {"type": "image", "source": {"type": "base64", "media_type": "image/png", "data": shot(3)}},
+        ]}]},
+    ]
+    conversation = Conversation.from_messages(messages)
+    api = conversation.to_api()
+    assert api[0]["content"] == [{"type": "text", "text": "Research Acme"}]
+    assert api[1] == messages[1]
+    assert api[2]["content"][0]["is_error"] is True
+    assert api[2]["content"][0]["content"] == messages[2]["content"][0]["content"]
+    assert Conversation.from_messages(api).to_api() == api
+
+
+def test_error_result_keeps_its_screenshot():
+    conversation = Conversation()
+    block = conversation.tool_result(result(shot(4), error="click failed"), "x")
+    api = block.to_api(conversation.blobs)
+    assert api["is_error"] is True
+    assert api["content"][0] == {"type": "text", "text": "click failed"}
+    assert api["content"][1]["source"]["data"] == shot(4)
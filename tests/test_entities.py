@@ -0,0 +1,57 @@
+"""resolve: which near-duplicate targets merge into one entity, and which stay apart."""
+import pytest
+
+from entities import canonical_domain, fan_out, normalize_name, resolve
+
+
+def groups(*targets, **kwargs):
+    targets = [{"name": t} if isinstance(t, str) else t for t in targets]
+    return [[m["name"] for m in entity.members] for entity in resolve(targets, **kwargs)]
+
+
+def test_normalization():
+    assert canonical_domain("https://www.Acme.com:443/pricing") == "acme.com"
+    assert canonical_domain("Acme Inc") is None
+    assert normalize_name("The TechCorp Solutions, Inc.") == "techcorpsolutions"
+    assert normalize_name("Global Inc") == "globalinc"
+
+
+@pytest.mark.parametrize("targets", [
+    ["Acme", "Acme, Inc.", "ACME LLC"],
+    ["Acme Inc", "acme.com"],
+    ["TechCorp", "TechCorp Solutions"],
+    ["TechCorp Solutions, Inc.", "https://techcorp.com"],
+    [{"name": "Anthropic", "github": "anthropics"}, {"name": "anthropics"}],
+    ["Northwind Traders", "Northwind Tradrs"],
+])
+def test_merged(targets):
+    assert len(groups(*targets)) == 1
+
+
+@pytest.mark.parametrize("targets", [
+    # Which TechCorp the bare name means is unclear
+    ["TechCorp", "TechCorp Solutions", "TechCorp Labs"],
+    ["Delta Labs", "Delta Systems"],
+    ["Global", "Global Inc"],
+    ["Global", "Global Solutions"],
+    ["Company 12", "Company 13"],
+    [{"name": "TechCorp", "website": "techcorp.com"}, {"name": "TechCorp Solutions", "website": "techcorp.io"}],
+])
+def test_not_merged(targets):
+    assert len(groups(*targets)) == len(targets)
+
+
+def test_handle_map_merges_and_reasons_are_kept():
+    [entity] = resolve([{"name": "Anthropic"}, {"name": "anthropics"}], handles={"Anthropic": "anthropics"})
+    assert entity.aliases == ["anthropics"]
+    assert entity.reasons == ["same name 'anthropics'"]
+
+
+def test_code_tasks_only_merge_identical_text():
+    assert groups("Sort a list", "sort a list ", "Sort lists", normalize=False) == [["Sort a list", "sort a list "], ["Sort lists"]]
+
+
+def test_fan_out_copies_results_to_aliases():
+    entities = resolve([{"name": "TechCorp"}, {"name": "TechCorp Solutions"}, {"name": "Other"}])
+    results = fan_out(entities, {"techcorp": "report"}, key=lambda t: t["name"])
+    assert results == {"TechCorp": "report", "TechCorp Solutions": "report"}
@@ -0,0 +1,91 @@
+"""FileOpsTool against a local shell standing in for the VM (the script runs for real, in a temp home)."""
+import asyncio
+import os
+import subprocess
+
+import pytest
+
+pytest.importorskip("scrapybara")  # file_ops returns the SDK's ToolResult
+
+from file_ops import FileOpsTool  # noqa: E402
+
+
+class LocalInstance:
+    """Runs bash commands locally with HOME at `home`, and records them"""
+
+    def __init__(self, home):
+        self.home = str(home)
+        self.commands = []
+
+    def bash(self, command):
+        self.commands.append(command)
+        done = subprocess.run(["bash", "-c", command], capture_output=True, text=True,
+                              env=dict(os.environ, HOME=self.home), check=False)
+        return {"output": done.stdout + done.stderr}
+
+
+@pytest.fixture
+def tool(tmp_path):
+    return FileOpsTool(LocalInstance(tmp_path))
+
+
+def run(tool, *operations):
+    return asyncio.run(tool(operations=list(operations)))
+
+
+def test_many_operations_in_one_round_trip(tool, tmp_path):
+    result = run(tool,
+                 {"op": "mkdir", "path": "notes"},
+                 {"op": "create", "path": "notes/a.md", "content": "one\ntwo\n"},
+                 {"op": "append", "path": "notes/a.md", "content": "three\n"},
+                 {"op": "read", "path": "notes/a.md"})
+    assert len(tool.instance.commands) == 1
+    assert result.error is None
+    assert result.output.splitlines()[:3] == ["mkdir notes: created", "create notes/a.md: created (8 bytes)",
+                                              "append notes/a.md: appended"]
+    assert result.output.endswith("read notes/a.md: read\none\ntwo\nthree\n")
+    assert (tmp_path / "notes" / "a.md").read_text() == "one\ntwo\nthree\n"
+
+
+def test_writes_are_diffed_and_create_does_not_overwrite(tool, tmp_path):
+    run(tool, {"op": "write", "path": "a.txt", "content": "x\ny\n"})
+    result = run(tool,
+                 {"op": "write", "path": "a.txt", "content": "x\nz\nw\n"},
+                 {"op": "create", "path": "a.txt", "content": "other"})
+    assert result.output.splitlines() == [
+        "write a.txt: written (+2 -1 lines)",
+        "create a.txt: error: file exists with different content (use write to overwrite)",
+    ]
+    assert (tmp_path / "a.txt").read_text() == "x\nz\nw\n"
+
+
+def test_known_content_is_sent_as_a_hash(tool):
+    content = "long file\n" * 1000
+    run(tool, {"op": "write", "path": "big.txt", "content": content})
+    result = run(tool, {"op": "write", "path": "big.txt", "content": content})
+    assert result.output == "write big.txt: unchanged"
+    first, second = tool.instance.commands
+    assert len(second) < len(first) - len(content)
+
+
+def test_stale_hash_is_resent_in_full(tool, tmp_path):
+    run(tool, {"op": "write", "path": "a.txt", "content": "mine"})
+    # Changed on the VM behind the tool's back
+    (tmp_path / "a.txt").write_text("someone else's")
+    result = run(tool, {"op": "write", "path": "a.txt", "content": "mine"})
+    assert len(tool.instance.commands) == 3
+    assert result.output.startswith("write a.txt: written")
+    assert (tmp_path / "a.txt").read_text() == "mine"
+
+
+def test_invalid_operations_are_rejected_before_the_vm(tool):
+    assert run(tool, {"op": "delete", "path": "a"}).error.startswith("operation 0: needs op")
+    assert run(tool, {"op": "write", "path": "a"}).error == "operation 0: write needs string content"
+    assert asyncio.run(tool(operations=[])).error == "no operations given"
+    assert tool.instance.commands == []
+
+
+def test_all_failed_is_an_error(tool):
+    result = run(tool, {"op": "read", "path": "missing.txt"})
+    assert result.error == "1 of 1 operations failed"
+    assert "FileNotFoundError" in result.output
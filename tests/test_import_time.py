@@ -0,0 +1,49 @@
+"""Import-time budget for the CLI's cheap paths (see cli.py).
+
+Each check runs `python -X importtime` in a fresh interpreter, so modules
+already imported by pytest don't hide the cost. Budgets are in milliseconds
+and can be loosened on slow machines with SCRAPYBARA_IMPORT_BUDGET_MS.
+"""
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUDGET_MS = float(os.getenv("SCRAPYBARA_IMPORT_BUDGET_MS", 100))
+HEAVY = ("anthropic", "scrapybara", "httpx", "dotenv", "asyncio")
+
+
+def import_times(code: str) -> dict:
+    """{module: cumulative microseconds} for everything `code` imports, and "total" for all of it"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+        env=dict(os.environ, PYTHONDONTWRITEBYTECODE="1"),
+    )
+    times = {"total": 0}
+    started = False
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, module = line.split("|")
+        times[module.strip()] = int(cumulative)
+        # Top-level imports are indented by one space; interpreter startup comes before `cli`
+        started = started or module.strip() == "cli"
+        if started and not module.startswith("  "):
+            times["total"] += int(cumulative)
+    return times
+
+
+def test_cli_import_is_under_budget():
+    times = import_times("import cli")
+    assert times["cli"] / 1000 < BUDGET_MS
+
+
+@pytest.mark.parametrize("argv", [["jobs"], ["--help"]])
+def test_cheap_subcommands_skip_the_sdks(argv):
+    code = f"import cli\ntry:\n    cli.main({argv!r})\nexcept SystemExit:\n    pass"
+    times = import_times(code)
+    assert not [m for m in times if m.split(".")[0] in HEAVY]
+    assert times["total"] / 1000 < BUDGET_MS
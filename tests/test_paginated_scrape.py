@@ -0,0 +1,72 @@
+"""scrape_chunks: schema validation, short pages, and resuming from the output file."""
+from types import SimpleNamespace
+
+from paginated_scrape import read_records, scrape_chunks, validate
+
+SCHEMA = {"name": "str", "description": "str", "tags": ["str"]}
+
+
+def company(name, **extra):
+    return dict({"name": name, "description": f"{name} does things", "tags": ["B2B"]}, **extra)
+
+
+class Pages:
+    """Answers each chunk's cmd with queued responses (a dict of data, or an exception), then the last one again"""
+
+    def __init__(self, **responses):
+        self.responses = {cmd: list(queue) for cmd, queue in responses.items()}
+        self.calls = []
+
+    def __call__(self, cmd, schema):
+        self.calls.append(cmd)
+        queue = self.responses[cmd]
+        response = queue.pop(0) if len(queue) > 1 else queue[0]
+        if isinstance(response, Exception):
+            raise response
+        return SimpleNamespace(data=response)
+
+
+def test_validate():
+    assert validate(company("Acme"), SCHEMA) == []
+    assert validate({"name": " ", "tags": "B2B"}, SCHEMA) == [
+        "name: expected non-empty str, got ' '",
+        "description: missing",
+        "tags: expected list, got str",
+    ]
+    assert validate({"companies": [company("Acme"), {"name": 3}]}, {"companies": [{"name": "str"}]}) == [
+        "companies[1].name: expected non-empty str, got 3"]
+
+
+def test_invalid_and_failed_chunks_are_retried():
+    scrape = Pages(a=[RuntimeError("timeout"), {"companies": [company("Acme"), {"name": "Beta"}]},
+                      {"companies": [company("Acme"), company("Beta")]}])
+    records = list(scrape_chunks(None, {"a/1": "a"}, SCHEMA, scrape=scrape))
+    assert [r["name"] for r in records] == ["Acme", "Beta"]
+    assert len(scrape.calls) == 3
+
+
+def test_short_page_is_retried_then_reported_incomplete(tmp_path, capsys):
+    output = tmp_path / "companies.jsonl"
+    scrape = Pages(a=[{"companies": [company("Acme")], "total": 2}])
+    records = list(scrape_chunks(None, {"a/1": "a"}, SCHEMA, scrape=scrape, output=str(output),
+                                 count_key="total", max_attempts=2))
+    assert [r["name"] for r in records] == ["Acme"]
+    assert len(scrape.calls) == 2
+    assert "returned 1 of 2 records" in capsys.readouterr().out
+    # Incomplete chunks aren't marked done, so a rerun tries them again
+    assert not (tmp_path / "companies.jsonl.chunks").read_text()
+
+
+def test_resume_skips_finished_chunks_and_known_records(tmp_path):
+    output = str(tmp_path / "companies.jsonl")
+    first = Pages(a=[{"companies": [company("Acme"), company("Beta")]}], b=[RuntimeError("crashed")])
+    assert len(list(scrape_chunks(None, {"a/1": "a", "b/1": "b"}, SCHEMA, scrape=first, output=output,
+                                  max_attempts=1))) == 2
+
+    second = Pages(b=[{"companies": [company("  beta "), company("Gamma")]}])
+    records = list(scrape_chunks(None, {"a/1": "a", "b/1": "b"}, SCHEMA, scrape=second, output=output))
+    # Chunk a isn't scraped again, and Beta (normalized) isn't written twice
+    assert second.calls == ["b"]
+    assert [r["name"] for r in records] == ["Gamma"]
+    assert [r["name"] for r in read_records(output)] == ["Acme", "Beta", "Gamma"]
+    assert (tmp_path / "companies.jsonl.chunks").read_text().split() == ["a/1", "b/1"]
@@ -0,0 +1,24 @@
+"""BatchSubmitter against the fake client, laid out like the pinned anthropic SDK."""
+from fake_scrapybara import FakeAnthropic, Simulator
+from postprocess import BatchSubmitter
+
+
+def request(custom_id):
+    return {"custom_id": custom_id, "params": {"model": "m", "max_tokens": 10,
+                                               "messages": [{"role": "user", "content": "x"}]}}
+
+
+def test_batches_live_under_beta_like_the_sdk():
+    client = FakeAnthropic(Simulator.from_spec("scale=0.001"))
+    assert not hasattr(client, "messages")
+    assert hasattr(client.beta.messages, "batches")
+
+
+def test_submit_and_resume_from_state(tmp_path):
+    client = FakeAnthropic(Simulator.from_spec("scale=0.001"))
+    requests = [request("a"), request("b")]
+    texts = BatchSubmitter(client, str(tmp_path), poll_max=0.01).run(requests)
+    assert sorted(texts) == ["a", "b"]
+    # A rerun with the same requests reuses the saved replies without submitting
+    client.beta.messages.batches.create = None
+    assert BatchSubmitter(client, str(tmp_path), poll_max=0.01).run(requests) == texts
@@ -0,0 +1,73 @@
+"""Prefetcher predictions and hit/miss accounting, with a warmer that needs no VM."""
+import pytest
+
+pytest.importorskip("scrapybara")  # prefetch -> wait_for imports the SDK's tool types
+
+from prefetch import Prefetcher, canonical, predict  # noqa: E402
+
+
+class Warmer:
+    """Takes a hint for every URL except those listed in `refuse`"""
+
+    def __init__(self, refuse=()):
+        self.refuse = set(refuse)
+        self.batches = []
+
+    def warm(self, urls):
+        self.batches.append(list(urls))
+        return [url for url in urls if url not in self.refuse]
+
+
+def navigate(prefetcher, url, duration=1.0):
+    prefetcher.observe("computer", {"action": "type", "text": url}, 0.1)
+    prefetcher.observe("computer", {"action": "key", "text": "Return"}, duration)
+
+
+def test_canonical():
+    assert canonical("www.Acme.com/pricing/") == "https://acme.com/pricing"
+    assert canonical("http://acme.com/?q=1") == "https://acme.com?q=1"
+
+
+def test_predict_homepage_and_github():
+    pages = predict("https://acme.com", company="Acme Corp")
+    assert pages[:4] == [f"https://acme.com/{p}" for p in ("pricing", "about", "careers", "blog")]
+    assert pages[4].startswith("https://google.com/search?q=Acme+Corp+news")
+    assert "https://acme.com/pricing" not in predict("https://acme.com/pricing")
+    assert predict("https://github.com/octo") == [
+        "https://github.com/octo?tab=repositories", "https://github.com/orgs/octo/repositories"]
+    assert predict("https://github.com/octo/repo")[0] == "https://github.com/octo/repo/pulse"
+    assert predict("https://www.google.com/search?q=x") == []
+
+
+def test_warm_takes_at_most_max_per_turn():
+    warmer = Warmer()
+    prefetcher = Prefetcher(warmer, seeds=["acme.com"], max_per_turn=2)
+    prefetcher.warm()
+    prefetcher.warm()
+    assert warmer.batches == [["https://acme.com", "https://acme.com/pricing"],
+                              ["https://acme.com/about", "https://acme.com/careers"]]
+
+
+def test_observe_counts_hits_and_misses():
+    warmer = Warmer(refuse={"https://acme.com/about"})
+    prefetcher = Prefetcher(warmer, seeds=["acme.com"], max_per_turn=3)
+    prefetcher.warm()
+    navigate(prefetcher, "acme.com/pricing", duration=0.5)
+    # Refused by the warmer, so a miss
+    navigate(prefetcher, "acme.com/about", duration=2.0)
+    # Typed without pressing Enter: not a navigation
+    prefetcher.observe("computer", {"action": "type", "text": "acme.com/careers"}, 0.1)
+    summary = prefetcher.summary()
+    assert (summary["hits"], summary["misses"]) == (1, 1)
+    assert summary["avg_hit_latency"] == 0.5 and summary["avg_miss_latency"] == 2.0
+    assert summary["skipped"] == 1
+    # The homepage seed was warmed but never visited
+    assert summary["wasted"] == 1
+
+
+def test_navigation_puts_fresh_predictions_first():
+    prefetcher = Prefetcher(Warmer(), seeds=["acme.com"])
+    navigate(prefetcher, "github.com/octo")
+    assert prefetcher.queue[:2] == ["https://github.com/octo?tab=repositories",
+                                    "https://github.com/orgs/octo/repositories"]
+    assert "https://acme.com/pricing" in prefetcher.queue
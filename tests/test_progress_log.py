@@ -0,0 +1,48 @@
+"""ProgressWriter: size-based rotation and forwarding batches instead of writing."""
+import os
+import time
+
+from progress_log import ProgressWriter, read_events
+
+
+def write(writer, record):
+    """Put one record and wait until it's written, so each record is its own batch"""
+    before = writer.written
+    writer.put(record)
+    while writer.written == before:
+        time.sleep(0.001)
+
+
+def test_rotates_by_size_and_keeps_backup_count(tmp_path):
+    path = str(tmp_path / "progress.log")
+    writer = ProgressWriter(path, max_bytes=300, backup_count=2)
+    for i in range(40):
+        write(writer, {"event": "tool", "n": i, "pad": "x" * 20})
+    writer.close()
+    assert sorted(os.listdir(tmp_path)) == ["progress.log", "progress.log.1", "progress.log.2"]
+    for name in os.listdir(tmp_path):
+        assert os.path.getsize(tmp_path / name) <= 300
+    # Backups hold the records just before the live file's; older ones are gone
+    numbers = [e["n"] for suffix in (".2", ".1", "") for e in read_events(path + suffix)]
+    assert numbers == list(range(numbers[0], 40)) and numbers[0] > 0
+
+
+def test_no_backups_starts_over(tmp_path):
+    path = str(tmp_path / "progress.log")
+    writer = ProgressWriter(path, max_bytes=100, backup_count=0)
+    for i in range(10):
+        write(writer, {"event": "tool", "n": i})
+    writer.close()
+    assert os.listdir(tmp_path) == ["progress.log"]
+    assert os.path.getsize(path) <= 100
+    assert [e["n"] for e in read_events(path)][-1] == 9
+
+
+def test_send_forwards_batches_without_writing(tmp_path):
+    batches = []
+    writer = ProgressWriter(str(tmp_path / "progress.log"), send=batches.append)
+    writer.put({"event": "a"})
+    writer.put({"event": "b"})
+    writer.close()
+    assert [record["event"] for batch in batches for record in batch] == ["a", "b"]
+    assert not os.listdir(tmp_path)
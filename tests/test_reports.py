@@ -0,0 +1,60 @@
+"""Report output of reports.py: markdown, docx and spreadsheet tables."""
+import pytest
+
+from reports import _sheet_title, _write_tables, render_docx, render_markdown
+
+FINDINGS = {
+    "target": "Acme",
+    "title": "Acme pricing",
+    "tables": [{
+        "name": "Plans",
+        "columns": ["plan", "price", "notes"],
+        "rows": [["Pro", 49, "a | b"], ["Team", 12.5, None], ["=SUM(B2:B3)", -3, "-5%\nper seat"]],
+    }],
+}
+
+
+def test_sheet_titles_fit_31_chars_and_stay_unique():
+    used = set()
+    name = "Competitor pricing tiers by region and year"
+    titles = [_sheet_title(name, i, used) for i in range(12)]
+    assert all(len(title) <= 31 for title in titles)
+    assert len({title.lower() for title in titles}) == 12
+    assert titles[0] == name[:31]
+    assert titles[11].endswith(" 12")
+
+
+def test_sheet_titles_drop_invalid_characters():
+    used = set()
+    assert _sheet_title("Q1/Q2 [draft]: costs?", 0, used) == "Q1 Q2  draft   costs"
+    assert _sheet_title("", 1, used) == "Table 2"
+    # A later table named like an earlier suffixed one still gets its own title
+    assert _sheet_title("Table 2", 2, used) == "Table 2 3"
+
+
+def test_markdown_tables_take_numbers_and_escape_pipes():
+    markdown = render_markdown(FINDINGS)
+    assert "| Pro | 49 | a \\| b |" in markdown
+    assert "| Team | 12.5 |  |" in markdown
+    assert "| =SUM(B2:B3) | -3 | -5% per seat |" in markdown
+
+
+def test_docx_tables_take_numbers(tmp_path):
+    docx = pytest.importorskip("docx")
+    path = str(tmp_path / "report.docx")
+    assert render_docx(FINDINGS, path)
+    rows = [[cell.text for cell in row.cells] for row in docx.Document(path).tables[0].rows]
+    assert rows == [["plan", "price", "notes"], ["Pro", "49", "a | b"], ["Team", "12.5", ""],
+                    ["=SUM(B2:B3)", "-3", "-5%\nper seat"]]
+
+
+def test_formula_like_text_is_stored_as_quoted_text(tmp_path):
+    openpyxl = pytest.importorskip("openpyxl")
+    path = str(tmp_path / "report.xlsx")
+    _write_tables(FINDINGS["tables"], path)
+    sheet = openpyxl.load_workbook(path)["Plans"]
+    formula, number, text = sheet["A4"], sheet["B4"], sheet["C4"]
+    assert (formula.value, formula.data_type, formula.quotePrefix) == ("=SUM(B2:B3)", "s", True)
+    assert (number.value, number.quotePrefix) == (-3, False)
+    assert (text.value, text.quotePrefix) == ("-5%\nper seat", True)
+    assert sheet["B2"].value == 49 and not sheet["A2"].quotePrefix
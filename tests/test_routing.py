@@ -0,0 +1,181 @@
+"""Router decisions checked against a scripted fake Anthropic client."""
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from routing import Router, Tier
+from scheduler import RateLimitScheduler
+
+FAST = Tier("fast", "claude-3-5-haiku-20241022", 1024)
+STRONG = Tier("strong", "claude-3-5-sonnet-20241022", 4096)
+
+
+def text(value):
+    return SimpleNamespace(type="text", text=value)
+
+
+def tool(name, **tool_input):
+    return SimpleNamespace(type="tool_use", name=name, input=tool_input)
+
+
+class ScriptedMessages:
+    """Answers each call with the next (content, stop_reason, tool results) step"""
+
+    def __init__(self, script):
+        self.script = list(script)
+        self.calls = []
+
+    def create(self, **kwargs):
+        self.calls.append(kwargs)
+        content, stop_reason, results = self.script[len(self.calls) - 1]
+        usage = SimpleNamespace(input_tokens=2000, output_tokens=100)
+        return SimpleNamespace(content=content, stop_reason=stop_reason, usage=usage, results=results)
+
+
+def run(script, router=None):
+    """Play `script` through a router the way agent.sampling_loop does; the router and its client"""
+    router = router or Router(FAST, STRONG)
+    client = SimpleNamespace(beta=SimpleNamespace(messages=ScriptedMessages(script)))
+    scheduler = RateLimitScheduler(requests_per_minute=1e9, input_tokens_per_minute=1e12)
+
+    async def loop():
+        turn = 0
+        while True:
+            turn += 1
+            response = await router.create_message(scheduler, client, turn=turn, messages=[])
+            uses = [block for block in response.content if block.type == "tool_use"]
+            if not uses:
+                return
+            for use, result in zip(uses, response.results):
+                if result is not None:
+                    result = SimpleNamespace(output=result, error=None)
+                router.observe_tool(use.name, use.input, result)
+
+    asyncio.run(loop())
+    return router, client.beta.messages
+
+
+def tiers(router):
+    return [(d.turn, d.tier) for d in router.decisions]
+
+
+def test_mechanical_turns_go_fast_and_observations_strong():
+    router, messages = run([
+        ([tool("computer", action="left_click")], "tool_use", ["ok"]),
+        ([tool("computer", action="type", text="acme.com")], "tool_use", ["ok"]),
+        ([tool("computer", action="screenshot")], "tool_use", ["ok"]),
+        ([tool("str_replace_editor", command="create", path="notes.md")], "tool_use", ["ok"]),
+        ([text("Done.")], "end_turn", []),
+    ])
+    assert tiers(router) == [(1, "strong"), (2, "fast"), (3, "fast"), (4, "strong"), (5, "fast")]
+    assert router.decisions[0].reason == "planning"
+    assert router.decisions[3].reason == "observation to read"
+    # The fake client saw the tier's model and max_tokens
+    assert [(c["model"], c["max_tokens"]) for c in messages.calls][:2] == [
+        (STRONG.model, STRONG.max_tokens), (FAST.model, FAST.max_tokens),
+    ]
+
+
+def test_long_bash_output_and_file_reads_are_observations():
+    router, _ = run([
+        ([tool("bash", command="mkdir -p out")], "tool_use", [""]),
+        ([tool("bash", command="cat big.log")], "tool_use", ["x" * 1000]),
+        ([tool("file_ops", operations=[{"op": "read", "path": "a.txt"}])], "tool_use", ["ok"]),
+        ([text("Done.")], "end_turn", []),
+    ])
+    assert tiers(router) == [(1, "strong"), (2, "fast"), (3, "strong"), (4, "strong")]
+
+
+def test_tool_failure_escalates_the_next_turns():
+    router, _ = run([
+        ([tool("computer", action="left_click")], "tool_use", [None]),
+        ([tool("computer", action="left_click")], "tool_use", ["ok"]),
+        ([tool("computer", action="left_click")], "tool_use", ["ok"]),
+        ([text("Done.")], "end_turn", []),
+    ])
+    assert tiers(router) == [(1, "strong"), (2, "strong"), (3, "strong"), (4, "fast")]
+    assert router.decisions[1].reason == "escalated: computer:left_click failed"
+
+
+def test_hedging_escalates():
+    router, _ = run([
+        ([tool("computer", action="left_click")], "tool_use", ["ok"]),
+        ([text("That didn't work, let me try again."), tool("computer", action="key", text="Return")], "tool_use", ["ok"]),
+        ([text("Done.")], "end_turn", []),
+    ])
+    assert tiers(router) == [(1, "strong"), (2, "fast"), (3, "strong")]
+    assert router.decisions[2].reason == "escalated: low confidence"
+
+
+@pytest.mark.parametrize("narration", [
+    "The error rate dropped to 2% last quarter.",
+    "Many failed startups pivot to B2B.",
+    "Their docs list every error code.",
+])
+def test_failure_words_in_narration_dont_escalate(narration):
+    router, _ = run([
+        ([tool("computer", action="left_click")], "tool_use", ["ok"]),
+        ([text(narration), tool("computer", action="key", text="Return")], "tool_use", ["ok"]),
+        ([tool("computer", action="left_click")], "tool_use", ["ok"]),
+        ([text("Done.")], "end_turn", []),
+    ])
+    assert tiers(router)[2] == (3, "fast")
+
+
+@pytest.mark.parametrize("hedge", ["That failed, retrying.", "The page failed to load.", "I got an error."])
+def test_failure_words_about_the_agents_own_steps_escalate(hedge):
+    router, _ = run([
+        ([tool("computer", action="left_click")], "tool_use", ["ok"]),
+        ([text(hedge), tool("computer", action="key", text="Return")], "tool_use", ["ok"]),
+        ([text("Done.")], "end_turn", []),
+    ])
+    assert router.decisions[2].reason == "escalated: low confidence"
+
+
+def test_fast_turn_hitting_max_tokens_is_reasked_on_strong():
+    router, messages = run([
+        ([tool("computer", action="left_click")], "tool_use", ["ok"]),
+        ([text("The page shows ...")], "max_tokens", []),
+        ([text("Done.")], "end_turn", []),
+    ])
+    assert tiers(router) == [(1, "strong"), (2, "fast"), (2, "strong")]
+    assert router.decisions[2].retried
+    assert [c["max_tokens"] for c in messages.calls] == [4096, 1024, 4096]
+    assert router.summary()["escalated_retries"] == 1
+
+
+def test_fast_streak_forces_a_replan():
+    click = ([tool("computer", action="left_click")], "tool_use", ["ok"])
+    router, _ = run([click] * 5 + [([text("Done.")], "end_turn", [])], Router(FAST, STRONG, max_fast_streak=3))
+    assert [tier for _, tier in tiers(router)] == ["strong", "fast", "fast", "fast", "strong", "fast"]
+    assert router.decisions[4].reason == "re-plan after fast streak"
+
+
+def test_routing_off_keeps_every_turn_strong():
+    router, _ = run([
+        ([tool("computer", action="left_click")], "tool_use", ["ok"]),
+        ([text("Done.")], "end_turn", []),
+    ], Router(FAST, STRONG, enabled=False))
+    assert tiers(router) == [(1, "strong"), (2, "strong")]
+
+
+def test_summary_reports_savings_for_fast_turns():
+    router, _ = run([
+        ([tool("computer", action="left_click")], "tool_use", ["ok"]),
+        ([tool("computer", action="left_click")], "tool_use", ["ok"]),
+        ([text("Done.")], "end_turn", []),
+    ])
+    summary = router.summary()
+    assert (summary["turns"], summary["fast_turns"], summary["strong_turns"]) == (3, 2, 1)
+    assert summary["saved_cost_usd"] > 0
+
+
+def test_tiers_from_env(monkeypatch):
+    monkeypatch.setenv("SCRAPYBARA_FAST_MODEL", FAST.model)
+    monkeypatch.setenv("SCRAPYBARA_FAST_MAX_TOKENS", "512")
+    monkeypatch.setenv("SCRAPYBARA_ROUTING", "0")
+    router = Router.from_env(STRONG.model)
+    assert router.fast == Tier("fast", FAST.model, 512)
+    assert router.strong == Tier("strong", STRONG.model, 4096)
+    assert not router.enabled
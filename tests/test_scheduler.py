@@ -0,0 +1,183 @@
+"""RateLimitScheduler against a fake clock and fake clients (no network, no real waiting)."""
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from scheduler import MID_RUN, NEW_SESSION, RateLimitScheduler, TokenBucket, estimate_input_tokens
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    async def sleep(self, seconds: float):
+        self.sleeps.append(seconds)
+        self.now += seconds
+        await asyncio.sleep(0)
+
+
+class Throttled(Exception):
+    def __init__(self, status_code: int = 429, retry_after: str = None):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+        self.response = SimpleNamespace(headers={"retry-after": retry_after} if retry_after else {})
+
+
+class FakeMessages:
+    """Records each call's label; raises the queued errors first"""
+
+    def __init__(self, errors=()):
+        self.errors = list(errors)
+        self.calls = []
+
+    def create(self, **kwargs):
+        if self.errors:
+            raise self.errors.pop(0)
+        self.calls.append(kwargs.get("label"))
+        return SimpleNamespace(usage=SimpleNamespace(input_tokens=10))
+
+
+def fake_client(errors=()):
+    return SimpleNamespace(beta=SimpleNamespace(messages=FakeMessages(errors)))
+
+
+def make_scheduler(clock, **kwargs):
+    kwargs.setdefault("requests_per_minute", 1000)
+    kwargs.setdefault("input_tokens_per_minute", 1_000_000)
+    return RateLimitScheduler(clock=clock, sleep=clock.sleep, rng=lambda: 0.0, **kwargs)
+
+
+def test_token_bucket_refills_continuously():
+    clock = FakeClock()
+    bucket = TokenBucket(60, clock=clock)
+    bucket.take(60)
+    assert bucket.wait_time(1) == pytest.approx(1.0)
+    clock.now += 0.5
+    assert bucket.wait_time(1) == pytest.approx(0.5)
+    clock.now += 0.5
+    assert bucket.wait_time(1) == 0.0
+    # More than the bucket holds waits for a full bucket, not forever
+    assert bucket.wait_time(1000) == pytest.approx(59.0)
+
+
+def test_estimate_counts_text_and_images():
+    image = {"type": "image", "source": {"data": "y" * 100_000}}
+    assert estimate_input_tokens("x" * 400, [image, image]) == 100 + 2 * 1600
+
+
+def test_requests_per_minute_spaces_out_calls():
+    clock = FakeClock()
+    scheduler = make_scheduler(clock, requests_per_minute=2)
+    client = fake_client()
+
+    async def run():
+        for i in range(4):
+            await scheduler.create_message(client, label=i, messages=[])
+
+    asyncio.run(run())
+    assert client.beta.messages.calls == [0, 1, 2, 3]
+    # Two calls fit in the bucket, the other two wait 30s each at 2/min
+    assert clock.now == pytest.approx(60.0)
+
+
+def test_mid_run_sessions_are_admitted_first():
+    clock = FakeClock()
+    scheduler = make_scheduler(clock, requests_per_minute=1)
+    client = fake_client()
+
+    async def run():
+        await scheduler.create_message(client, label="first", messages=[])
+        await asyncio.gather(
+            scheduler.create_message(client, label="new-1", messages=[]),
+            scheduler.create_message(client, label="new-2", messages=[]),
+            scheduler.create_message(client, mid_run=True, label="mid", messages=[]),
+        )
+
+    asyncio.run(run())
+    assert MID_RUN < NEW_SESSION
+    assert client.beta.messages.calls == ["first", "mid", "new-1", "new-2"]
+
+
+def test_throttled_calls_back_off_exponentially():
+    clock = FakeClock()
+    scheduler = make_scheduler(clock, base_delay=1.0)
+    client = fake_client([Throttled(429), Throttled(529)])
+
+    asyncio.run(scheduler.create_message(client, label="ok", messages=[]))
+    assert client.beta.messages.calls == ["ok"]
+    assert scheduler.retries == 2
+    # Jitter picks between half and all of 1s, then 2s; rng=0 takes the low end
+    assert clock.sleeps == [0.5, 1.0]
+
+
+def test_retry_after_sets_a_shared_cooldown():
+    clock = FakeClock()
+    scheduler = make_scheduler(clock)
+    client = fake_client([Throttled(429, retry_after="7")])
+
+    asyncio.run(scheduler.create_message(client, label="ok", messages=[]))
+    assert scheduler.cooldown_until == pytest.approx(7.0)
+    assert clock.now >= 7.0
+
+
+def test_other_errors_and_exhausted_retries_raise():
+    clock = FakeClock()
+    scheduler = make_scheduler(clock, max_retries=2)
+
+    with pytest.raises(ValueError):
+        asyncio.run(scheduler.create_message(fake_client([ValueError("bad request")]), messages=[]))
+    with pytest.raises(Throttled):
+        asyncio.run(scheduler.create_message(fake_client([Throttled()] * 3), messages=[]))
+    assert scheduler.retries == 2
+
+
+class FakeScrapybara:
+    def __init__(self):
+        self.started = []
+
+    def start(self, **kwargs):
+        instance = SimpleNamespace(id=f"i-{len(self.started)}", stopped=False)
+        instance.stop = lambda: setattr(instance, "stopped", True)
+        self.started.append(instance)
+        return instance
+
+
+def test_instance_slots_cap_concurrency():
+    clock = FakeClock()
+    scheduler = make_scheduler(clock, max_instances=1)
+    client = FakeScrapybara()
+
+    async def run():
+        first = await scheduler.start_instance(client, instance_type="small")
+        assert scheduler.at_capacity()
+        second = asyncio.ensure_future(scheduler.start_instance(client, instance_type="small"))
+        await asyncio.sleep(0.01)
+        assert not second.done()
+        await scheduler.stop_instance(first)
+        await scheduler.stop_instance(await second)
+        # Stopping twice gives the slot back only once
+        await scheduler.stop_instance(first)
+
+    asyncio.run(run())
+    assert [i.stopped for i in client.started] == [True, True]
+    assert not scheduler.at_capacity()
+    assert scheduler._slots_used == 0
+
+
+def test_warm_instances_are_handed_out_first():
+    clock = FakeClock()
+    scheduler = make_scheduler(clock)
+    client = FakeScrapybara()
+    warm = SimpleNamespace(id="warm", stop=lambda: None)
+    scheduler.add_warm_instance("medium", warm)
+
+    async def run():
+        return await scheduler.start_instance(client, instance_type="medium")
+
+    assert asyncio.run(run()) is warm
+    assert client.started == []
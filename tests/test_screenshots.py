@@ -0,0 +1,67 @@
+"""ScreenshotBuffer: decoded and encoded at most once, and archived by content."""
+import base64
+import os
+
+import pytest
+
+from screenshots import ScreenshotArchive, ScreenshotBuffer
+
+RAW = bytes(range(256)) * 8
+B64 = base64.b64encode(RAW).decode("ascii")
+
+
+def test_needs_some_data():
+    with pytest.raises(ValueError):
+        ScreenshotBuffer()
+
+
+def test_base64_payload_is_kept_as_is():
+    buffer = ScreenshotBuffer.from_base64(B64)
+    assert buffer.base64() is B64
+    assert buffer.nbytes == len(B64)
+
+
+def test_raw_is_decoded_once():
+    buffer = ScreenshotBuffer.from_base64(B64)
+    first = buffer.raw
+    assert bytes(first) == RAW
+    assert buffer.raw.obj is first.obj
+    assert buffer.nbytes == len(B64) + len(RAW)
+    buffer.drop_raw()
+    assert buffer.nbytes == len(B64)
+
+
+def test_bytes_are_encoded_once_and_kept():
+    buffer = ScreenshotBuffer.from_bytes(RAW)
+    assert buffer.base64() == B64
+    assert buffer.base64() is buffer.base64()
+    # The base64 can stand in for the raw bytes only once it exists
+    buffer.drop_raw()
+    assert bytes(buffer.raw) == RAW
+
+
+def test_same_content_compares_equal_across_forms():
+    from_b64 = ScreenshotBuffer.from_base64(B64)
+    from_raw = ScreenshotBuffer.from_bytes(RAW)
+    assert from_b64.same_as(from_raw)
+    assert not from_b64.same_as(ScreenshotBuffer.from_bytes(RAW[::-1]))
+    assert from_b64.key == ScreenshotBuffer.from_base64(B64).key
+
+
+def test_archive_stores_identical_shots_once(tmp_path):
+    archive = ScreenshotArchive(str(tmp_path))
+    first = archive.save(ScreenshotBuffer.from_base64(B64))
+    second = archive.save(ScreenshotBuffer.from_bytes(RAW))
+    assert first == second and first.endswith(".png")
+    assert os.listdir(tmp_path) == [os.path.basename(first)]
+    with open(first, "rb") as f:
+        assert f.read() == RAW
+
+
+def test_archive_drops_decoded_bytes_unless_asked(tmp_path):
+    archive = ScreenshotArchive(str(tmp_path))
+    buffer = ScreenshotBuffer.from_base64(B64)
+    archive.save(buffer)
+    assert buffer.nbytes == len(B64)
+    archive.save(buffer, keep_raw=True)
+    assert buffer.nbytes == len(B64) + len(RAW)
@@ -0,0 +1,54 @@
+"""choose_instance_type: moving off medium by default, and the `measured` mode that doesn't."""
+import json
+
+import pytest
+
+import sizing
+
+
+def profile(job, size, cpu, mem, ok=True, duration=300):
+    return {"job": job, "instance_type": size, "ok": ok, "duration": duration, "samples": 10,
+            "cpu_p95": cpu, "mem_p95": mem, "capture_ms_p50": 80}
+
+
+@pytest.fixture
+def profiles(tmp_path, monkeypatch):
+    path = tmp_path / "instance_profiles.jsonl"
+    monkeypatch.setattr(sizing, "PROFILE_PATH", str(path))
+    monkeypatch.setattr(sizing, "FORCED", None)
+    monkeypatch.setattr(sizing, "_cache", {"mtime": None, "summary": {}})
+
+    def write(*runs):
+        path.write_text("".join(json.dumps(run) + "\n" for run in runs))
+
+    return write
+
+
+def test_no_profiles_keeps_the_default(profiles, monkeypatch):
+    monkeypatch.setattr(sizing, "MODE", "auto")
+    assert sizing.choose_instance_type("github") == "medium"
+
+
+def test_auto_moves_idle_jobs_down_and_saturated_jobs_up(profiles, monkeypatch):
+    monkeypatch.setattr(sizing, "MODE", "auto")
+    profiles(*[profile("github", "medium", 0.2, 0.3)] * 3, *[profile("code", "medium", 0.95, 0.6)] * 3)
+    assert sizing.choose_instance_type("github") == "small"
+    assert sizing.choose_instance_type("code") == "large"
+
+
+def test_auto_settles_on_the_cheapest_size_that_fits(profiles, monkeypatch):
+    monkeypatch.setattr(sizing, "MODE", "auto")
+    profiles(*[profile("github", "medium", 0.2, 0.3)] * 3, *[profile("github", "small", 0.6, 0.7, duration=320)] * 3)
+    assert sizing.choose_instance_type("github") == "small"
+    # Small failing too often sends the job back to medium
+    profiles(*[profile("github", "medium", 0.2, 0.3)] * 3, *[profile("github", "small", 0.6, 0.7, ok=False)] * 3)
+    assert sizing.choose_instance_type("github") == "medium"
+
+
+def test_measured_and_recommend_modes_stay_on_measured_sizes(profiles, monkeypatch):
+    profiles(*[profile("github", "medium", 0.2, 0.3)] * 3, *[profile("code", "medium", 0.95, 0.6)] * 3)
+    monkeypatch.setattr(sizing, "MODE", "measured")
+    assert sizing.choose_instance_type("github") == "medium"
+    assert sizing.choose_instance_type("code") == "medium"
+    monkeypatch.setattr(sizing, "MODE", "recommend")
+    assert sizing.choose_instance_type("github") == "medium"
@@ -0,0 +1,254 @@
+"""Block until something happens on the VM instead of polling with screenshots.
+
+The prompts tell the agent to wait for pages to load and for GUI apps to
+appear, and it does so by taking screenshot after screenshot, each one a full
+model round trip. `WaitForTool` ("wait_for") waits in one tool call, until a
+condition holds or a timeout passes, and returns a single screenshot at the
+end:
+
+- window: a visible window whose title matches (xdotool regex)
+- file:   a file matching a glob exists (relative paths are under ~)
+- stable: the screen hasn't changed for `stable_ms`
+- url:    a tab of the agent's Chromium whose URL contains the value has
+          finished loading (document.readyState == "complete")
+
+All four run as one small script inside the VM. url asks the Chromium the
+agent drives, the one `macros.chromium()` and the prompts start with
+`--remote-debugging-port`, over its local DevTools port; the browser behind
+`instance.browser.start()` is a different one and never shows the agent's
+tabs. When the condition isn't met the result is an error that still carries
+the final screenshot.
+"""
+import asyncio
+import json
+import time
+from typing import Any, Dict
+
+from scrapybara.anthropic import ComputerTool, ToolResult
+
+from macros import CHROMIUM_DEBUG_PORT
+from progress_log import log_event
+
+CONDITIONS = ("window", "url", "file", "stable")
+DEFAULT_TIMEOUT = 15
+MAX_TIMEOUT = 60
+
+# VM-side helpers for the DevTools port of the agent's Chromium; also used by prefetch
+DEVTOOLS_CLIENT = r'''
+import base64, json, os, socket, ssl, urllib.parse, urllib.request
+
+def devtools_pages(port):
+    """The open tabs; raises OSError if Chromium isn't listening on `port`"""
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}/json/list", timeout=2) as response:
+        return [p for p in json.load(response) if p.get("type") == "page" and p.get("webSocketDebuggerUrl")]
+
+def devtools(ws_url, method, params=None):
+    """One DevTools call over a bare-bones websocket; the result, or None if the tab refused"""
+    parts = urllib.parse.urlsplit(ws_url)
+    secure = parts.scheme == "wss"
+    sock = socket.create_connection((parts.hostname, parts.port or (443 if secure else 80)), timeout=3)
+    if secure:
+        sock = ssl.create_default_context().wrap_socket(sock, server_hostname=parts.hostname)
+    path = parts.path + (f"?{parts.query}" if parts.query else "")
+    buffer = b""
+
+    def read(n):
+        nonlocal buffer
+        while len(buffer) < n:
+            chunk = sock.recv(65536)
+            if not chunk:
+                raise ConnectionError("DevTools connection closed")
+            buffer += chunk
+        data, buffer = buffer[:n], buffer[n:]
+        return data
+
+    try:
+        key = base64.b64encode(os.urandom(16)).decode()
+        sock.sendall((f"GET {path} HTTP/1.1\r\nHost: {parts.netloc}\r\nUpgrade: websocket\r\n"
+                      f"Connection: Upgrade\r\nSec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n").encode())
+        while b"\r\n\r\n" not in buffer:
+            chunk = sock.recv(4096)
+            if not chunk:
+                return None
+            buffer += chunk
+        head, buffer = buffer.split(b"\r\n\r\n", 1)
+        if b" 101 " not in head.split(b"\r\n", 1)[0]:
+            return None
+        payload = json.dumps({"id": 1, "method": method, "params": params or {}}).encode()
+        if len(payload) < 126:
+            length = bytes([0x80 | len(payload)])
+        elif len(payload) < 65536:
+            length = bytes([0x80 | 126]) + len(payload).to_bytes(2, "big")
+        else:
+            length = bytes([0x80 | 127]) + len(payload).to_bytes(8, "big")
+        mask = os.urandom(4)
+        sock.sendall(b"\x81" + length + mask + bytes(b ^ mask[i % 4] for i, b in enumerate(payload)))
+        message = b""
+        while True:
+            first, second = read(2)
+            size = second & 0x7F
+            if size == 126:
+                size = int.from_bytes(read(2), "big")
+            elif size == 127:
+                size = int.from_bytes(read(8), "big")
+            data = read(size)
+            if first & 0x0F in (0, 1):
+                message += data
+                if first & 0x80:
+                    reply, message = json.loads(message), b""
+                    # Events arrive in between; only the reply to our call counts
+                    if reply.get("id") == 1:
+                        return reply.get("result")
+            elif first & 0x0F == 8:
+                return None
+    finally:
+        sock.close()
+'''
+
+# Runs in the VM after `CONDITION = ...`, `VALUE = ...`, `TIMEOUT = ...`, `STABLE_MS = ...`, `DEBUG_PORT = ...` lines
+VM_SCRIPT = DEVTOOLS_CLIENT + r'''
+import glob, hashlib, shutil, subprocess, time
+env = dict(os.environ, DISPLAY=":1")
+pending = None
+CAPTURES = (["xwd", "-root", "-silent"], ["import", "-window", "root", "rgb:-"], ["scrot", "-o", "/dev/stdout"])
+
+def screen_hash():
+    for command in CAPTURES:
+        try:
+            data = subprocess.run(command, env=env, capture_output=True, timeout=5).stdout
+        except (OSError, subprocess.TimeoutExpired):
+            continue
+        if data:
+            return hashlib.sha1(data).hexdigest()
+    return None
+
+def check():
+    global pending
+    if CONDITION == "url":
+        try:
+            pages = devtools_pages(DEBUG_PORT)
+        except OSError:
+            # Chromium may still be starting; keep polling
+            pending = (f"Chromium isn't listening for DevTools on port {DEBUG_PORT} "
+                       f"(start it with --remote-debugging-port={DEBUG_PORT})")
+            return None
+        pending = f"no open tab's URL contains {VALUE!r}"
+        for page in pages:
+            if VALUE.lower() not in page.get("url", "").lower():
+                continue
+            pending = f"{page['url']} still loading"
+            try:
+                state = devtools(page["webSocketDebuggerUrl"], "Runtime.evaluate",
+                                 {"expression": "document.readyState", "returnByValue": True})
+            except OSError:
+                continue
+            if (state or {}).get("result", {}).get("value") == "complete":
+                return f"{page['url']} loaded ({page.get('title') or 'untitled'})"
+        return None
+    if CONDITION == "window":
+        if not shutil.which("xdotool"):
+            return "error: xdotool is not installed in the VM"
+        found = subprocess.run(["xdotool", "search", "--onlyvisible", "--name", VALUE], env=env,
+                               capture_output=True, text=True).stdout.split()
+        if not found:
+            return None
+        title = subprocess.run(["xdotool", "getwindowname", found[0]], env=env, capture_output=True, text=True).stdout
+        return f"window {title.strip()!r}"
+    if CONDITION == "file":
+        matches = glob.glob(os.path.join(os.path.expanduser("~"), os.path.expanduser(VALUE)))
+        return f"file {matches[0]}" if matches else None
+
+started = time.monotonic()
+detail, last, since = None, None, started
+while time.monotonic() - started < TIMEOUT:
+    if CONDITION == "stable":
+        current = screen_hash()
+        if current is None:
+            detail = "error: no screen capture tool (xwd, import, scrot) in the VM"
+            break
+        now = time.monotonic()
+        if current != last:
+            last, since = current, now
+        elif (now - since) * 1000 >= STABLE_MS:
+            detail = f"screen unchanged for {STABLE_MS} ms"
+            break
+        time.sleep(0.1)
+        continue
+    detail = check()
+    if detail:
+        break
+    time.sleep(0.25)
+print(json.dumps({"met": bool(detail) and not detail.startswith("error"), "detail": detail or pending,
+                  "elapsed": round(time.monotonic() - started, 2)}))
+'''
+
+
+def _output(response) -> str:
+    if isinstance(response, dict):
+        return response.get("output") or ""
+    return getattr(response, "output", None) or str(response or "")
+
+
+class WaitForTool:
+    """Tool for waiting on a window, page load, file or a stable screen in one call."""
+
+    def __init__(self, instance):
+        self.instance = instance
+        self.computer = ComputerTool(instance)
+
+    def to_params(self) -> Dict[str, Any]:
+        return {
+            "name": "wait_for",
+            "description": f"""Wait until a condition holds, then return one screenshot. Use this instead of taking
+            repeated screenshots while a page loads or an app starts.
+            - window: a visible window title matches `value` (regex), e.g. "LibreOffice Calc"
+            - url: a Chromium tab whose URL contains `value` has finished loading (Chromium must have been
+              started with --remote-debugging-port={CHROMIUM_DEBUG_PORT}, as the setup and the prompt do)
+            - file: a file matching the glob `value` exists (relative to the home directory)
+            - stable: the screen hasn't changed for `stable_ms` milliseconds (value is ignored)
+            Gives up after `timeout` seconds (default {DEFAULT_TIMEOUT}, max {MAX_TIMEOUT}).""",
+            "input_schema": {
+                "type": "object",
+                "properties": {
+                    "condition": {"type": "string", "enum": list(CONDITIONS)},
+                    "value": {"type": "string"},
+                    "timeout": {"type": "number", "default": DEFAULT_TIMEOUT},
+                    "stable_ms": {"type": "integer", "default": 1000},
+                },
+                "required": ["condition"],
+            },
+        }
+
+    async def _wait_in_vm(self, condition: str, value: str, timeout: float, stable_ms: int) -> Dict[str, Any]:
+        header = (f"CONDITION = {condition!r}\nVALUE = {value!r}\nTIMEOUT = {timeout!r}\nSTABLE_MS = {stable_ms!r}\n"
+                  f"DEBUG_PORT = {CHROMIUM_DEBUG_PORT!r}\n")
+        # The script enforces the timeout itself; `timeout` is a backstop if it hangs
+        command = f"timeout {int(timeout) + 10} python3 - <<'WAIT_FOR_EOF'\n{header}{VM_SCRIPT}\nWAIT_FOR_EOF"
+        response = await asyncio.to_thread(self.instance.bash, command=command)
+        lines = _output(response).strip().splitlines()
+        try:
+            return json.loads(lines[-1])
+        except (IndexError, ValueError):
+            return {"met": False, "detail": f"error: {' '.join(lines)[-200:] or 'no output'}", "elapsed": timeout}
+
+    async def __call__(self, condition: str, value: str = "", timeout: float = DEFAULT_TIMEOUT,
+                       stable_ms: int = 1000) -> ToolResult:
+        if condition not in CONDITIONS:
+            return ToolResult(error=f"condition must be one of {', '.join(CONDITIONS)}")
+        if condition != "stable" and not value:
+            return ToolResult(error=f"{condition} needs a value")
+        timeout = max(1.0, min(float(timeout or DEFAULT_TIMEOUT), MAX_TIMEOUT))
+        started = time.monotonic()
+        try:
+            result = await self._wait_in_vm(condition, value, timeout, int(stable_ms))
+        except Exception as e:
+            result = {"met": False, "detail": f"error: {e}", "elapsed": round(time.monotonic() - started, 2)}
+
+        log_event("wait_for", condition=condition, met=result["met"], duration=round(time.monotonic() - started, 3))
+        screenshot = await self.computer(action="screenshot")
+        image = getattr(screenshot, "base64_image", None)
+        if result["met"]:
+            return ToolResult(output=f"{result['detail']} after {result['elapsed']}s", base64_image=image)
+        detail = result["detail"] or "timed out"
+        target = f" {value!r}" if value and condition != "stable" else ""
+        return ToolResult(error=f"{condition}{target} not met after {result['elapsed']}s: {detail}", base64_image=image)